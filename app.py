@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""
+Application Streamlit du tableau de bord agricole intégré.
+
+Lancement :
+    streamlit run app.py -- --data-dir data
+"""
+
+import argparse
+
+from dashbord import load_data_manager
+from map_visualization import IntegratedDashboard
+
+
+def load_dashboard(data_dir):
+    """
+    Charge les données et crée le tableau de bord une seule fois par session serveur :
+    les exécutions suivantes de Streamlit réutilisent l'instance et son cache.
+    """
+    import streamlit as st
+
+    @st.cache_resource
+    def _load(data_dir):
+        return IntegratedDashboard(load_data_manager(data_dir))
+
+    return _load(data_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tableau de bord agricole intégré (Streamlit)")
+    parser.add_argument('--data-dir', default='data', help="Dossier contenant les fichiers CSV")
+    args, _ = parser.parse_known_args()
+    load_dashboard(args.data_dir).create_streamlit_dashboard()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,827 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks des traitements du gestionnaire de données agricoles.
+
+Utilisation :
+    python benchmarks.py trends --parcelles 2000 --annees 20
+    python benchmarks.py sharded --parcelles 5000 --jours 365 --processus 8
+    python benchmarks.py map --parcelles 1000 10000 100000
+    python benchmarks.py spatial --parcelles 100000
+    python benchmarks.py imports --max-ms 150
+    python benchmarks.py scaling --parcelles 100 1000 10000 100000 --sauver reference.json
+    python benchmarks.py scaling --parcelles 100 1000 10000 100000 --reference reference.json
+    python benchmarks.py instrumentation --parcelles 2000
+    python benchmarks.py query --parcelles 20000
+    python benchmarks.py ndvi --parcelles 5000 --jours 730
+    python benchmarks.py model --parcelles 20000
+    python benchmarks.py interactions --parcelles 50 --jours 365 1460 5840
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import current_rss_mb
+
+
+def _synthetic_yield_history(n_parcelles, n_annees, seed=0):
+    """
+    Génère un historique de rendements aléatoire (une ligne par parcelle et par année).
+    """
+    rng = np.random.default_rng(seed)
+    parcelles = np.repeat([f"P{i:06d}" for i in range(n_parcelles)], n_annees)
+    annees = np.tile(np.arange(2000, 2000 + n_annees), n_parcelles)
+    pentes = np.repeat(rng.normal(0.05, 0.1, n_parcelles), n_annees)
+    rendements = 6 + pentes * (annees - 2000) + rng.normal(0, 0.5, len(annees))
+    return pd.DataFrame({
+        'parcelle_id': parcelles,
+        'annee': pd.to_datetime(annees.astype(str), format='%Y'),
+        'rendement': rendements.astype(np.float32),
+    })
+
+
+def _synthetic_manager(n_parcelles, n_jours, n_annees, seed=0):
+    """
+    Construit un gestionnaire de données rempli de données aléatoires (suivi quotidien, météo par zone).
+    """
+    from data_manager import AgriculturalDataManager, _compact_dtypes
+
+    rng = np.random.default_rng(seed)
+    parcelles = np.array([f"P{i:06d}" for i in range(n_parcelles)])
+    zones = np.array([f"Z{i % 20:02d}" for i in range(n_parcelles)])
+    dates = pd.date_range('2023-01-01', periods=n_jours, freq='D')
+    n = n_parcelles * n_jours
+
+    manager = AgriculturalDataManager()
+    manager.monitoring_data = _compact_dtypes(pd.DataFrame({
+        'date': np.repeat(dates, n_parcelles),
+        'parcelle_id': np.tile(parcelles, n_jours),
+        'zone': np.tile(zones, n_jours),
+        'ndvi': rng.uniform(0.1, 0.9, n),
+    }))
+    manager.weather_data = _compact_dtypes(pd.DataFrame({
+        'date': np.repeat(dates, 20),
+        'zone': np.tile([f"Z{i:02d}" for i in range(20)], n_jours),
+        'precipitation': rng.gamma(1.0, 3.0, n_jours * 20),
+    }))
+    manager.soil_data = _compact_dtypes(pd.DataFrame({
+        'parcelle_id': parcelles,
+        'ph': rng.uniform(5.5, 8.0, n_parcelles),
+    }))
+    manager.yield_history = _compact_dtypes(_synthetic_yield_history(n_parcelles, n_annees, seed))
+    return manager
+
+
+def _per_parcel_trends(yield_history):
+    """
+    Implémentation de référence : un masque et un LinearRegression par parcelle.
+    """
+    from sklearn.linear_model import LinearRegression
+
+    results = {}
+    for parcelle_id in yield_history['parcelle_id'].unique():
+        parcelle_data = yield_history[yield_history['parcelle_id'] == parcelle_id]
+        X = parcelle_data['annee'].dt.year.values.reshape(-1, 1)
+        y = parcelle_data['rendement'].values
+        model = LinearRegression().fit(X, y)
+        results[parcelle_id] = (model.coef_[0], model.score(X, y))
+    return results
+
+
+def bench_trends(n_parcelles, n_annees):
+    """
+    Compare le calcul groupé des tendances avec la boucle LinearRegression par parcelle.
+    """
+    from data_manager import AgriculturalDataManager
+
+    manager = AgriculturalDataManager()
+    manager.yield_history = _synthetic_yield_history(n_parcelles, n_annees)
+
+    start = time.perf_counter()
+    trends = manager.get_yield_trends()
+    batch_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    reference = _per_parcel_trends(manager.yield_history)
+    loop_time = time.perf_counter() - start
+
+    slopes = np.array([reference[p][0] for p in trends.index])
+    scores = np.array([reference[p][1] for p in trends.index])
+    print(f"Parcelles : {n_parcelles}, années : {n_annees}, lignes : {len(manager.yield_history)}")
+    print(f"Boucle par parcelle : {loop_time:.3f} s")
+    print(f"Calcul groupé       : {batch_time:.3f} s  (x{loop_time / batch_time:.0f})")
+    print(f"Écart max pente : {np.abs(slopes - trends['pente'].values).max():.2e}, "
+          f"R² : {np.abs(scores - trends['r2'].values).max():.2e}")
+
+
+def bench_sharded(n_parcelles, n_jours, n_processus):
+    """
+    Compare l'exécution séquentielle du pipeline avec l'exécution partitionnée par parcelle.
+    """
+    manager = _synthetic_manager(n_parcelles, n_jours, 10)
+
+    start = time.perf_counter()
+    features = manager.prepare_features()
+    manager.calculate_risk_metrics(features)
+    trends = manager.get_yield_trends()
+    single_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    sharded_features, _, sharded_trends = manager.run_sharded(n_workers=n_processus)
+    sharded_time = time.perf_counter() - start
+
+    pd.testing.assert_frame_equal(features, sharded_features, check_dtype=False, check_categorical=False,
+                                  check_exact=True)
+    pd.testing.assert_frame_equal(trends, sharded_trends, check_dtype=False, check_index_type=False, check_exact=True)
+    print(f"Parcelles : {n_parcelles}, jours : {n_jours}, lignes : {len(features)}")
+    print(f"Séquentiel              : {single_time:.3f} s")
+    print(f"Partitionné ({n_processus} processus) : {sharded_time:.3f} s  (résultats identiques)")
+
+
+def _legacy_yield_layer(yield_history, positions, colormap):
+    """
+    Implémentation de référence de la couche des rendements : un CircleMarker par ligne via iterrows.
+    """
+    import folium
+
+    folium_map = folium.Map(location=[positions['latitude'].mean(), positions['longitude'].mean()], zoom_start=10)
+    rows = yield_history.join(positions, on='parcelle_id')
+    for _, row in rows.iterrows():
+        color = colormap(row['rendement'])
+        folium.CircleMarker([row['latitude'], row['longitude']], radius=6, color=color,
+                            fill=True, fill_color=color, fill_opacity=0.7).add_to(folium_map)
+    return folium_map
+
+
+def bench_map(tailles, n_annees, legacy_max):
+    """
+    Mesure le temps de construction et la taille HTML de la couche des rendements (1 marqueur par parcelle)
+    et la compare à l'implémentation iterrows/CircleMarker jusqu'à legacy_max parcelles.
+    """
+    from map_visualization import AgriculturalMap
+
+    print(f"{'parcelles':>10} {'vectorisé (s)':>14} {'HTML (Mo)':>10} {'iterrows (s)':>13} {'HTML (Mo)':>10}")
+    for n_parcelles in tailles:
+        manager = _synthetic_manager(n_parcelles, 1, n_annees)
+        rng = np.random.default_rng(n_parcelles)
+        manager.soil_data['latitude'] = rng.uniform(43.0, 49.0, n_parcelles)
+        manager.soil_data['longitude'] = rng.uniform(-1.0, 6.0, n_parcelles)
+
+        start = time.perf_counter()
+        agri_map = AgriculturalMap(manager)
+        agri_map.create_base_map()
+        agri_map.add_yield_history_layer()
+        html = agri_map.map.get_root().render()
+        fast_time = time.perf_counter() - start
+
+        legacy = ''
+        if n_parcelles <= legacy_max:
+            start = time.perf_counter()
+            positions = manager.get_parcel_positions()
+            legacy_html = _legacy_yield_layer(manager.yield_history, positions, agri_map.yield_colormap) \
+                .get_root().render()
+            legacy = f"{time.perf_counter() - start:>13.2f} {len(legacy_html) / 2**20:>10.2f}"
+        print(f"{n_parcelles:>10} {fast_time:>14.2f} {len(html) / 2**20:>10.2f} {legacy}")
+
+
+def bench_spatial(n_parcelles, n_requetes):
+    """
+    Mesure les requêtes de l'index spatial (plus proche, rayon, rectangle) et les compare à un parcours complet.
+    """
+    from spatial_index import ParcelSpatialIndex
+
+    rng = np.random.default_rng(0)
+    ids = np.array([f"P{i:06d}" for i in range(n_parcelles)])
+    lat = rng.uniform(43.0, 49.0, n_parcelles)
+    lon = rng.uniform(-1.0, 6.0, n_parcelles)
+
+    start = time.perf_counter()
+    index = ParcelSpatialIndex(ids, lat, lon)
+    print(f"Parcelles : {n_parcelles}, construction : {time.perf_counter() - start:.3f} s")
+
+    points = np.column_stack([rng.uniform(43.0, 49.0, n_requetes), rng.uniform(-1.0, 6.0, n_requetes)])
+    queries = {
+        'plus proche': lambda p: index.nearest(p[0], p[1]),
+        'rayon 5 km': lambda p: index.within_radius(p[0], p[1], 5.0),
+        'rectangle 0.2°': lambda p: index.within_bounds(p[0], p[1], p[0] + 0.2, p[1] + 0.2),
+    }
+    for name, query in queries.items():
+        start = time.perf_counter()
+        for point in points:
+            query(point)
+        print(f"{name:<16}: {(time.perf_counter() - start) / n_requetes * 1e3:.3f} ms/requête")
+
+    # Vérification et référence : parcours complet des coordonnées
+    x, y = index._project(lat, lon)
+    start = time.perf_counter()
+    for point in points:
+        px, py = index._project(point[0], point[1])
+        expected = ids[np.argmin(np.hypot(x - px, y - py))]
+        assert index.nearest(point[0], point[1])[0] == expected
+    print(f"{'parcours complet':<16}: {(time.perf_counter() - start) / n_requetes * 1e3:.3f} ms/requête "
+          f"(plus proche, résultats identiques)")
+
+
+# Modules du projet dont l'import doit rester léger, et bibliothèques qui ne doivent être chargées qu'à l'usage
+PROJECT_MODULES = ('data_manager', 'map_visualization', 'dashbord', 'app', 'spatial_index',
+                   'dashboard_cache', 'downsampling', 'binning', 'synthetic_data', 'instrumentation',
+                   'partitioned_store', 'ndvi_features', 'yield_model')
+LAZY_LIBRARIES = ('sklearn', 'folium', 'branca', 'bokeh', 'streamlit', 'pyarrow', 'scipy')
+
+_IMPORT_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+for name in sys.argv[1:]:
+    __import__(name)
+print(json.dumps({'ms': (time.perf_counter() - start) * 1e3, 'modules': sorted(sys.modules)}))
+"""
+
+
+def _import_probe(*modules):
+    """
+    Importe des modules dans un interpréteur neuf et retourne la durée (ms) et les modules chargés.
+    """
+    output = subprocess.run([sys.executable, '-c', _IMPORT_PROBE, *modules],
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def bench_imports(max_ms, repeat):
+    """
+    Mesure le temps d'import de chaque module du projet, au-delà de pandas et numpy,
+    et vérifie qu'aucune bibliothèque lourde n'est chargée ni aucune sortie produite à l'import.
+    :return: code de sortie (1 si un seuil est dépassé)
+    """
+    baseline = [_import_probe('numpy', 'pandas') for _ in range(repeat)]
+    baseline_ms = min(run['ms'] for run in baseline)
+    # Bibliothèques déjà chargées par pandas lui-même (ex. pyarrow) : elles ne comptent pas
+    preloaded = {name.split('.')[0] for name in baseline[0]['modules']}
+
+    failures = 0
+    print(f"pandas + numpy : {baseline_ms:.0f} ms (référence)")
+    for module in PROJECT_MODULES:
+        runs = [_import_probe('numpy', 'pandas', module) for _ in range(repeat)]
+        extra_ms = min(run['ms'] for run in runs) - baseline_ms
+        loaded = {name.split('.')[0] for name in runs[0]['modules']}
+        heavy = sorted(library for library in LAZY_LIBRARIES if library in loaded - preloaded)
+        output = subprocess.run([sys.executable, '-c', f'import {module}'], capture_output=True, text=True).stdout
+        problems = []
+        if extra_ms > max_ms:
+            problems.append(f"> {max_ms} ms")
+        if heavy:
+            problems.append(f"charge {', '.join(heavy)}")
+        if output.strip():
+            problems.append("affiche du texte à l'import")
+        failures += bool(problems)
+        print(f"{module:<18}: +{extra_ms:6.1f} ms  {'ÉCHEC : ' + '; '.join(problems) if problems else 'ok'}")
+    return 1 if failures else 0
+
+
+# Étapes mesurées par le benchmark de montée en charge, dans l'ordre d'exécution
+SCALING_STAGES = ('load_data (csv)', 'load_data (cache)', 'prepare_features', 'calculate_risk_metrics',
+                  'predict_yields', 'get_temporal_patterns', 'carte : rendements', 'carte : ndvi', 'carte : risque', 'carte : html')
+
+# Écart minimal (s) pour signaler une régression : les étapes très courtes sont dominées par le bruit
+REGRESSION_MIN_S = 0.02
+
+
+class _PeakRSS:
+    def __init__(self, interval=0.005):
+        """
+        Échantillonne la mémoire résidente dans un thread pendant une étape et en retient le pic.
+        """
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._stop = threading.Event()
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak_mb = max(self.peak_mb, current_rss_mb())
+
+    def __enter__(self):
+        self.peak_mb = current_rss_mb()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_mb = max(self.peak_mb, current_rss_mb())
+
+
+def _measure(results, stage, units, func):
+    """
+    Exécute une étape (sorties texte masquées) et enregistre sa durée, son pic RSS et son débit.
+    :param units: Nombre d'unités traitées (lignes, requêtes, parcelles) pour le calcul du débit
+    """
+    with _PeakRSS() as rss, contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        value = func()
+        duration = time.perf_counter() - start
+    results.append({'etape': stage, 'duree_s': duration, 'pic_rss_mo': rss.peak_mb,
+                    'unites': int(units), 'debit': units / duration if duration > 0 else float('inf')})
+    return value
+
+
+def _scaling_run(data_dir, n_requetes, map_max):
+    """
+    Exécute toutes les étapes sur un jeu de données (dans un processus neuf, pour des pics mémoire comparables).
+    """
+    from data_manager import AgriculturalDataManager, CACHE_SUFFIX
+    from synthetic_data import FILE_NAMES
+
+    paths = [os.path.join(data_dir, FILE_NAMES[name]) for name in ('monitoring', 'weather', 'soil', 'yield')]
+    for path in paths:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(path + CACHE_SUFFIX)
+    with open(os.path.join(data_dir, 'parametres.json'), encoding='utf-8') as f:
+        rows = json.load(f)['lignes']
+
+    results = []
+    manager = AgriculturalDataManager()
+    # Premier chargement : lecture des CSV et écriture du cache ; second : lecture du cache Parquet
+    _measure(results, 'load_data (csv)', sum(rows.values()), lambda: manager.load_data(*paths))
+    _measure(results, 'load_data (cache)', sum(rows.values()), lambda: manager.load_data(*paths))
+    features = _measure(results, 'prepare_features', rows['monitoring'], manager.prepare_features)
+    _measure(results, 'calculate_risk_metrics', len(features), lambda: manager.calculate_risk_metrics(features))
+    _measure(results, 'predict_yields', len(features), manager.predict_yields)
+
+    # Requêtes sur des parcelles tirées au hasard (la première calcule les tendances de toutes les parcelles)
+    parcelles = manager.soil_data['parcelle_id'].astype(str).values
+    requetes = np.random.default_rng(0).choice(parcelles, n_requetes)
+    _measure(results, 'get_temporal_patterns', n_requetes,
+             lambda: [manager.get_temporal_patterns(parcelle_id) for parcelle_id in requetes])
+
+    if rows['soil'] <= map_max:
+        from map_visualization import AgriculturalMap
+
+        agri_map = AgriculturalMap(manager)
+        agri_map.create_base_map()
+        _measure(results, 'carte : rendements', rows['soil'], agri_map.add_yield_history_layer)
+        _measure(results, 'carte : ndvi', rows['soil'], agri_map.add_current_ndvi_layer)
+        _measure(results, 'carte : risque', rows['soil'], agri_map.add_risk_heatmap)
+        _measure(results, 'carte : html', rows['soil'], lambda: agri_map.map.get_root().render())
+    return results
+
+
+def _dataset_dir(root, n_parcelles, n_annees, frequence, jours, seed):
+    """
+    Génère (une seule fois) le jeu de données synthétique correspondant aux paramètres.
+    """
+    from synthetic_data import DATA_VERSION, write_dataset
+
+    data_dir = os.path.join(root, f"agri_v{DATA_VERSION}_{n_parcelles}p_{n_annees}a_{frequence}_{jours}j_s{seed}")
+    if not os.path.exists(os.path.join(data_dir, 'parametres.json')):
+        start = time.perf_counter()
+        write_dataset(data_dir, n_parcelles, n_annees, frequence, jours, seed=seed)
+        print(f"Jeu de données {n_parcelles} parcelles généré en {time.perf_counter() - start:.1f} s ({data_dir})")
+    return data_dir
+
+
+def _load_reference(path):
+    """
+    Résultats de référence indexés par (parcelles, étape).
+    """
+    with open(path, encoding='utf-8') as f:
+        stored = json.load(f)
+    return {(entry['parcelles'], entry['etape']): entry for entry in stored['resultats']}, stored['parametres']
+
+
+def bench_scaling(tailles, n_annees, frequence, jours, seed, data_root, n_requetes, map_max,
+                  reference_path, save_path, seuil):
+    """
+    Mesure la durée, le pic de mémoire résidente et le débit de chaque étape du pipeline
+    pour des jeux de données synthétiques de tailles croissantes, et compare à une référence enregistrée.
+    :param seuil: Ralentissement (ou hausse mémoire) relatif au-delà duquel une étape est signalée
+    :return: code de sortie (1 si une régression est détectée)
+    """
+    parameters = {'annees': n_annees, 'frequence': frequence, 'jours': jours, 'seed': seed, 'requetes': n_requetes}
+    reference, reference_parameters = _load_reference(reference_path) if reference_path else ({}, None)
+    if reference_parameters is not None and reference_parameters != parameters:
+        print(f"Attention : paramètres différents de la référence ({reference_parameters})")
+
+    results = []
+    regressions = 0
+    context = multiprocessing.get_context('spawn')
+    header = f"{'parcelles':>9} {'étape':<24} {'durée (s)':>10} {'pic RSS (Mo)':>13} {'débit (/s)':>12}"
+    print(header + (f" {'réf. (s)':>9} {'x durée':>8} {'x RSS':>6}" if reference else ''))
+    for n_parcelles in tailles:
+        data_dir = _dataset_dir(data_root, n_parcelles, n_annees, frequence, jours, seed)
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            stages = executor.submit(_scaling_run, data_dir, n_requetes, map_max).result()
+        for stage in stages:
+            stage['parcelles'] = n_parcelles
+            results.append(stage)
+            line = (f"{n_parcelles:>9} {stage['etape']:<24} {stage['duree_s']:>10.3f} "
+                    f"{stage['pic_rss_mo']:>13.0f} {stage['debit']:>12.0f}")
+            previous = reference.get((n_parcelles, stage['etape']))
+            if previous is not None:
+                time_ratio = stage['duree_s'] / previous['duree_s'] if previous['duree_s'] > 0 else 1.0
+                rss_ratio = stage['pic_rss_mo'] / previous['pic_rss_mo'] if previous['pic_rss_mo'] > 0 else 1.0
+                slower = time_ratio > 1 + seuil and stage['duree_s'] - previous['duree_s'] > REGRESSION_MIN_S
+                regression = slower or rss_ratio > 1 + seuil
+                regressions += regression
+                line += f" {previous['duree_s']:>9.3f} {time_ratio:>8.2f} {rss_ratio:>6.2f}"
+                line += '  RÉGRESSION' if regression else ''
+            print(line)
+
+    if save_path:
+        with open(save_path, 'w', encoding='utf-8') as f:
+            json.dump({'parametres': parameters, 'resultats': results}, f, indent=2, ensure_ascii=False)
+        print(f"Résultats enregistrés dans {save_path}")
+    if reference:
+        print(f"{regressions} régression(s) au-delà de {seuil:.0%}")
+    return 1 if regressions else 0
+
+
+def bench_instrumentation(n_parcelles, n_jours, repeat):
+    """
+    Mesure le coût de l'instrumentation : par étape (désactivée, puis avec une sortie en mémoire)
+    et sur le pipeline complet (prepare_features + calculate_risk_metrics + get_yield_trends).
+    """
+    from instrumentation import Instrumentation, MemorySink
+
+    n_calls = 100_000
+    for label, instrumentation in (('désactivée', Instrumentation()),
+                                   ('sortie mémoire', Instrumentation(sinks=[MemorySink()]))):
+        start = time.perf_counter()
+        for _ in range(n_calls):
+            with instrumentation.stage('etape') as stage:
+                stage.rows = 1
+        print(f"Coût par étape ({label:<14}) : {(time.perf_counter() - start) / n_calls * 1e6:.2f} µs")
+
+    manager = _synthetic_manager(n_parcelles, n_jours, 10)
+    sink = MemorySink()
+    timings = {}
+    for label, instrumentation in (('désactivée', Instrumentation()), ('activée', Instrumentation(sinks=[sink]))):
+        manager.instrumentation = instrumentation
+        durations = []
+        for _ in range(repeat):
+            manager._yield_trends = None
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                features = manager.prepare_features()
+                manager.calculate_risk_metrics(features)
+                manager.get_yield_trends()
+                durations.append(time.perf_counter() - start)
+        timings[label] = min(durations)
+    print(f"Pipeline ({n_parcelles * n_jours} lignes) : désactivée {timings['désactivée']:.3f} s, "
+          f"activée {timings['activée']:.3f} s ({(timings['activée'] / timings['désactivée'] - 1) * 100:+.1f} %)")
+    print(sink.frame().groupby('etape')[['duree_s', 'lignes']].mean().to_string())
+
+
+def bench_query(n_parcelles, frequence, data_root, n_requetes):
+    """
+    Compare la lecture d'une parcelle sur une période depuis le stockage partitionné
+    (filtres et colonnes appliqués à la lecture) avec le chargement complet puis le filtrage en mémoire.
+    """
+    from data_manager import AgriculturalDataManager
+    from synthetic_data import FILE_NAMES
+
+    data_dir = _dataset_dir(data_root, n_parcelles, 10, frequence, 365, 0)
+    store_dir = os.path.join(data_dir, 'partitionne')
+    paths = [os.path.join(data_dir, FILE_NAMES[name]) for name in ('monitoring', 'weather', 'soil', 'yield')]
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        manager = AgriculturalDataManager()
+        start = time.perf_counter()
+        manager.load_data(*paths)
+        load_time = time.perf_counter() - start
+        start = time.perf_counter()
+        manager.write_partitioned(store_dir)
+        write_time = time.perf_counter() - start
+    print(f"Parcelles : {n_parcelles}, lignes de suivi : {len(manager.monitoring_data)}")
+    print(f"Chargement complet : {load_time:.2f} s, écriture du stockage partitionné : {write_time:.2f} s")
+
+    stored = AgriculturalDataManager()
+    stored.open_partitioned(store_dir, tables=())
+    requetes = np.random.default_rng(0).choice(manager.soil_data['parcelle_id'].astype(str).values, n_requetes)
+    window = ('2023-04-01', '2023-06-30')
+    for label, source in (('en mémoire', manager), ('partitionné', stored)):
+        start = time.perf_counter()
+        for parcelle_id in requetes:
+            source.query(parcelle_id, *window, columns=['date', 'ndvi'])
+        print(f"Requête une parcelle ({label:<11}) : {(time.perf_counter() - start) / n_requetes * 1e3:.2f} ms")
+        expected = manager.query(requetes[0], *window, columns=['date', 'ndvi'])
+        pd.testing.assert_frame_equal(expected, source.query(requetes[0], *window, columns=['date', 'ndvi']),
+                                      check_dtype=False)
+
+    plan = stored.store.explain('monitoring', [requetes[0]], *window, columns=['date', 'ndvi'])
+    print(f"Lu pour une parcelle : {plan['groupes_lignes']} groupe(s) de lignes, {plan['octets'] / 1024:.1f} Kio "
+          f"sur {plan['octets_total'] / 2**20:.1f} Mio ({plan['fichiers']}/{plan['fichiers_total']} fichiers)")
+
+
+def _pandas_ndvi_features(monitoring, engine):
+    """
+    Implémentation de référence avec pandas : centiles par (parcelle, période) sur les périodes voisines,
+    puis fenêtres glissantes par parcelle (rolling) pour les statistiques et la persistance sous le seuil bas.
+    """
+    periods = (monitoring['date'].dt.dayofyear - 1) // engine.season_bin_days
+    offsets = range(-engine.neighbour_bins, engine.neighbour_bins + 1)
+    expanded = pd.concat([pd.DataFrame({'parcelle_id': monitoring['parcelle_id'], 'periode': (periods + offset) % engine.n_bins,
+                                        'ndvi': monitoring['ndvi'].astype(np.float32)}) for offset in offsets])
+    grouped = expanded.groupby(['parcelle_id', 'periode'], observed=True)['ndvi']
+    thresholds = grouped.quantile(engine.quantiles[0]).rename('lower_threshold').to_frame()
+    thresholds['upper_threshold'] = grouped.quantile(engine.quantiles[-1])
+    thresholds = thresholds[grouped.count() >= engine.min_observations].reset_index()
+
+    frame = monitoring[['date', 'parcelle_id', 'ndvi']].assign(periode=periods.values)
+    frame = frame.merge(thresholds, on=['parcelle_id', 'periode'], how='left')
+    frame['sous_seuil'] = (frame['ndvi'] < frame['lower_threshold']).astype(float)
+    rolling = frame.sort_values(['parcelle_id', 'date'], kind='mergesort').set_index('date') \
+        .groupby('parcelle_id', observed=True)[['ndvi', 'sous_seuil']].rolling(engine.window)
+    stats = pd.DataFrame({'ndvi_moyenne_glissante': rolling['ndvi'].mean(), 'ndvi_ecart_type_glissant': rolling['ndvi'].std(),
+                          'ndvi_sous_seuil_glissant': rolling['sous_seuil'].sum()})
+    return frame.merge(stats.reset_index(), on=['parcelle_id', 'date'])
+
+
+def bench_ndvi(n_parcelles, n_jours, n_nouveaux):
+    """
+    Compare le moteur NDVI (passes groupées vectorisées) avec une implémentation pandas (quantile par groupe,
+    jointure et rolling par parcelle), puis la mise à jour incrémentale de nouveaux jours avec le recalcul complet.
+    """
+    from ndvi_features import NDVIFeatureEngine
+
+    manager = _synthetic_manager(n_parcelles, n_jours, 10)
+    monitoring = manager.monitoring_data
+    engine = NDVIFeatureEngine()
+    print(f"Parcelles : {n_parcelles}, jours : {n_jours}, lignes : {len(monitoring)}")
+
+    start = time.perf_counter()
+    engine.fit(monitoring)
+    features = engine.transform(monitoring)
+    engine_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    expected = _pandas_ndvi_features(monitoring, engine)
+    pandas_time = time.perf_counter() - start
+
+    print(f"Moteur NDVI : {engine_time:.3f} s")
+    print(f"pandas      : {pandas_time:.3f} s  (x{pandas_time / engine_time:.1f})")
+    compared = features.merge(expected, on=['parcelle_id', 'date'], suffixes=('', '_attendu'))
+    errors = {column: (compared[column] - compared[f'{column}_attendu']).abs().max()
+              for column in ('lower_threshold', 'upper_threshold', 'ndvi_moyenne_glissante',
+                             'ndvi_ecart_type_glissant', 'ndvi_sous_seuil_glissant')}
+    print("Écart max : " + ", ".join(f"{column} {error:.1e}" for column, error in errors.items()))
+
+    # Nouveaux jours : seules les nouvelles lignes et la fenêtre qui les précède sont traitées
+    dates = monitoring['date']
+    cut = dates.max() - pd.Timedelta(days=n_nouveaux)
+    new_rows = monitoring[dates > cut]
+    context = monitoring[(dates <= cut) & (dates >= engine.context_start(new_rows['date'].min()))]
+    start = time.perf_counter()
+    updated = engine.transform(new_rows, context)
+    update_time = time.perf_counter() - start
+    full = features[dates > cut]
+    print(f"Ajout de {n_nouveaux} jour(s) ({len(new_rows)} lignes) : incrémental {update_time * 1e3:.1f} ms")
+    print(f"Écart max incrémental / complet : "
+          f"{(updated['ndvi_moyenne_glissante'] - full['ndvi_moyenne_glissante']).abs().max():.2e}")
+
+
+def bench_model(n_parcelles, frequence, data_root, n_parcelles_boucle):
+    """
+    Mesure l'entraînement et l'inférence groupée du modèle de rendement, la réutilisation d'un modèle stocké
+    (même empreinte), l'inférence parcelle par parcelle, et vérifie les prédictions avec la ridge de scikit-learn.
+    """
+    from data_manager import AgriculturalDataManager
+    from sklearn.linear_model import Ridge
+    from synthetic_data import FILE_NAMES
+    from yield_model import season_history, yield_states
+
+    data_dir = _dataset_dir(data_root, n_parcelles, 10, frequence, 365, 0)
+    paths = [os.path.join(data_dir, FILE_NAMES[name]) for name in ('monitoring', 'weather', 'soil', 'yield')]
+    with contextlib.redirect_stdout(io.StringIO()), tempfile.TemporaryDirectory(prefix='agri_modeles_') as model_dir:
+        manager = AgriculturalDataManager()
+        manager.load_data(*paths)
+        features = manager.prepare_features()
+        manager.predict_yields(model_dir=model_dir)
+        trained = manager.model_report
+        manager.yield_model = None  # Nouvelle session : le modèle est relu depuis le stockage
+        start = time.perf_counter()
+        manager.predict_yields(model_dir=model_dir)
+        reload_time = time.perf_counter() - start
+        reloaded = manager.model_report
+
+    model = manager.yield_model
+    print(f"Parcelles : {n_parcelles}, observations : {len(features)}, RMSE d'entraînement : "
+          f"{model.metrics['rmse']:.3f} t/ha, R² : {model.metrics['r2']:.3f}")
+    print(f"Entraînement        : {trained['entrainement_s']:.3f} s ({trained['entrainement_lignes_par_s']:.0f} lignes/s)")
+    print(f"Inférence groupée   : {trained['prediction_s']:.3f} s ({trained['prediction_lignes_par_s']:.0f} lignes/s)")
+    print(f"Modèle stocké ({reloaded['cache']}) : {reload_time:.3f} s pour empreinte + inférence, sans entraînement")
+
+    # Inférence parcelle par parcelle (un appel par parcelle), extrapolée à toutes les parcelles
+    parcelles = features['parcelle_id'].astype(str)
+    selection = parcelles.unique()[:n_parcelles_boucle]
+    start = time.perf_counter()
+    for parcelle_id in selection:
+        model.predict(features[parcelles == parcelle_id], manager.yield_history)
+    loop_time = (time.perf_counter() - start) / len(selection) * parcelles.nunique()
+    print(f"Inférence par parcelle (extrapolée) : {loop_time:.1f} s  (x{loop_time / trained['prediction_s']:.0f})")
+
+    # Vérification : même ridge avec scikit-learn sur les lignes d'entraînement standardisées
+    history, target = season_history(features, yield_states(manager.yield_history))
+    rows = np.flatnonzero(~np.isnan(target))
+    X = model._standardized(model._design(features.iloc[rows], history.iloc[rows]))
+    reference = Ridge(alpha=model.alpha).fit(X, target[rows]).predict(X)
+    print(f"Écart max avec scikit-learn : {np.abs(reference - features['predicted_yield'].values[rows]).max():.2e}")
+
+
+def _patch_bytes(events):
+    """
+    Taille du message PATCH-DOC que le serveur Bokeh enverrait au navigateur pour des événements du document.
+    """
+    from bokeh.protocol import Protocol
+
+    if not events:
+        return 0
+    message = Protocol().create('PATCH-DOC', list(events))
+    return len(message.header_json) + len(message.metadata_json) + len(message.content_json) \
+        + sum(len(buffer.to_bytes()) for buffer in message.buffers)
+
+
+def bench_interactions(n_parcelles, durees, n_nouveaux, n_selections):
+    """
+    Latence par interaction du tableau de bord Bokeh selon la longueur de l'historique : changement de parcelle
+    (select_parcelle) et ajout d'un jour d'observations (append_observations puis stream_observations), avec la
+    taille des messages envoyés au navigateur par le serveur Bokeh, comparés à la reconstruction complète des graphiques.
+    """
+    from bokeh.document import Document
+    from dashbord import AgriculturalDashboard
+    from data_manager import AgriculturalDataManager, _compact_dtypes
+    from synthetic_data import generate_dataset
+
+    print(f"Parcelles : {n_parcelles}, suivi quotidien, {n_nouveaux} nouveaux jours, {n_selections} sélections")
+    print(f"{'jours':>6} {'lignes':>9} | {'sélection':>19} | {'nouveau jour : données':>22} {'graphiques':>19} "
+          f"| {'reconstruction':>19}")
+    for jours in durees:
+        data = generate_dataset(n_parcelles, 5, 'D', jours)
+        monitoring = data['monitoring']
+        new_days = np.sort(monitoring['date'].unique())[-n_nouveaux:]
+        manager = AgriculturalDataManager()
+        manager.monitoring_data = _compact_dtypes(monitoring[monitoring['date'] < new_days[0]].reset_index(drop=True))
+        manager.weather_data = _compact_dtypes(data['weather'])
+        manager.soil_data = _compact_dtypes(data['soil'])
+        manager.yield_history = _compact_dtypes(data['yield'])
+        with contextlib.redirect_stdout(io.StringIO()):
+            manager.calculate_risk_metrics(manager.prepare_features())
+            manager.predict_yields()
+
+        parcelles = data['soil']['parcelle_id'].astype(str).tolist()
+        dashboard = AgriculturalDashboard(manager)
+        document = Document()
+        document.add_root(dashboard.create_layout(parcelles[0]))
+        events = []
+        document.callbacks.on_change(events.append)
+
+        # Changement de parcelle : séries réduites de la nouvelle parcelle seulement
+        selection_times, selection_bytes = [], []
+        for parcelle_id in parcelles[1:n_selections + 1]:
+            events.clear()
+            start = time.perf_counter()
+            dashboard.select_parcelle(parcelle_id)
+            selection_times.append(time.perf_counter() - start)
+            selection_bytes.append(_patch_bytes(events))
+
+        # Nouveau jour : mise à jour incrémentale des données, puis envoi des seules nouvelles lignes
+        append_times, stream_times, stream_bytes = [], [], []
+        for day in new_days:
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                change = manager.append_observations(monitoring=monitoring[monitoring['date'] == day])
+            append_times.append(time.perf_counter() - start)
+            events.clear()
+            start = time.perf_counter()
+            rows = manager.query(dashboard.parcelle_id, start=change['debut'], table='features')
+            dashboard.stream_observations(rows)
+            stream_times.append(time.perf_counter() - start)
+            stream_bytes.append(_patch_bytes(events))
+
+        # Référence : reconstruction de tous les graphiques, envoyés en entier au navigateur
+        events.clear()
+        start = time.perf_counter()
+        layout = AgriculturalDashboard(manager).create_layout(dashboard.parcelle_id)
+        document.clear()
+        document.add_root(layout)
+        rebuild_time = time.perf_counter() - start
+        rebuild_bytes = _patch_bytes(events)
+
+        print(f"{jours:>6} {len(manager.features):>9} | {np.median(selection_times) * 1e3:>8.1f} ms "
+              f"{np.median(selection_bytes) / 1e3:>6.1f} Ko | {np.median(append_times) * 1e3:>19.1f} ms "
+              f"{np.median(stream_times) * 1e3:>8.1f} ms {np.median(stream_bytes) / 1e3:>6.1f} Ko "
+              f"| {rebuild_time * 1e3:>8.1f} ms {rebuild_bytes / 1e3:>6.1f} Ko")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks du projet agricole")
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    trends = subparsers.add_parser('trends', help="Tendances de rendement groupées vs boucle par parcelle")
+    trends.add_argument('--parcelles', type=int, default=2000)
+    trends.add_argument('--annees', type=int, default=20)
+
+    sharded = subparsers.add_parser('sharded', help="Pipeline séquentiel vs partitionné par parcelle")
+    sharded.add_argument('--parcelles', type=int, default=5000)
+    sharded.add_argument('--jours', type=int, default=365)
+    sharded.add_argument('--processus', type=int, default=4)
+
+    map_parser = subparsers.add_parser('map', help="Couche de rendements vectorisée vs iterrows")
+    map_parser.add_argument('--parcelles', type=int, nargs='+', default=[1000, 10000, 100000])
+    map_parser.add_argument('--annees', type=int, default=5)
+    map_parser.add_argument('--legacy-max', type=int, default=10000,
+                            help="Taille maximale mesurée avec l'implémentation iterrows")
+
+    spatial = subparsers.add_parser('spatial', help="Requêtes de l'index spatial vs parcours complet")
+    spatial.add_argument('--parcelles', type=int, default=100000)
+    spatial.add_argument('--requetes', type=int, default=1000)
+
+    imports = subparsers.add_parser('imports', help="Temps d'import des modules et absence d'effets de bord")
+    imports.add_argument('--max-ms', type=float, default=150.0, help="Temps d'import maximal au-delà de pandas")
+    imports.add_argument('--repeat', type=int, default=5)
+
+    scaling = subparsers.add_parser('scaling', help="Montée en charge du pipeline sur des données synthétiques")
+    scaling.add_argument('--parcelles', type=int, nargs='+', default=[100, 1000, 10000, 100000])
+    scaling.add_argument('--annees', type=int, default=10, help="Années d'historique des rendements")
+    scaling.add_argument('--frequence', default='7D', help="Fréquence des observations de suivi")
+    scaling.add_argument('--jours', type=int, default=365, help="Durée de la période de suivi, en jours")
+    scaling.add_argument('--seed', type=int, default=0)
+    scaling.add_argument('--data-root', default=os.path.join(tempfile.gettempdir(), 'agri_benchmarks'),
+                         help="Dossier où les jeux de données générés sont conservés entre les exécutions")
+    scaling.add_argument('--requetes', type=int, default=200, help="Nombre d'appels à get_temporal_patterns")
+    scaling.add_argument('--carte-max', type=int, default=100000,
+                         help="Nombre maximal de parcelles pour mesurer les couches de la carte")
+    scaling.add_argument('--reference', default=None, help="Fichier JSON de résultats de référence à comparer")
+    scaling.add_argument('--sauver', default=None, help="Enregistre les résultats dans ce fichier JSON")
+    scaling.add_argument('--seuil', type=float, default=0.25, help="Écart relatif signalé comme régression")
+
+    instrumentation = subparsers.add_parser('instrumentation', help="Coût de l'instrumentation des étapes")
+    instrumentation.add_argument('--parcelles', type=int, default=2000)
+    instrumentation.add_argument('--jours', type=int, default=365)
+    instrumentation.add_argument('--repeat', type=int, default=5)
+
+    query = subparsers.add_parser('query', help="Requêtes par parcelle : stockage partitionné vs mémoire")
+    query.add_argument('--parcelles', type=int, default=20000)
+    query.add_argument('--frequence', default='7D', help="Fréquence des observations de suivi")
+    query.add_argument('--data-root', default=os.path.join(tempfile.gettempdir(), 'agri_benchmarks'))
+    query.add_argument('--requetes', type=int, default=200)
+
+    ndvi = subparsers.add_parser('ndvi', help="Caractéristiques NDVI groupées vs pandas, mise à jour incrémentale")
+    ndvi.add_argument('--parcelles', type=int, default=5000)
+    ndvi.add_argument('--jours', type=int, default=730)
+    ndvi.add_argument('--nouveaux', type=int, default=1, help="Jours ajoutés pour la mise à jour incrémentale")
+
+    model = subparsers.add_parser('model', help="Modèle de rendement : entraînement, stockage et inférence groupée")
+    model.add_argument('--parcelles', type=int, default=20000)
+    model.add_argument('--frequence', default='7D', help="Fréquence des observations de suivi")
+    model.add_argument('--data-root', default=os.path.join(tempfile.gettempdir(), 'agri_benchmarks'))
+    model.add_argument('--boucle', type=int, default=200, help="Parcelles mesurées avec l'inférence par parcelle")
+
+    interactions = subparsers.add_parser('interactions',
+                                         help="Latence des mises à jour du tableau de bord selon l'historique")
+    interactions.add_argument('--parcelles', type=int, default=50)
+    interactions.add_argument('--jours', type=int, nargs='+', default=[365, 1460, 5840],
+                              help="Longueurs d'historique de suivi mesurées, en jours")
+    interactions.add_argument('--nouveaux', type=int, default=10, help="Jours ajoutés un par un")
+    interactions.add_argument('--selections', type=int, default=20, help="Changements de parcelle mesurés")
+
+    args = parser.parse_args()
+    if args.benchmark == 'trends':
+        bench_trends(args.parcelles, args.annees)
+    elif args.benchmark == 'sharded':
+        bench_sharded(args.parcelles, args.jours, args.processus)
+    elif args.benchmark == 'map':
+        bench_map(args.parcelles, args.annees, args.legacy_max)
+    elif args.benchmark == 'spatial':
+        bench_spatial(args.parcelles, args.requetes)
+    elif args.benchmark == 'imports':
+        return bench_imports(args.max_ms, args.repeat)
+    elif args.benchmark == 'instrumentation':
+        bench_instrumentation(args.parcelles, args.jours, args.repeat)
+    elif args.benchmark == 'query':
+        bench_query(args.parcelles, args.frequence, args.data_root, args.requetes)
+    elif args.benchmark == 'ndvi':
+        bench_ndvi(args.parcelles, args.jours, args.nouveaux)
+    elif args.benchmark == 'model':
+        bench_model(args.parcelles, args.frequence, args.data_root, args.boucle)
+    elif args.benchmark == 'interactions':
+        bench_interactions(args.parcelles, args.jours, args.nouveaux, args.selections)
+    elif args.benchmark == 'scaling':
+        return bench_scaling(args.parcelles, args.annees, args.frequence, args.jours, args.seed, args.data_root,
+                             args.requetes, args.carte_max, args.reference, args.sauver, args.seuil)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
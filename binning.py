@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+Agrégation vectorisée de points sur une grille 2D fixe (matrice de stress du tableau de bord).
+"""
+
+import numpy as np
+import pandas as pd
+
+AGGREGATIONS = ('count', 'mean', 'max', 'sum')
+
+
+class BinnedGrid2D:
+    def __init__(self, x_edges, y_edges=None, y_categories=None, clip=False):
+        """
+        Grille d'agrégation à bornes fixes : le coût d'affichage dépend du nombre de cases, pas du nombre de lignes.
+        L'axe y est soit numérique (y_edges), soit catégoriel (y_categories, ex. conditions météo) ;
+        si aucun des deux n'est fourni, les catégories sont découvertes au fil des mises à jour.
+        :param x_edges: Bornes croissantes des intervalles en x
+        :param y_edges: Bornes croissantes des intervalles en y (axe numérique)
+        :param y_categories: Modalités de l'axe y (axe catégoriel)
+        :param clip: Compte les valeurs hors bornes dans les intervalles extrêmes au lieu de les ignorer
+                     (toutes les lignes reçues figurent alors dans une case)
+        """
+        self.x_edges = np.asarray(x_edges, dtype=np.float64)
+        self.y_edges = None if y_edges is None else np.asarray(y_edges, dtype=np.float64)
+        self.y_categories = None if self.y_edges is not None else list(y_categories or [])
+        self.clip = clip
+        self.rows = 0
+        self._allocate(len(self.x_edges) - 1, self._ny())
+
+    def _ny(self):
+        return len(self.y_edges) - 1 if self.y_edges is not None else len(self.y_categories)
+
+    def _allocate(self, nx, ny):
+        """
+        Crée (ou agrandit, en conservant les cumuls) les tableaux d'agrégats.
+        """
+        previous = getattr(self, '_count', None)
+        count = np.zeros((ny, nx), dtype=np.int64)
+        total = np.zeros((ny, nx), dtype=np.float64)
+        maximum = np.full((ny, nx), -np.inf)
+        if previous is not None:
+            rows = previous.shape[0]
+            count[:rows], total[:rows], maximum[:rows] = self._count, self._sum, self._max
+        self._count, self._sum, self._max = count, total, maximum
+
+    @staticmethod
+    def _bin(values, edges, clip=False):
+        """
+        Numéro d'intervalle de chaque valeur (-1 hors grille, ou intervalle extrême avec clip ;
+        la borne supérieure est incluse ; -1 pour les valeurs manquantes).
+        """
+        index = np.searchsorted(edges, values, side='right') - 1
+        index[values == edges[-1]] = len(edges) - 2
+        if clip:
+            index = np.clip(index, 0, len(edges) - 2)
+        else:
+            index[(index < 0) | (index >= len(edges) - 1)] = -1
+        index[np.isnan(values)] = -1
+        return index
+
+    def update(self, x, y, values=None):
+        """
+        Ajoute de nouvelles lignes aux agrégats (coût proportionnel aux nouvelles lignes uniquement).
+        :param x: Valeurs en x (ex. stress hydrique)
+        :param y: Valeurs ou modalités en y (ex. condition météo)
+        :param values: Valeurs agrégées (moyenne, max, somme) ; par défaut, les valeurs de x
+        """
+        x = np.asarray(x, dtype=np.float64)
+        values = x if values is None else np.asarray(values, dtype=np.float64)
+        ix = self._bin(x, self.x_edges, self.clip)
+        if self.y_edges is not None:
+            iy = self._bin(np.asarray(y, dtype=np.float64), self.y_edges, self.clip)
+        else:
+            codes, uniques = pd.factorize(np.asarray(y, dtype=object))
+            new_categories = [value for value in uniques if value not in self.y_categories]
+            if new_categories:
+                self.y_categories.extend(new_categories)
+                self._allocate(len(self.x_edges) - 1, self._ny())
+            # Correspondance modalité -> ligne de la grille, appliquée aux codes (-1 pour les valeurs manquantes)
+            rows = np.array([self.y_categories.index(value) for value in uniques] + [-1], dtype=np.int64)
+            iy = rows[codes]
+
+        valid = (ix >= 0) & (iy >= 0) & ~np.isnan(values)
+        nx = len(self.x_edges) - 1
+        cells = iy[valid] * nx + ix[valid]
+        size = self._count.size
+        self._count += np.bincount(cells, minlength=size).reshape(self._count.shape)
+        self._sum += np.bincount(cells, weights=values[valid], minlength=size).reshape(self._sum.shape)
+        np.maximum.at(self._max.reshape(-1), cells, values[valid])
+        self.rows += len(x)
+        return self
+
+    def aggregate(self, aggregation='mean'):
+        """
+        Grille (ny, nx) de l'agrégat demandé ('count', 'mean', 'max' ou 'sum') ; NaN pour les cases vides.
+        """
+        if aggregation not in AGGREGATIONS:
+            raise ValueError(f"Agrégation inconnue : {aggregation} (attendu : {', '.join(AGGREGATIONS)})")
+        empty = self._count == 0
+        if aggregation == 'count':
+            return self._count.astype(np.float64)
+        if aggregation == 'sum':
+            return np.where(empty, np.nan, self._sum)
+        if aggregation == 'max':
+            return np.where(empty, np.nan, self._max)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(empty, np.nan, self._sum / self._count)
+
+    def to_source_data(self, aggregation='count', normalize=True):
+        """
+        Données d'une ColumnDataSource Bokeh : une case rectangulaire par case non vide de la grille,
+        identifiée par 'cell' (numéro de case, inchangé lorsque de nouvelles modalités sont ajoutées).
+        :param aggregation: Agrégat utilisé pour la couleur (colonne 'value')
+        :param normalize: Ramène 'value' entre 0 et 1 (pour un LinearColorMapper de 0 à 1)
+        """
+        iy, ix = np.nonzero(self._count)
+        value = self.aggregate(aggregation)[iy, ix]
+        if normalize and len(value):
+            low, high = np.nanmin(value), np.nanmax(value)
+            value = (value - low) / (high - low) if high > low else np.ones_like(value)
+
+        x_centers = (self.x_edges[:-1] + self.x_edges[1:]) / 2
+        if self.y_edges is not None:
+            y = ((self.y_edges[:-1] + self.y_edges[1:]) / 2)[iy]
+            height = np.diff(self.y_edges)[iy]
+        else:
+            y = np.array([str(self.y_categories[i]) for i in iy], dtype=object)
+            height = np.full(len(iy), 0.9)
+        return {
+            'cell': iy * len(x_centers) + ix,
+            'x': x_centers[ix],
+            'y': y,
+            'width': np.diff(self.x_edges)[ix],
+            'height': height,
+            'value': value,
+            'count': self._count[iy, ix],
+            'mean': self.aggregate('mean')[iy, ix],
+            'max': self._max[iy, ix],
+        }
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Cache LRU des éléments coûteux du tableau de bord (caractéristiques, tendances, carte HTML, JSON Bokeh).
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+def _freeze(value):
+    """
+    Convertit les paramètres d'une requête en une clé hachable (dictionnaires, listes, dates...).
+    """
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple, set, frozenset, np.ndarray, pd.Index)):
+        items = [_freeze(item) for item in value]
+        return tuple(sorted(items, key=repr)) if isinstance(value, (set, frozenset)) else tuple(items)
+    if isinstance(value, (pd.Timestamp, np.datetime64)):
+        return pd.Timestamp(value).isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+class VersionedLRUCache:
+    def __init__(self, maxsize=32):
+        """
+        Cache LRU borné dont les clés combinent un nom d'élément, la version des données et des paramètres.
+        Une nouvelle version des données rend les anciennes entrées inutiles : à la première demande d'un élément
+        dans une nouvelle version, ses entrées des versions précédentes sont supprimées.
+        :param maxsize: Nombre maximal d'entrées conservées
+        """
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._stats = {}
+        self._versions = {}  # Dernière version demandée de chaque élément
+
+    def _counter(self, name):
+        return self._stats.setdefault(name, {'hits': 0, 'misses': 0, 'evictions': 0})
+
+    def get_or_compute(self, name, version, params, builder):
+        """
+        Retourne l'élément en cache pour (name, version, params), ou le construit avec builder() en cas d'absence.
+        :param name: Nom de l'élément (ex. 'carte_html')
+        :param version: Version des données (AgriculturalDataManager.version)
+        :param params: Paramètres qui influencent le résultat (parcelle, dates, couches affichées...)
+        :param builder: Fonction sans argument qui construit l'élément
+        """
+        key = (name, version, _freeze(params))
+        counter = self._counter(name)
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            counter['hits'] += 1
+            return self._entries[key]
+
+        counter['misses'] += 1
+        if self._versions.get(name, version) != version:
+            stale = [key for key in self._entries if key[0] == name and key[1] != version]
+            for stale_key in stale:
+                del self._entries[stale_key]
+            counter['evictions'] += len(stale)
+        self._versions[name] = version
+        value = builder()
+        self._entries[key] = value
+        while len(self._entries) > self.maxsize:
+            evicted_key, _ = self._evict_one(version)
+            self._counter(evicted_key[0])['evictions'] += 1
+        return value
+
+    def _evict_one(self, version):
+        """
+        Évince l'entrée la moins récemment utilisée, en priorité parmi celles d'une ancienne version.
+        """
+        for key in self._entries:
+            if key[1] != version:
+                return key, self._entries.pop(key)
+        return self._entries.popitem(last=False)
+
+    def invalidate(self, name=None):
+        """
+        Supprime toutes les entrées, ou seulement celles d'un élément donné.
+        """
+        if name is None:
+            self._entries.clear()
+            self._versions.clear()
+        else:
+            self._versions.pop(name, None)
+            for key in [key for key in self._entries if key[0] == name]:
+                del self._entries[key]
+
+    def stats(self):
+        """
+        Statistiques de succès/échecs/évictions par élément et au total.
+        :return: DataFrame indexé par nom d'élément
+        """
+        stats = pd.DataFrame.from_dict(self._stats, orient='index', columns=['hits', 'misses', 'evictions'])
+        stats.loc['total'] = stats.sum()
+        requests = stats['hits'] + stats['misses']
+        stats['taux_succes'] = np.where(requests > 0, stats['hits'] / requests.where(requests > 0, 1), 0.0)
+        stats['entrees'] = [sum(1 for key in self._entries if key[0] == name) for name in stats.index[:-1]] \
+            + [len(self._entries)]
+        return stats
+
+    def __len__(self):
+        return len(self._entries)
@@ -1,112 +1,407 @@
 
-# Importation des bibliothèques nécessaires
+# Importation des bibliothèques nécessaires (Bokeh n'est importé qu'à la création des graphiques)
+import argparse  # Lecture des options de la ligne de commande
+import numpy as np  # Calcul des bornes de la grille de stress
 import pandas as pd  # Utilisation de pandas pour la manipulation des données
-from bokeh.models import ColumnDataSource, HoverTool, LinearColorMapper, ColorBar  # Importation des outils Bokeh pour la visualisation
-from bokeh.plotting import figure, output_notebook, show  # Fonctionnalités de Bokeh pour créer des graphiques et afficher les résultats
-from bokeh.layouts import column  # Permet de disposer les graphiques en colonne
-from bokeh.palettes import RdYlBu11 as palette  # Palette de couleurs RdYlBu pour la matrice de stress
-
-# Chargement des données à partir de fichiers CSV
-monitoring_data = pd.read_csv("monitoring_cultures.csv")  # Données de surveillance des cultures
-sols_data = pd.read_csv("sols.csv")  # Données sur les sols
-historique_rendements = pd.read_csv("historique_rendements.csv")  # Historique des rendements
-
-# Vérification de la présence de la colonne 'date' dans les DataFrames et transformation si nécessaire
-if 'date' not in monitoring_data.columns:
-    print("Colonne 'date' non trouvée dans monitoring_data")
-else:
-    monitoring_data['date'] = pd.to_datetime(monitoring_data['date'], errors='coerce')  # Conversion de la colonne 'date' en format datetime
-
-if 'date' not in historique_rendements.columns:
-    print("Colonne 'date' non trouvée dans historique_rendements, création à partir de l'année")
-    historique_rendements['date'] = pd.to_datetime(historique_rendements['annee'], format='%Y')  # Création de la colonne 'date' à partir de 'annee'
-
-# Fusion des données avec 'sols_data' sur la colonne 'parcelle_id'
-combined_data = monitoring_data.merge(sols_data, on="parcelle_id", how="inner") if 'parcelle_id' in sols_data.columns else pd.DataFrame()
-
-# Préparation des sources de données pour Bokeh (les sources sont les objets contenant les données pour les graphiques)
-hist_source = ColumnDataSource(historique_rendements)  # Source pour les rendements historiques
-source = ColumnDataSource(monitoring_data)  # Source pour les données de surveillance
-stress_source = ColumnDataSource(combined_data)  # Source pour les données combinées
-
-# Graphique : Historique des rendements
-yield_history_plot = figure(
-    title="Historique des Rendements par Parcelle",  # Titre du graphique
-    x_axis_type="datetime",  # Type de l'axe des x : date
-    height=400,  # Hauteur du graphique
-    width=800,  # Largeur du graphique
-    tools="pan,wheel_zoom,box_zoom,reset",  # Outils pour interagir avec le graphique (zoom, déplacement)
-)
-# Tracer la courbe des rendements historiques
-yield_history_plot.line(source=hist_source, x="date", y="rendement", line_width=2, color="blue", legend_label="Rendement")
-# Ajouter un outil de survol avec des informations sur la date et le rendement
-yield_history_plot.add_tools(HoverTool(tooltips=[("Date", "@date{%F}"), ("Rendement", "@rendement")], formatters={"@date": "datetime"}))
-yield_history_plot.legend.location = "top_left"  # Position de la légende
-
-# Graphique : Évolution du NDVI avec les seuils
-ndvi_plot = figure(
-    title="Évolution du NDVI et Seuils Historiques",
-    x_axis_type="datetime",
-    height=400,
-    width=800,
-    tools="pan,wheel_zoom,box_zoom,reset",
-)
-# Tracer la courbe du NDVI
-ndvi_plot.line(source=source, x="date", y="ndvi", line_width=2, color="green", legend_label="NDVI")
-# Tracer les seuils bas et hauts
-ndvi_plot.line(x="date", y="lower_threshold", source=source, color="red", line_dash="dashed", legend_label="Seuil Bas")
-ndvi_plot.line(x="date", y="upper_threshold", source=source, color="orange", line_dash="dashed", legend_label="Seuil Haut")
-# Ajouter un outil de survol pour afficher le NDVI et la date
-ndvi_plot.add_tools(HoverTool(tooltips=[("Date", "@date{%F}"), ("NDVI", "@ndvi")], formatters={"@date": "datetime"}))
-ndvi_plot.legend.location = "top_left"
-
-# Matrice de stress hydrique et conditions météorologiques
-mapper = LinearColorMapper(palette=palette, low=0, high=1)  # Mappage des couleurs en fonction de la valeur
-stress_matrix_plot = figure(
-    title="Matrice de Stress",
-    x_axis_label="Stress Hydrique",
-    y_axis_label="Conditions Météo",
-    tools="hover",
-    tooltips=[("Stress", "@value")],  # Affichage des informations de stress survolées
-    height=400,
-    width=400,
-)
-# Tracer la matrice de stress avec un rectangle pour chaque combinaison de stress et condition météorologique
-stress_matrix_plot.rect(
-    x="stress_hydrique",
-    y="meteo_condition",
-    width=0.1,
-    height=0.1,
-    source=stress_source,
-    fill_color={"field": "value", "transform": mapper},  # Remplissage en fonction de la valeur
-    line_color=None,
-)
-# Ajouter une barre de couleurs pour la matrice
-color_bar = ColorBar(color_mapper=mapper, location=(0, 0))
-stress_matrix_plot.add_layout(color_bar, "right")
-
-# Graphique : Prédiction des rendements
-yield_prediction_plot = figure(
-    title="Prédiction des Rendements",
-    x_axis_type="datetime",
-    height=400,
-    width=800,
-    tools="pan,wheel_zoom,box_zoom,reset",
-)
-# Tracer les rendements prédits
-yield_prediction_plot.line(source=source, x="date", y="predicted_yield", line_width=2, color="purple", legend_label="Prédiction")
-# Ajouter un outil de survol pour les prédictions
-yield_prediction_plot.add_tools(HoverTool(tooltips=[("Date", "@date{%F}"), ("Prédiction", "@predicted_yield")], formatters={"@date": "datetime"}))
-yield_prediction_plot.legend.location = "top_left"
-
-# Mise en page du tableau de bord : Les graphiques sont affichés dans une colonne
-layout = column(
-    yield_history_plot,
-    ndvi_plot,
-    stress_matrix_plot,
-    yield_prediction_plot
-)
-
-# Affichage
-output_notebook()
-show(layout)  # Affiche le tableau de bord avec tous les graphiques
\ No newline at end of file
+from data_manager import AgriculturalDataManager, _years  # Chargement et préparation des données
+from downsampling import DownsampledSource  # Réduction des séries à la largeur des graphiques
+from binning import BinnedGrid2D  # Agrégation de la matrice de stress sur une grille fixe
+
+STRESS_BINS = 20  # Nombre d'intervalles de stress hydrique
+
+
+def _same(old, new):
+    """
+    Égalité élément par élément de deux colonnes (les valeurs manquantes sont égales entre elles).
+    """
+    return (old == new) | (pd.isna(old) & pd.isna(new))
+
+
+def _apply_delta(source, data, key):
+    """
+    Met à jour une source Bokeh dont les lignes sont identifiées par la colonne key : les valeurs modifiées
+    des lignes existantes sont envoyées par patch et les nouvelles lignes par stream. Si des lignes disparaissent,
+    la source est remplacée.
+    :return: Nombre de valeurs envoyées
+    """
+    current = source.data
+    positions = pd.Index(current.get(key, [])).get_indexer(data[key])
+    existing = positions >= 0
+    if not len(current.get(key, [])) or existing.sum() < len(current[key]):
+        source.data = data
+        return sum(len(values) for values in data.values())
+
+    patches = {}
+    for column, values in data.items():
+        new = np.asarray(values)[existing]
+        changed = np.flatnonzero(~_same(np.asarray(current[column])[positions[existing]], new))
+        if len(changed):
+            patches[column] = list(zip(positions[existing][changed].tolist(), new[changed].tolist()))
+    if patches:
+        source.patch(patches)
+    if not existing.all():
+        source.stream({column: np.asarray(values)[~existing] for column, values in data.items()})
+    return sum(len(patch) for patch in patches.values()) + int((~existing).sum()) * len(data)
+
+
+class AgriculturalDashboard:
+    def __init__(self, data_manager, width=800, stress_range=None):
+        """
+        Tableau de bord Bokeh (rendements, NDVI et seuils, matrice de stress, prédictions)
+        construit à partir du gestionnaire de données.
+        :param width: Largeur des graphiques temporels en pixels (et des séries réduites)
+        :param stress_range: Bornes (min, max) du stress hydrique dans la matrice de stress ; par défaut, l'étendue
+                             des lignes affichées à la création. Les valeurs hors bornes (ex. nouvelles observations)
+                             sont comptées dans les cases extrêmes.
+        """
+        self.data_manager = data_manager
+        self.width = width
+        self.stress_range = stress_range
+        self.layout = None
+        self.stress_grid = None
+        self.parcelle_id = None  # Parcelle et période affichées
+        self.date_range = None
+        self.parcelle_select = None  # Champ de sélection de la parcelle (serveur Bokeh)
+
+    def _frames(self, parcelle_id=None, date_range=None):
+        """
+        Données de suivi, historique des rendements et données combinées (suivi + sols),
+        filtrées sur la parcelle et la période demandées.
+        """
+        # Les caractéristiques préparées contiennent les seuils, les prédictions et la météo (matrice de stress) ;
+        # elles sont calculées si les données de suivi sont chargées sans elles.
+        # Les lignes sont lues par le gestionnaire : avec un stockage partitionné, seules la parcelle et la période
+        # demandées sont lues sur disque
+        store = self.data_manager.store
+        if self.data_manager.features is None and self.data_manager.monitoring_data is not None \
+                and (store is None or 'features' not in store.tables):
+            prepare_dashboard_data(self.data_manager)
+        with_features = self.data_manager.features is not None or (store is not None and 'features' in store.tables)
+        start, end = date_range if date_range is not None else (None, None)
+        monitoring_data = self.data_manager.query(parcelle_id, start, end,
+                                                  table='features' if with_features else 'monitoring')
+        historique_rendements = self.data_manager.query(parcelle_id, table='yield')
+        sols_data = self.data_manager.query(parcelle_id, table='soil')
+
+        # Création de la colonne 'date' de l'historique à partir de 'annee'
+        if 'date' not in historique_rendements.columns:
+            historique_rendements['date'] = pd.to_datetime(_years(historique_rendements['annee']).astype('Int64').astype(str), format='%Y', errors='coerce')
+
+        # Fusion des données avec 'sols_data' sur la colonne 'parcelle_id' (inutile si les caractéristiques incluent déjà les sols)
+        if with_features or 'parcelle_id' not in sols_data.columns:
+            combined_data = monitoring_data
+        else:
+            combined_data = monitoring_data.merge(sols_data, on="parcelle_id", how="inner", suffixes=("", "_sol"))
+        return monitoring_data, historique_rendements, combined_data
+
+    def _stress_grid(self, combined_data):
+        """
+        Matrice de stress : les lignes combinées sont agrégées sur une grille fixe (None sans les colonnes nécessaires).
+        """
+        if not {'stress_hydrique', 'meteo_condition'} <= set(combined_data.columns):
+            return None
+        low, high = self.stress_range if self.stress_range is not None \
+            else (combined_data['stress_hydrique'].min(), combined_data['stress_hydrique'].max())
+        if not np.isfinite([low, high]).all():
+            low, high = 0.0, 1.0  # Aucune valeur de stress : bornes arbitraires
+        stress_edges = np.linspace(low, high, STRESS_BINS + 1)
+        # Valeurs hors bornes comptées dans les cases extrêmes : chaque ligne reçue figure dans une case
+        return BinnedGrid2D(stress_edges, clip=True).update(combined_data['stress_hydrique'], combined_data['meteo_condition'])
+
+    def _stress_factors(self):
+        return [str(category) for category in self.stress_grid.y_categories]
+
+    def create_layout(self, parcelle_id=None, date_range=None, interactive=True):
+        """
+        Crée les graphiques Bokeh et leur mise en page en colonne.
+        :param parcelle_id: Parcelle affichée (toutes si None)
+        :param date_range: Période affichée (début, fin), toute la période si None
+        :param interactive: Relit les données au zoom (rappels Python, serveur Bokeh) ; False pour une sortie
+                            autonome (fichier HTML, json_item), qui ne peut pas exécuter ces rappels
+        """
+        from bokeh.models import ColumnDataSource, HoverTool, LinearColorMapper, ColorBar  # Importation des outils Bokeh pour la visualisation
+        from bokeh.plotting import figure  # Fonctionnalités de Bokeh pour créer des graphiques
+        from bokeh.layouts import column  # Permet de disposer les graphiques en colonne
+        from bokeh.palettes import RdYlBu11 as palette  # Palette de couleurs RdYlBu pour la matrice de stress
+
+        monitoring_data, historique_rendements, combined_data = self._frames(parcelle_id, date_range)
+        self.parcelle_id, self.date_range = parcelle_id, date_range
+        self.parcelle_select = None
+
+        # Préparation des sources de données pour Bokeh (les sources sont les objets contenant les données pour les graphiques)
+        # Les séries temporelles sont réduites côté serveur à un point min/max par pixel de largeur
+        self.hist_series = DownsampledSource(historique_rendements, x="date", columns=["rendement"], width=self.width)
+        self.ndvi_series = DownsampledSource(monitoring_data, x="date", columns=["ndvi", "lower_threshold", "upper_threshold"], width=self.width)
+        self.prediction_series = DownsampledSource(monitoring_data, x="date", columns=["predicted_yield"], width=self.width)
+
+        # Matrice de stress : les lignes combinées sont agrégées sur une grille fixe (un rectangle par case non vide)
+        self.stress_grid = self._stress_grid(combined_data)
+        self.stress_source = ColumnDataSource(self.stress_grid.to_source_data('count') if self.stress_grid is not None else {})  # Source pour la matrice agrégée
+
+        # Graphique : Historique des rendements
+        self.yield_history_plot = figure(
+            title="Historique des Rendements par Parcelle",  # Titre du graphique
+            x_axis_type="datetime",  # Type de l'axe des x : date
+            height=400,  # Hauteur du graphique
+            width=self.width,  # Largeur du graphique
+            tools="pan,wheel_zoom,box_zoom,reset",  # Outils pour interagir avec le graphique (zoom, déplacement)
+        )
+        # Tracer la courbe des rendements historiques
+        self.yield_history_plot.line(source=self.hist_series.source, x="date", y="rendement", line_width=2, color="blue", legend_label="Rendement")
+        # Ajouter un outil de survol avec des informations sur la date et le rendement
+        self.yield_history_plot.add_tools(HoverTool(tooltips=[("Date", "@date{%F}"), ("Rendement", "@rendement")], formatters={"@date": "datetime"}))
+        self.yield_history_plot.legend.location = "top_left"  # Position de la légende
+
+        # Graphique : Évolution du NDVI avec les seuils
+        self.ndvi_plot = figure(
+            title="Évolution du NDVI et Seuils Historiques",
+            x_axis_type="datetime",
+            height=400,
+            width=self.width,
+            tools="pan,wheel_zoom,box_zoom,reset",
+        )
+        # Tracer la courbe du NDVI
+        self.ndvi_plot.line(source=self.ndvi_series.source, x="date", y="ndvi", line_width=2, color="green", legend_label="NDVI")
+        # Tracer les seuils bas et hauts
+        self.ndvi_plot.line(x="date", y="lower_threshold", source=self.ndvi_series.source, color="red", line_dash="dashed", legend_label="Seuil Bas")
+        self.ndvi_plot.line(x="date", y="upper_threshold", source=self.ndvi_series.source, color="orange", line_dash="dashed", legend_label="Seuil Haut")
+        # Ajouter un outil de survol pour afficher le NDVI et la date
+        self.ndvi_plot.add_tools(HoverTool(tooltips=[("Date", "@date{%F}"), ("NDVI", "@ndvi")], formatters={"@date": "datetime"}))
+        self.ndvi_plot.legend.location = "top_left"
+
+        # Matrice de stress hydrique et conditions météorologiques
+        mapper = LinearColorMapper(palette=palette, low=0, high=1)  # Mappage des couleurs en fonction de la valeur
+        # Axe des conditions météo catégoriel lorsque la grille est construite
+        stress_range = {"y_range": self._stress_factors()} if self.stress_grid is not None else {}
+        self.stress_matrix_plot = figure(
+            title="Matrice de Stress",
+            x_axis_label="Stress Hydrique",
+            y_axis_label="Conditions Météo",
+            tools="hover",
+            tooltips=[("Stress", "@x"), ("Observations", "@count"), ("Stress max", "@max")],  # Informations de la case survolée
+            height=400,
+            width=400,
+            **stress_range,
+        )
+        # Tracer la matrice de stress avec un rectangle par case (stress hydrique x condition météorologique)
+        self.stress_matrix_plot.rect(
+            x="x",
+            y="y",
+            width="width",
+            height="height",
+            source=self.stress_source,
+            fill_color={"field": "value", "transform": mapper},  # Remplissage en fonction de la valeur
+            line_color=None,
+        )
+        # Ajouter une barre de couleurs pour la matrice
+        color_bar = ColorBar(color_mapper=mapper, location=(0, 0))
+        self.stress_matrix_plot.add_layout(color_bar, "right")
+
+        # Graphique : Prédiction des rendements
+        self.yield_prediction_plot = figure(
+            title="Prédiction des Rendements",
+            x_axis_type="datetime",
+            height=400,
+            width=self.width,
+            tools="pan,wheel_zoom,box_zoom,reset",
+        )
+        # Tracer les rendements prédits
+        self.yield_prediction_plot.line(source=self.prediction_series.source, x="date", y="predicted_yield", line_width=2, color="purple", legend_label="Prédiction")
+        # Ajouter un outil de survol pour les prédictions
+        self.yield_prediction_plot.add_tools(HoverTool(tooltips=[("Date", "@date{%F}"), ("Prédiction", "@predicted_yield")], formatters={"@date": "datetime"}))
+        self.yield_prediction_plot.legend.location = "top_left"
+
+        # Au zoom, relire les données à pleine résolution de la plage visible (avec le serveur Bokeh)
+        if interactive:
+            self.hist_series.attach(self.yield_history_plot)
+            self.ndvi_series.attach(self.ndvi_plot)
+            self.prediction_series.attach(self.yield_prediction_plot)
+
+        # Mise en page du tableau de bord : Les graphiques sont affichés dans une colonne
+        self.layout = column(
+            self.yield_history_plot,
+            self.ndvi_plot,
+            self.stress_matrix_plot,
+            self.yield_prediction_plot
+        )
+        return self.layout
+
+    def update_stress_matrix(self, new_rows):
+        """
+        Ajoute de nouvelles lignes combinées à la matrice de stress : seules les nouvelles lignes sont agrégées
+        et la source Bokeh ne reçoit que les cases modifiées (patch) ou nouvelles (stream).
+        :return: Nombre de valeurs envoyées
+        """
+        self.stress_grid.update(new_rows['stress_hydrique'], new_rows['meteo_condition'])
+        if list(self.stress_matrix_plot.y_range.factors) != self._stress_factors():
+            self.stress_matrix_plot.y_range.factors = self._stress_factors()
+        return _apply_delta(self.stress_source, self.stress_grid.to_source_data('count'), key='cell')
+
+    def _load_selection(self, parcelle_id, date_range):
+        """
+        Relit les données de la sélection et met à jour les sources existantes (patch ou remplacement).
+        """
+        from bokeh.models import FactorRange
+
+        self.parcelle_id, self.date_range = parcelle_id, date_range
+        monitoring_data, historique_rendements, combined_data = self._frames(parcelle_id, date_range)
+        sent = {
+            'rendements': self.hist_series.replace(historique_rendements),
+            'ndvi': self.ndvi_series.replace(monitoring_data),
+            'prediction': self.prediction_series.replace(monitoring_data),
+        }
+        self.stress_grid = self._stress_grid(combined_data)
+        if self.stress_grid is not None:
+            if isinstance(self.stress_matrix_plot.y_range, FactorRange) \
+                    and list(self.stress_matrix_plot.y_range.factors) != self._stress_factors():
+                self.stress_matrix_plot.y_range.factors = self._stress_factors()
+            sent['stress'] = _apply_delta(self.stress_source, self.stress_grid.to_source_data('count'), key='cell')
+        return sent
+
+    def select_parcelle(self, parcelle_id, date_range=None):
+        """
+        Affiche une autre parcelle ou période sans reconstruire les graphiques : les séries, réduites côté serveur
+        à la largeur des graphiques, sont remplacées ou corrigées (patch) dans les sources existantes, si bien que
+        le volume envoyé au navigateur (serveur Bokeh) ne dépend pas de la longueur de l'historique.
+        :param parcelle_id: Parcelle affichée (toutes si None)
+        :param date_range: Période affichée (début, fin), toute la période si None
+        :return: Nombre de points ou valeurs envoyés par graphique
+        """
+        if self.layout is None:
+            self.create_layout(parcelle_id, date_range)
+            return {}
+        if parcelle_id == self.parcelle_id and date_range == self.date_range:
+            return {}
+        sent = self._load_selection(parcelle_id, date_range)
+        if self.parcelle_select is not None:
+            self.parcelle_select.value = '' if parcelle_id is None else str(parcelle_id)
+        return sent
+
+    def stream_observations(self, rows):
+        """
+        Ajoute aux graphiques de nouvelles lignes de caractéristiques (ex. après append_observations) : seules ces
+        lignes sont envoyées aux séries NDVI et prédictions (stream) et seules les cases modifiées à la matrice
+        de stress (patch). Les lignes d'autres parcelles ou hors de la période affichée sont ignorées ; des lignes
+        qui ne suivent pas les dernières affichées (observations recalculées) entraînent une nouvelle lecture
+        de la sélection.
+        :param rows: Nouvelles lignes (colonnes de prepare_features)
+        :return: Nombre de points ou valeurs envoyés par graphique
+        """
+        if self.layout is None:
+            self.create_layout()
+            return {}
+        if self.parcelle_id is not None:
+            rows = rows[(rows['parcelle_id'] == self.parcelle_id).values]
+        if self.date_range is not None:
+            start, end = (pd.Timestamp(value) for value in self.date_range)
+            rows = rows[((rows['date'] >= start) & (rows['date'] <= end)).values]
+        if len(rows) == 0:
+            return {}
+
+        last = self.ndvi_series.last_x
+        if last is not None and rows['date'].min() <= last:
+            return self._load_selection(self.parcelle_id, self.date_range)
+        sent = {
+            'ndvi': self.ndvi_series.stream(rows),
+            'prediction': self.prediction_series.stream(rows),
+        }
+        if self.stress_grid is not None and {'stress_hydrique', 'meteo_condition'} <= set(rows.columns):
+            sent['stress'] = self.update_stress_matrix(rows)
+        return sent
+
+    def on_selection(self, callback):
+        """
+        Ajoute au-dessus des graphiques un champ de saisie de la parcelle (avec complétion) et appelle
+        callback(attr, old, new) à chaque changement de parcelle (serveur Bokeh requis). Le rappel est enregistré
+        à la création du champ seulement : un nouvel appel pour la même mise en page ne le duplique pas.
+        :return: Champ de sélection
+        """
+        from bokeh.models import AutocompleteInput
+
+        if self.layout is None:
+            self.create_layout()
+        if self.parcelle_select is None:
+            parcelles = self.data_manager.query(table='soil', columns=['parcelle_id'])['parcelle_id']
+            self.parcelle_select = AutocompleteInput(
+                title="Parcelle (vide : toutes)",
+                completions=sorted(str(parcelle_id) for parcelle_id in pd.unique(parcelles)),
+                value='' if self.parcelle_id is None else str(self.parcelle_id),
+                min_characters=1,
+                case_sensitive=False,
+            )
+            self.layout.children.insert(0, self.parcelle_select)
+            self.parcelle_select.on_change('value', callback)
+        return self.parcelle_select
+
+    def show(self):
+        """
+        Affiche le tableau de bord (dans un notebook ou un navigateur).
+        """
+        from bokeh.plotting import show  # Afficher les résultats
+
+        show(self.layout if self.layout is not None else self.create_layout())  # Affiche le tableau de bord avec tous les graphiques
+
+
+def load_data_manager(data_dir, use_cache=True):
+    """
+    Charge les quatre fichiers CSV du dossier de données dans un gestionnaire de données.
+    """
+    data_manager = AgriculturalDataManager()
+    data_manager.load_data(f"{data_dir}/monitoring_cultures.csv",  # Données de surveillance des cultures
+                           f"{data_dir}/meteo_detaillee.csv",  # Données météorologiques
+                           f"{data_dir}/sols.csv",  # Données sur les sols
+                           f"{data_dir}/historique_rendements.csv",  # Historique des rendements
+                           use_cache=use_cache)
+    return data_manager
+
+
+def prepare_dashboard_data(data_manager):
+    """
+    Calcule, s'ils ne le sont pas déjà, les caractéristiques (seuils NDVI), les scores de risque et les rendements
+    prédits affichés par le tableau de bord.
+    :return: Caractéristiques du gestionnaire, ou None en cas d'erreur
+    """
+    if data_manager.features is None:
+        data_manager.calculate_risk_metrics(data_manager.prepare_features())
+    if data_manager.features is not None and 'predicted_yield' not in data_manager.features.columns:
+        data_manager.predict_yields()
+    return data_manager.features
+
+
+def main():
+    """
+    Point d'entrée : python dashbord.py --data-dir data
+    """
+    from bokeh.plotting import output_file
+
+    parser = argparse.ArgumentParser(description="Tableau de bord Bokeh des données agricoles")
+    parser.add_argument('--data-dir', default='data', help="Dossier contenant les fichiers CSV")
+    parser.add_argument('--parcelle', default=None, help="Parcelle à afficher (toutes par défaut)")
+    parser.add_argument('--output', default='tableau_de_bord.html', help="Fichier HTML généré")
+    args = parser.parse_args()
+
+    data_manager = load_data_manager(args.data_dir)
+    prepare_dashboard_data(data_manager)
+    dashboard = AgriculturalDashboard(data_manager)
+    dashboard.create_layout(parcelle_id=args.parcelle, interactive=False)  # Fichier HTML autonome
+    output_file(args.output)
+    dashboard.show()
+
+
+if __name__ == '__main__':
+    main()
+elif __name__.startswith('bokeh_app_'):
+    # Lancement avec le serveur Bokeh (bokeh serve dashbord.py --args --data-dir data) : le zoom relit les données,
+    # et un changement de parcelle ne renvoie que les séries réduites de la nouvelle parcelle
+    from bokeh.io import curdoc
+
+    _parser = argparse.ArgumentParser()
+    _parser.add_argument('--data-dir', default='data')
+    _parser.add_argument('--parcelle', default=None)
+    _args, _ = _parser.parse_known_args()
+    _data_manager = load_data_manager(_args.data_dir)
+    prepare_dashboard_data(_data_manager)
+    _dashboard = AgriculturalDashboard(_data_manager)
+    _dashboard.create_layout(parcelle_id=_args.parcelle)
+    _dashboard.on_selection(lambda attr, old, new: _dashboard.select_parcelle(new or None, _dashboard.date_range))
+    curdoc().add_root(_dashboard.layout)
@@ -8,12 +8,306 @@ Original file is located at
 """
 
 import os
+import time
+import hashlib
+import argparse
+import tracemalloc
+import warnings
+import weakref
 import pandas as pd
 import numpy as np
-from sklearn.preprocessing import StandardScaler
-from sklearn.linear_model import LinearRegression
-import warnings
-warnings.filterwarnings('ignore')
+from instrumentation import Instrumentation, JsonLinesSink, PrometheusSink
+from ndvi_features import NDVIFeatureEngine, ndvi_column, ndvi_risk_scores
+
+# Colonnes converties en catégories lors du chargement (faible cardinalité)
+CATEGORICAL_COLUMNS = ('parcelle_id', 'zone', 'culture', 'crop_name', 'type_sol', 'meteo_condition')
+
+# Suffixe des fichiers de cache colonnaire écrits à côté des CSV sources
+CACHE_SUFFIX = '.cache.parquet'
+
+
+def _file_signature(path, with_hash=False):
+    """
+    Calcule la signature d'un fichier source (taille, date de modification et, si demandé, empreinte du contenu).
+    """
+    stat = os.stat(path)
+    signature = {'size': str(stat.st_size), 'mtime_ns': str(stat.st_mtime_ns)}
+    if with_hash:
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        signature['hash'] = digest.hexdigest()
+    return signature
+
+
+def _compact_dtypes(frame):
+    """
+    Applique des types compacts : catégories pour les identifiants, float32 pour les mesures.
+    """
+    for column in frame.columns:
+        if column in CATEGORICAL_COLUMNS and pd.api.types.is_string_dtype(frame[column].dtype):
+            frame[column] = frame[column].astype('category')
+        elif frame[column].dtype == np.float64:
+            frame[column] = frame[column].astype(np.float32)
+    return frame
+
+
+def read_csv_cached(path, parse_dates=None, use_cache=True, info=None):
+    """
+    Lit un CSV en passant par un cache Parquet placé à côté du fichier source.
+    Le cache est invalidé dès que la taille, la date de modification ou le contenu du CSV changent.
+    :param path: Chemin vers le fichier CSV
+    :param parse_dates: Colonnes à convertir en dates
+    :param use_cache: Désactive le cache si False
+    :param info: Dictionnaire optionnel complété avec le résultat du cache ('hit', 'hit_hash', 'miss', 'desactive')
+    :return: DataFrame avec des types compacts
+    """
+    info = {} if info is None else info
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        use_cache = False
+
+    cache_path = path + CACHE_SUFFIX
+    if use_cache and os.path.exists(cache_path):
+        try:
+            metadata = pq.read_schema(cache_path).metadata or {}
+            cached = {key.decode(): value.decode() for key, value in metadata.items()
+                      if key.decode() in ('size', 'mtime_ns', 'hash')}
+            signature = _file_signature(path)
+            if cached.get('size') == signature['size']:
+                if cached.get('mtime_ns') == signature['mtime_ns']:
+                    info['cache'] = 'hit'
+                    return pd.read_parquet(cache_path)
+                # Fichier touché ou copié sans modification : on compare l'empreinte du contenu
+                signature = _file_signature(path, with_hash=True)
+                if cached.get('hash') == signature['hash']:
+                    frame = pd.read_parquet(cache_path)
+                    _write_cache(frame, cache_path, signature)
+                    info['cache'] = 'hit_hash'
+                    return frame
+        except Exception as e:
+            print(f"Cache {cache_path} illisible, relecture du CSV : {e}")
+
+    info['cache'] = 'miss' if use_cache else 'desactive'
+    frame = _compact_dtypes(pd.read_csv(path, parse_dates=parse_dates))
+    if use_cache:
+        _write_cache(frame, cache_path, _file_signature(path, with_hash=True))
+    return frame
+
+
+def _write_cache(frame, cache_path, signature):
+    """
+    Écrit le cache Parquet de façon atomique avec la signature du fichier source dans ses métadonnées.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        metadata = dict(table.schema.metadata or {})
+        metadata.update({key.encode(): value.encode() for key, value in signature.items()})
+        tmp_path = cache_path + '.tmp'
+        pq.write_table(table.replace_schema_metadata(metadata), tmp_path)
+        os.replace(tmp_path, cache_path)
+    except Exception as e:
+        print(f"Impossible d'écrire le cache {cache_path} : {e}")
+
+
+def _years(values):
+    """
+    Convertit une colonne 'annee' (dates, entiers ou chaînes) en années numériques.
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values.dt.year
+    if pd.api.types.is_numeric_dtype(values):
+        return values
+    return pd.to_datetime(values, errors='coerce').dt.year
+
+
+def compute_grouped_trends(keys, x, y):
+    """
+    Calcule en une seule passe vectorisée la régression linéaire y = pente * x + ordonnee de chaque groupe.
+    Les sommes par groupe sont accumulées avec np.bincount (forme fermée des moindres carrés),
+    sur des valeurs centrées par groupe pour rester numériquement stable.
+    :param keys: Identifiant de groupe de chaque observation (ex. parcelle_id)
+    :param x: Variable explicative (ex. année)
+    :param y: Variable expliquée (ex. rendement)
+    :return: DataFrame indexé par groupe (pente, ordonnee, r2, rendement_moyen, n_annees)
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    valid = ~(np.isnan(x) | np.isnan(y))
+    codes, groups = pd.factorize(np.asarray(keys)[valid], sort=True)
+    x, y = x[valid], y[valid]
+    size = len(groups)
+
+    n = np.bincount(codes, minlength=size).astype(np.float64)
+    mean_x = np.bincount(codes, weights=x, minlength=size) / n
+    mean_y = np.bincount(codes, weights=y, minlength=size) / n
+    dx = x - mean_x[codes]
+    dy = y - mean_y[codes]
+    sxx = np.bincount(codes, weights=dx * dx, minlength=size)
+    sxy = np.bincount(codes, weights=dx * dy, minlength=size)
+    syy = np.bincount(codes, weights=dy * dy, minlength=size)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = np.where(sxx > 0, sxy / sxx, 0.0)
+        ss_res = np.maximum(syy - slope * sxy, 0.0)
+        # Même convention que LinearRegression.score : R² = 1 si les rendements sont constants
+        r2 = np.where(syy > 0, 1.0 - ss_res / syy, np.where(ss_res > 0, 0.0, 1.0))
+    r2 = np.where(n >= 2, r2, np.nan)
+
+    return pd.DataFrame({
+        'pente': slope,
+        'ordonnee': mean_y - slope * mean_x,
+        'r2': r2,
+        'rendement_moyen': mean_y,
+        'n_annees': n.astype(np.int64),
+    }, index=pd.Index(groups, name='parcelle_id'))
+
+
+def _align_categories(left, right, column):
+    """
+    Donne le même type à une clé de jointure des deux côtés (catégories unifiées si l'une est catégorielle).
+    """
+    left_dtype, right_dtype = left[column].dtype, right[column].dtype
+    if left_dtype == right_dtype:
+        return left, right
+    # Cas courant (ajout de lignes) : les valeurs d'un côté figurent déjà dans les catégories de l'autre ;
+    # seul ce côté est converti, sans parcourir l'autre
+    for dtype, other, is_left in ((left_dtype, right, False), (right_dtype, left, True)):
+        if isinstance(dtype, pd.CategoricalDtype) and other[column].dtype != dtype:
+            values = other[column].astype(dtype)
+            # Une valeur absente des catégories deviendrait manquante
+            if values.isna().sum() == other[column].isna().sum():
+                converted = other.assign(**{column: values})
+                return (converted, right) if is_left else (left, converted)
+    if isinstance(left_dtype, pd.CategoricalDtype) or isinstance(right_dtype, pd.CategoricalDtype):
+        categories = pd.Index(left[column].unique().dropna()).union(pd.Index(right[column].unique().dropna()))
+        dtype = pd.CategoricalDtype(categories)
+        if left_dtype != dtype:
+            left = left.assign(**{column: left[column].astype(object).astype(dtype)})
+        if right_dtype != dtype:
+            right = right.assign(**{column: right[column].astype(object).astype(dtype)})
+    return left, right
+
+
+def _concat_sorted(existing, new):
+    """
+    Insère de nouvelles lignes dans une table triée par date (en index ou en colonne)
+    en conservant les types catégoriels et l'ordre chronologique.
+    """
+    indexed = 'date' not in existing.columns and existing.index.name == 'date'
+    new = _compact_dtypes(new.reset_index() if 'date' not in new.columns else new.copy())
+    new['date'] = pd.to_datetime(new['date'])
+    new = new.sort_values('date', kind='mergesort')
+    if indexed:
+        new = new.set_index('date')
+    for column in existing.columns:
+        if column in new.columns and isinstance(existing[column].dtype, pd.CategoricalDtype):
+            existing, new = _align_categories(existing, new, column)
+
+    dates = existing.index if indexed else existing['date'].values
+    new_dates = new.index if indexed else new['date'].values
+    appended = pd.concat([existing, new], ignore_index=not indexed)
+    # Cas courant : les nouvelles observations sont postérieures à l'historique, l'ordre est déjà bon
+    if len(dates) and len(new_dates) and new_dates[0] < dates[-1]:
+        appended = appended.sort_index(kind='mergesort') if indexed \
+            else appended.sort_values('date', kind='mergesort', ignore_index=True)
+    return appended
+
+
+def _sort_by_date(frame):
+    """
+    Trie une table par date (en index ou en colonne) en conservant sa forme.
+    """
+    if 'date' not in frame.columns and frame.index.name == 'date':
+        return frame.sort_index(kind='mergesort')
+    return frame.sort_values('date', kind='mergesort', ignore_index=True)
+
+
+def _date_tail(frame, start):
+    """
+    Lignes d'une table triée par date à partir de start (incluse), avec une colonne 'date' :
+    la première ligne est trouvée par recherche dichotomique et seules les lignes suivantes sont copiées.
+    """
+    indexed = 'date' not in frame.columns and frame.index.name == 'date'
+    if start is not None:
+        dates = frame.index if indexed else frame['date']
+        frame = frame.iloc[dates.searchsorted(pd.Timestamp(start), side='left'):]
+    return frame.reset_index() if indexed else frame.reset_index(drop=True)
+
+
+def _pseudo_uniform(frame, low, high, salt):
+    """
+    Valeurs pseudo-aléatoires uniformes et reproductibles, dérivées du couple (parcelle_id, date).
+    """
+    hashes = pd.util.hash_pandas_object(frame[['parcelle_id', 'date']], index=False).values
+    hashes = hashes ^ np.uint64((salt * 0x9E3779B97F4A7C15) % 2**64)
+    return low + (high - low) * ((hashes >> np.uint64(11)).astype(np.float64) / float(1 << 53))
+
+
+def _shard_ids(parcelle_ids, n_shards):
+    """
+    Numéro de partition stable de chaque parcelle (indépendant du processus et de l'ordre des données).
+    """
+    values = pd.Series(parcelle_ids).astype(str)
+    return (pd.util.hash_pandas_object(values, index=False).values % np.uint64(n_shards)).astype(np.int64)
+
+
+def _write_arrow(frame, path):
+    """
+    Écrit une table au format Arrow IPC (non compressé) pour une relecture par mappage mémoire.
+    """
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    with pa.OSFile(path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    return path
+
+
+def _read_arrow(path):
+    """
+    Relit une table Arrow IPC par mappage mémoire, sans copie ni désérialisation pickle.
+    """
+    import pyarrow as pa
+
+    with pa.memory_map(path, 'r') as source:
+        return pa.ipc.open_file(source).read_all().to_pandas()
+
+
+def _run_shard(task):
+    """
+    Exécute prepare_features, calculate_risk_metrics et get_yield_trends sur une partition de parcelles.
+    Les entrées et sorties transitent par des fichiers Arrow mappés en mémoire.
+    """
+    manager = AgriculturalDataManager()
+    manager.monitoring_data = _read_arrow(task['monitoring'])
+    manager.weather_data = _read_arrow(task['weather'])
+    manager.soil_data = _read_arrow(task['soil'])
+    manager.yield_history = _read_arrow(task['yield'])
+    manager.ndvi_engine = task['ndvi_engine']  # Seuils ajustés sur toutes les parcelles
+
+    features = manager.prepare_features(tolerance=task['tolerance'], by=task['by'])
+    if features is None:
+        raise RuntimeError(f"Échec de la préparation des caractéristiques pour la partition {task['shard']}")
+    manager.calculate_risk_metrics(features)
+    return (_write_arrow(features, task['features_out']),
+            _write_arrow(manager.get_yield_trends().reset_index(), task['trends_out']))
+
+
+def _dated(frame):
+    """
+    Retourne les données avec une colonne 'date' (index temporel remis en colonne), triées de façon stable.
+    """
+    if 'date' not in frame.columns and frame.index.name == 'date':
+        frame = frame.reset_index()
+    return frame.sort_values('date', kind='mergesort', ignore_index=True)
+
 
 class AgriculturalDataManager:
     def __init__(self):
@@ -24,15 +318,40 @@ class AgriculturalDataManager:
         self.weather_data = None
         self.soil_data = None
         self.yield_history = None
-        self.scaler = StandardScaler()
+        self._scaler = None
+        self._yield_trends = None
+        self._yield_groups = None
+        self.feature_report = []
+        self.features = None
+        self._feature_params = {'tolerance': '3D', 'by': None}
+        self.version = 0
+        self.last_change = None
+        self._spatial_index = None
+        self.instrumentation = Instrumentation()  # Désactivée tant qu'aucune sortie n'est configurée
+        self.store = None  # Stockage partitionné sur disque (open_partitioned / write_partitioned)
+        self.ndvi_engine = NDVIFeatureEngine()  # Seuils NDVI ajustés à la première préparation des caractéristiques
+        self.yield_model = None  # Modèle de prédiction des rendements (predict_yields)
+        self._sorted_tables = {}  # Tri par date de chaque table en mémoire, vérifié une fois par DataFrame
+        self.model_report = None
+
+    @property
+    def scaler(self):
+        """
+        StandardScaler de scikit-learn, importé et créé à la première utilisation.
+        """
+        if self._scaler is None:
+            from sklearn.preprocessing import StandardScaler
+            self._scaler = StandardScaler()
+        return self._scaler
 
-    def load_data(self, monitoring_path, weather_path, soil_path, yield_path):
+    def load_data(self, monitoring_path, weather_path, soil_path, yield_path, use_cache=True):
         """
         Charge les données à partir des chemins fournis.
         :param monitoring_path: Chemin vers le fichier monitoring_cultures.csv
         :param weather_path: Chemin vers le fichier meteo_detaillee.csv
         :param soil_path: Chemin vers le fichier sols.csv
         :param yield_path: Chemin vers le fichier historique_rendements.csv
+        :param use_cache: Utilise le cache Parquet à côté de chaque CSV (nécessite pyarrow)
         """
         try:
             # Vérifier si les fichiers existent
@@ -50,86 +369,738 @@ class AgriculturalDataManager:
                 return
 
             # Charger les données
-            self.monitoring_data = pd.read_csv(monitoring_path, parse_dates=['date'])
-            self.weather_data = pd.read_csv(weather_path, parse_dates=['date'])
-            self.soil_data = pd.read_csv(soil_path)
-            self.yield_history = pd.read_csv(yield_path, parse_dates=['annee'])
+            self.monitoring_data = self._load_csv('load.monitoring', monitoring_path, ['date'], use_cache)
+            self.weather_data = self._load_csv('load.weather', weather_path, ['date'], use_cache)
+            self.load_reference_data(soil_path, yield_path, use_cache=use_cache)
+            self.features = None
+            self.ndvi_engine.reset()
+            self.version += 1
+            self.last_change = {'version': self.version, 'parcelles': None, 'debut': None}
             print("Données chargées avec succès.")
         except Exception as e:
             print(f"Erreur lors du chargement des données : {e}")
 
+    def load_reference_data(self, soil_path, yield_path, use_cache=True):
+        """
+        Charge uniquement les données de référence (sols et historique des rendements), de petite taille.
+        Utilisé seul avant iter_features, qui lit le suivi et la météo par blocs.
+        :param soil_path: Chemin vers le fichier sols.csv
+        :param yield_path: Chemin vers le fichier historique_rendements.csv
+        :param use_cache: Utilise le cache Parquet à côté de chaque CSV (nécessite pyarrow)
+        """
+        for path in (soil_path, yield_path):
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"Le fichier {path} n'existe pas.")
+        self.soil_data = self._load_csv('load.soil', soil_path, None, use_cache)
+        self.yield_history = self._load_csv('load.yield', yield_path, ['annee'], use_cache)
+        self._yield_trends = None
+        self._yield_groups = None
+        self._spatial_index = None
+
+    def _load_csv(self, stage_name, path, parse_dates, use_cache):
+        """
+        Lit un fichier source (via le cache Parquet) en mesurant l'étape de chargement.
+        """
+        with self.instrumentation.stage(stage_name, fichier=path) as stage:
+            info = {}
+            frame = read_csv_cached(path, parse_dates=parse_dates, use_cache=use_cache, info=info)
+            stage.rows = len(frame)
+            stage.cache = info.get('cache')
+        return frame
+
+    def get_parcel_positions(self):
+        """
+        Retourne la position (latitude, longitude) de chaque parcelle, depuis les sols ou le suivi.
+        :return: DataFrame indexé par parcelle_id
+        """
+        for frame in (self.soil_data, self.monitoring_data):
+            if frame is None:
+                continue
+            if 'date' in frame.columns or frame.index.name == 'date':
+                frame = _dated(frame)
+            if {'parcelle_id', 'latitude', 'longitude'} <= set(frame.columns):
+                return frame.groupby('parcelle_id', observed=True)[['latitude', 'longitude']].last()
+        raise ValueError("Aucune coordonnée de parcelle (latitude, longitude) dans les données.")
+
+    def _frames_by_table(self):
+        return {'monitoring': self.monitoring_data, 'weather': self.weather_data, 'soil': self.soil_data,
+                'yield': self.yield_history, 'features': self.features}
+
+    def write_partitioned(self, root, n_buckets=64, row_group_size=2048):
+        """
+        Écrit les données chargées (et les caractéristiques si elles sont préparées) dans un stockage
+        Parquet partitionné par hachage de parcelle et par année, puis l'utilise pour les requêtes.
+        :param root: Dossier racine du stockage
+        :param n_buckets: Nombre de partitions de parcelles
+        :param row_group_size: Nombre maximal de lignes par groupe de lignes Parquet
+        """
+        from partitioned_store import PartitionedStore
+
+        with self.instrumentation.stage('store.write', racine=root) as stage:
+            frames = {name: frame for name, frame in self._frames_by_table().items() if frame is not None}
+            self.store = PartitionedStore.write(root, frames, n_buckets=n_buckets, row_group_size=row_group_size)
+            stage.rows = sum(len(frame) for frame in frames.values())
+        return self.store
+
+    def open_partitioned(self, root, tables=('soil', 'yield')):
+        """
+        Ouvre un stockage partitionné. Les tables listées sont chargées en mémoire (par défaut les sols
+        et l'historique des rendements, de petite taille) ; les autres restent sur disque et sont lues
+        par query, qui ne lit que les partitions, groupes de lignes et colonnes nécessaires.
+        :param root: Dossier racine du stockage
+        :param tables: Tables chargées entièrement en mémoire
+        """
+        from partitioned_store import PartitionedStore
+
+        self.store = PartitionedStore(root)
+        loaded = {name: self.store.query(name) for name in tables if name in self.store.tables}
+        self.monitoring_data = loaded.get('monitoring')
+        self.weather_data = loaded.get('weather')
+        self.soil_data = loaded.get('soil')
+        self.yield_history = loaded.get('yield')
+        self.features = loaded.get('features')
+        self._yield_trends = None
+        self._yield_groups = None
+        self._spatial_index = None
+        self.version += 1
+        self.last_change = {'version': self.version, 'parcelles': None, 'debut': None}
+        return self.store
+
+    def query(self, parcelle_ids=None, start=None, end=None, columns=None, table='monitoring'):
+        """
+        Lignes d'une table pour des parcelles et une période. Avec un stockage partitionné, les filtres
+        et la projection des colonnes sont appliqués à la lecture ; sinon, les données en mémoire sont filtrées.
+        :param parcelle_ids: Parcelle ou liste de parcelles (toutes si None)
+        :param start: Début de la période (incluse), sans limite si None
+        :param end: Fin de la période (incluse), sans limite si None
+        :param columns: Colonnes retournées (toutes si None)
+        :param table: 'monitoring', 'weather', 'soil', 'yield' ou 'features'
+        :return: DataFrame trié par date puis par parcelle
+        """
+        if isinstance(parcelle_ids, str):
+            parcelle_ids = [parcelle_ids]
+        with self.instrumentation.stage('query', table=table) as stage:
+            frame = self._frames_by_table().get(table)
+            if frame is None and self.store is not None and table in self.store.tables:
+                result = self.store.query(table, parcelle_ids=parcelle_ids, start=start, end=end, columns=columns)
+            elif frame is None:
+                raise ValueError(f"La table {table} n'est ni chargée ni disponible dans le stockage partitionné.")
+            else:
+                result = self._query_frame(frame, table, parcelle_ids, start, end, columns)
+            stage.rows = len(result)
+        return result
+
+    def _query_frame(self, frame, table, parcelle_ids, start, end, columns):
+        """
+        Équivalent en mémoire de PartitionedStore.query.
+        """
+        date_column = 'annee' if table == 'yield' else 'date'
+        sorted_dates = date_column == 'date' and (start is not None or end is not None) \
+            and self._date_sorted(table, frame)
+        if 'date' not in frame.columns and frame.index.name == 'date':
+            frame = frame.reset_index()
+        if sorted_dates:
+            # Table triée par date : la période est lue par recherche dichotomique, les autres filtres
+            # ne portent que sur les lignes de la période
+            lo = frame['date'].searchsorted(pd.Timestamp(start), side='left') if start is not None else 0
+            hi = frame['date'].searchsorted(pd.Timestamp(end), side='right') if end is not None else len(frame)
+            frame = frame.iloc[lo:hi]
+            start = end = None
+        mask = np.ones(len(frame), dtype=bool)
+        if parcelle_ids is not None and 'parcelle_id' in frame.columns:
+            ids = frame['parcelle_id']
+            if isinstance(ids.dtype, pd.CategoricalDtype):
+                # Comparaison des codes des catégories plutôt que des chaînes
+                wanted = ids.cat.categories.get_indexer(pd.Index(parcelle_ids, dtype=object))
+                mask &= np.isin(ids.cat.codes.values, wanted[wanted >= 0])
+            else:
+                mask &= ids.isin(parcelle_ids).values
+        if date_column in frame.columns and (start is not None or end is not None):
+            if date_column == 'annee':
+                # Historique annuel : la période est comparée aux années
+                values = _years(frame['annee'])
+                start, end = (pd.Timestamp(start).year if start is not None else None,
+                              pd.Timestamp(end).year if end is not None else None)
+            else:
+                values = frame['date']
+                start, end = (pd.Timestamp(start) if start is not None else None,
+                              pd.Timestamp(end) if end is not None else None)
+            if start is not None:
+                mask &= (values >= start).values
+            if end is not None:
+                mask &= (values <= end).values
+        # Tri après filtrage (sur bien moins de lignes), dans le même ordre que le stockage partitionné
+        result = frame.iloc[np.flatnonzero(mask)] if not mask.all() else frame
+        order = [column for column in (date_column, 'parcelle_id') if column in result.columns]
+        result = result.sort_values(order, kind='mergesort', ignore_index=True) if order else result
+        return result[list(columns)] if columns is not None else result.reset_index(drop=True)
+
+    def _sorted(self, frame, table):
+        """
+        Table triée par date : retournée telle quelle si elle l'est déjà, sinon triée (une seule fois, la table
+        triée remplaçant l'originale chez l'appelant).
+        """
+        if frame is None or self._date_sorted(table, frame):
+            return frame
+        frame = _sort_by_date(frame)
+        self._mark_sorted(table, frame)
+        return frame
+
+    def _mark_sorted(self, table, frame):
+        # Table triée par construction : la vérification est inutile
+        self._sorted_tables[table] = (weakref.ref(frame), True)
+
+    def _date_sorted(self, table, frame):
+        """
+        Vrai si la table est triée par date (vérifié une seule fois tant que la table n'est pas remplacée).
+        """
+        cached = self._sorted_tables.get(table)
+        if cached is None or cached[0]() is not frame:
+            dates = frame.index if 'date' not in frame.columns and frame.index.name == 'date' else frame['date']
+            cached = (weakref.ref(frame), bool(dates.is_monotonic_increasing))
+            self._sorted_tables[table] = cached
+        return cached[1]
+
+    def get_spatial_index(self):
+        """
+        Retourne l'index spatial des parcelles (plus proche voisin, rayon, rectangle), construit une seule fois.
+        """
+        if self._spatial_index is None:
+            from spatial_index import ParcelSpatialIndex
+            self._spatial_index = ParcelSpatialIndex.from_frame(self.get_parcel_positions())
+        return self._spatial_index
+
     def _setup_temporal_indices(self):
         """
         Configure les index temporels pour les différentes séries de données et vérifie leur cohérence.
         """
         try:
-            if self.monitoring_data is not None:
-                self.monitoring_data.set_index('date', inplace=True)
-            if self.weather_data is not None:
-                self.weather_data.set_index('date', inplace=True)
+            with self.instrumentation.stage('index') as stage:
+                if self.monitoring_data is not None:
+                    self.monitoring_data = self.monitoring_data.set_index('date').sort_index(kind='mergesort')
+                    stage.rows = len(self.monitoring_data)
+                if self.weather_data is not None:
+                    self.weather_data = self.weather_data.set_index('date').sort_index(kind='mergesort')
             print("Index temporels configurés avec succès.")
         except Exception as e:
             print(f"Erreur lors de la configuration des index temporels : {e}")
 
-    def prepare_features(self):
+    def _asof_key(self, monitoring, weather):
         """
-        Prépare les caractéristiques pour l’analyse en fusionnant les différentes sources de données.
+        Choisit la clé de localisation commune aux données de suivi et météo pour la jointure temporelle.
         """
-        try:
-            # Joindre les données météo avec les données de suivi
+        for key in ('parcelle_id', 'zone'):
+            if key in monitoring.columns and key in weather.columns:
+                return key
+        return None
+
+    def _yield_features(self):
+        """
+        Agrège l'historique des rendements en une ligne par parcelle (moyenne, tendance, dernier rendement).
+        """
+        trends = self.get_yield_trends()
+        history = self.yield_history.dropna(subset=['rendement'])
+        last_yield = history.iloc[np.argsort(_years(history['annee']).values, kind='stable')] \
+            .groupby('parcelle_id', observed=True)['rendement'].last()
+        features = pd.DataFrame({
+            'rendement_moyen': trends['rendement_moyen'],
+            'tendance_rendement': trends['pente'],
+            'r2_rendement': trends['r2'],
+            'n_annees': trends['n_annees'],
+            'dernier_rendement': last_yield.reindex(trends.index).values,
+        }, index=trends.index)
+        return features.reset_index()
+
+    def _record_stage(self, stage, frame, started, track_memory):
+        """
+        Enregistre le nombre de lignes, la mémoire et la durée d'une étape de prepare_features.
+        """
+        entry = {
+            'etape': stage,
+            'lignes': len(frame),
+            'colonnes': frame.shape[1],
+            'memoire_mo': frame.memory_usage(index=True).sum() / 2**20,
+            'duree_s': time.perf_counter() - started,
+        }
+        if track_memory:
+            entry['pic_memoire_mo'] = tracemalloc.get_traced_memory()[1] / 2**20
+            tracemalloc.reset_peak()
+        self.feature_report.append(entry)
+
+    def _join_weather(self, monitoring, weather, key, tolerance):
+        """
+        Associe à chaque observation la dernière mesure météo connue pour sa localisation.
+        Les deux tables doivent être triées par date.
+        """
+        with self.instrumentation.stage('merge.meteo') as stage:
+            if key is not None:
+                monitoring, weather = _align_categories(monitoring, weather, key)
             combined = pd.merge_asof(
-                self.monitoring_data.sort_index(),
-                self.weather_data.sort_index(),
-                left_index=True,
-                right_index=True
+                monitoring,
+                weather,
+                on='date',
+                by=key,
+                tolerance=pd.Timedelta(tolerance) if tolerance is not None else None,
+                suffixes=('', '_meteo')
             )
+            stage.rows = len(combined)
+        return combined
 
-            # Ajouter les données des sols par parcelle
-            combined = combined.merge(
-                self.soil_data,
-                on='parcelle_id',
-                how='left'
-            )
+    def _join_soil(self, combined, soil):
+        """
+        Ajoute les données des sols (une ligne par parcelle).
+        """
+        with self.instrumentation.stage('merge.sols') as stage:
+            combined, soil = _align_categories(combined, soil, 'parcelle_id')
+            combined = combined.merge(soil, on='parcelle_id', how='left', suffixes=('', '_sol'), validate='many_to_one')
+            stage.rows = len(combined)
+        return combined
 
-            # Enrichir avec l'historique des rendements
-            combined = combined.merge(
-                self.yield_history,
-                on='parcelle_id',
-                how='left'
-            )
+    def _join_yield_features(self, combined, yield_features):
+        """
+        Ajoute les caractéristiques agrégées de l'historique des rendements (une ligne par parcelle).
+        """
+        with self.instrumentation.stage('merge.rendements') as stage:
+            combined, yield_features = _align_categories(combined, yield_features, 'parcelle_id')
+            combined = combined.merge(yield_features, on='parcelle_id', how='left', validate='many_to_one')
+            stage.rows = len(combined)
+        return combined
+
+    def _add_default_columns(self, combined):
+        """
+        Ajoute des colonnes fictives pour 'stress_hydrique' et 'température' si elles n'existent pas.
+        Les valeurs sont tirées d'un hachage (parcelle, date) : elles ne dépendent ni de l'ordre des lignes
+        ni du découpage (blocs, ajouts incrémentaux, exécution parallèle).
+        """
+        if 'stress_hydrique' not in combined.columns:
+            combined['stress_hydrique'] = _pseudo_uniform(combined, 10, 30, salt=1)  # Valeurs fictives
+        if 'température' not in combined.columns:
+            combined['température'] = _pseudo_uniform(combined, 20, 40, salt=2)  # Valeurs fictives
+        return combined
+
+    def _add_ndvi_features(self, combined, context=None):
+        """
+        Ajoute les statistiques NDVI glissantes, les seuils historiques et les anomalies (NDVIFeatureEngine).
+        Les seuils sont ajustés sur toutes les données de suivi à la première utilisation.
+        :param context: Observations antérieures servant seulement à compléter les fenêtres glissantes
+        """
+        if ndvi_column(combined) is None:
+            return combined
+        with self.instrumentation.stage('ndvi') as stage:
+            if not self.ndvi_engine.fitted and self.monitoring_data is not None:
+                self.ndvi_engine.fit(self.monitoring_data)
+            combined = self.ndvi_engine.transform(combined, context)
+            stage.rows = len(combined)
+        return combined
+
+    def prepare_features(self, tolerance='3D', by=None, track_memory=False):
+        """
+        Prépare les caractéristiques pour l’analyse en fusionnant les différentes sources de données.
+        La météo est jointe par localisation (parcelle ou zone) avec la dernière observation antérieure,
+        et l'historique des rendements est joint sous forme agrégée (une ligne par parcelle),
+        de sorte que le résultat garde exactement une ligne par observation de suivi.
+        :param tolerance: Écart maximal entre une observation et la mesure météo associée
+        :param by: Clé de localisation pour la jointure météo (détectée automatiquement si None)
+        :param track_memory: Mesure le pic mémoire de chaque étape avec tracemalloc
+        """
+        self.feature_report = []
+        self._feature_params = {'tolerance': tolerance, 'by': by}
+        started_tracing = track_memory and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        try:
+            with self.instrumentation.stage('prepare_features') as stage:
+                started = time.perf_counter()
+                monitoring = _dated(self.monitoring_data)
+                weather = _dated(self.weather_data)
+                self._record_stage('suivi', monitoring, started, track_memory)
+
+                # Joindre les données météo avec les données de suivi (dernière mesure connue par localisation)
+                started = time.perf_counter()
+                key = by or self._asof_key(monitoring, weather)
+                combined = self._join_weather(monitoring, weather, key, tolerance)
+                self._record_stage('meteo', combined, started, track_memory)
+
+                # Ajouter les données des sols par parcelle
+                started = time.perf_counter()
+                combined = self._join_soil(combined, self.soil_data.drop_duplicates('parcelle_id', keep='last'))
+                self._record_stage('sols', combined, started, track_memory)
 
-            # Ajouter des colonnes fictives pour 'stress_hydrique' et 'température' si elles n'existent pas
-            if 'stress_hydrique' not in combined.columns:
-                combined['stress_hydrique'] = np.random.uniform(10, 30, size=len(combined))  # Valeurs fictives
-            if 'température' not in combined.columns:
-                combined['température'] = np.random.uniform(20, 40, size=len(combined))  # Valeurs fictives
+                # Enrichir avec les caractéristiques agrégées de l'historique des rendements
+                started = time.perf_counter()
+                combined = self._join_yield_features(combined, self._yield_features())
+                self._record_stage('rendements', combined, started, track_memory)
 
+                combined = self._add_default_columns(combined)
+
+                # Statistiques NDVI glissantes, seuils historiques et anomalies de toutes les parcelles
+                started = time.perf_counter()
+                combined = self._add_ndvi_features(combined)
+                self._record_stage('ndvi', combined, started, track_memory)
+                stage.rows = len(combined)
+            self.features = combined
             print("Caractéristiques préparées avec succès.")
             return combined
         except Exception as e:
             print(f"Erreur lors de la préparation des caractéristiques : {e}")
             return None
+        finally:
+            if started_tracing:
+                tracemalloc.stop()
+
+    def append_observations(self, monitoring=None, weather=None):
+        """
+        Ajoute de nouvelles observations de suivi et/ou météo sans tout recalculer.
+        Les lignes sont insérées dans les tables triées par date, puis les caractéristiques et les scores
+        de risque ne sont recalculés que pour les parcelles concernées, à partir de la date la plus ancienne
+        des nouvelles lignes. Seules les lignes récentes sont lues (recherche dichotomique sur les dates) et les
+        caractéristiques antérieures à cette date sont conservées sans être retriées.
+        Le compteur de version est incrémenté à chaque ajout.
+        :param monitoring: Nouvelles lignes de suivi (mêmes colonnes que monitoring_cultures.csv)
+        :param weather: Nouvelles lignes météo (mêmes colonnes que meteo_detaillee.csv)
+        :return: Description du changement (version, parcelles concernées, date de début, lignes recalculées)
+        """
+        new_rows = [frame for frame in (monitoring, weather) if frame is not None and len(frame)]
+        if not new_rows:
+            return self.last_change
+
+        with self.instrumentation.stage('append') as stage:
+            # Tables triées par date (triées une fois si besoin) : les nouvelles lignes y sont insérées, puis seules
+            # les lignes récentes sont lues par recherche dichotomique
+            self.monitoring_data = self._sorted(self.monitoring_data, 'monitoring')
+            self.weather_data = self._sorted(self.weather_data, 'weather')
+            if monitoring is not None and len(monitoring):
+                self.monitoring_data = _concat_sorted(self.monitoring_data, monitoring)
+                self._mark_sorted('monitoring', self.monitoring_data)
+                self._spatial_index = None  # De nouvelles parcelles ou positions peuvent apparaître
+            if weather is not None and len(weather):
+                self.weather_data = _concat_sorted(self.weather_data, weather)
+                self._mark_sorted('weather', self.weather_data)
+            start = min(pd.to_datetime(_dated(frame)['date']).min() for frame in new_rows)
+
+            tolerance = self._feature_params['tolerance']
+            context_start = self.ndvi_engine.context_start(start)
+            recent = _date_tail(self.monitoring_data, context_start)
+            recent_weather = _date_tail(self.weather_data,
+                                        start - pd.Timedelta(tolerance) if tolerance is not None else None)
+            key = self._feature_params['by'] or self._asof_key(recent, recent_weather)
+
+            # Parcelles touchées : nouvelles observations de suivi et parcelles rattachées aux nouvelles mesures météo
+            affected = np.zeros(len(recent), dtype=bool)
+            if monitoring is not None and len(monitoring):
+                affected |= recent['parcelle_id'].isin(_dated(monitoring)['parcelle_id'].unique()).values
+            if weather is not None and len(weather):
+                if key is None:
+                    affected[:] = True
+                else:
+                    affected |= recent[key].isin(_dated(weather)[key].unique()).values
+            window = affected & (recent['date'] >= start).values
+            parcelles = recent.loc[window, 'parcelle_id'].unique()
+
+            if self.features is None:
+                self.prepare_features(**self._feature_params)
+                self.calculate_risk_metrics(self.features)
+                recomputed = len(self.features)
+            else:
+                weather_rows = recent_weather
+                if key is not None:
+                    weather_rows = weather_rows[weather_rows[key].isin(recent.loc[window, key].unique())]
+
+                updated = self._join_weather(recent[window], weather_rows, key, tolerance)
+                updated = self._join_soil(updated, self.soil_data.drop_duplicates('parcelle_id', keep='last'))
+                updated = self._join_yield_features(updated, self._yield_features())
+                updated = self._add_default_columns(updated)
+                # Fenêtres glissantes complétées par les observations antérieures des mêmes parcelles
+                context = recent[affected & (recent['date'] < start).values]
+                updated = self._add_ndvi_features(updated, context)
+                self.calculate_risk_metrics(updated)
+                if self.yield_model is not None and 'predicted_yield' in self.features.columns:
+                    # Inférence seule pour les lignes recalculées (le modèle n'est réentraîné que par predict_yields)
+                    updated['predicted_yield'] = self.yield_model.predict(updated, self.yield_history)
+
+                # Seules les lignes à partir de start sont remplacées et retriées ; les plus anciennes sont recopiées
+                features = self._sorted(self.features, 'features')
+                split = features['date'].searchsorted(start, side='left')
+                head, tail = features.iloc[:split], features.iloc[split:]
+                tail = tail[~tail['parcelle_id'].isin(parcelles).values]
+                for column in features.columns:
+                    if column in updated.columns and isinstance(features[column].dtype, pd.CategoricalDtype):
+                        tail, updated = _align_categories(tail, updated, column)
+                        if head[column].dtype != tail[column].dtype:
+                            head, tail = _align_categories(head, tail, column)
+                tail = pd.concat([tail, updated], ignore_index=True).sort_values('date', kind='mergesort')
+                self.features = pd.concat([head, tail], ignore_index=True)
+                self._mark_sorted('features', self.features)
+                recomputed = len(updated)
+
+            self.version += 1
+            self.last_change = {
+                'version': self.version,
+                'parcelles': list(parcelles),
+                'debut': start,
+                'lignes_recalculees': recomputed,
+            }
+            stage.rows = recomputed
+        return self.last_change
+
+    def run_sharded(self, n_workers=None, n_shards=None, tolerance='3D', by=None):
+        """
+        Exécute le pipeline (caractéristiques, risque, tendances) en parallèle, partitionné par parcelle_id.
+        Les partitions sont transmises aux processus sous forme de fichiers Arrow mappés en mémoire,
+        et les résultats sont réassemblés dans l'ordre du traitement séquentiel (mêmes valeurs).
+        :param n_workers: Nombre de processus (par défaut, nombre de cœurs)
+        :param n_shards: Nombre de partitions (par défaut, n_workers)
+        :param tolerance: Écart maximal entre une observation et la mesure météo associée
+        :param by: Clé de localisation pour la jointure météo (détectée automatiquement si None)
+        :return: caractéristiques, métriques de risque et tendances des rendements
+        """
+        import tempfile
+        from concurrent.futures import ProcessPoolExecutor
+
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            print("pyarrow n'est pas installé : exécution séquentielle.")
+            features = self.prepare_features(tolerance=tolerance, by=by)
+            return features, self.calculate_risk_metrics(features), self.get_yield_trends()
+
+        n_workers = n_workers or os.cpu_count() or 1
+        n_shards = n_shards or n_workers
+
+        monitoring = _dated(self.monitoring_data)
+        monitoring['_ligne'] = np.arange(len(monitoring))  # Ordre du traitement séquentiel
+        weather = _dated(self.weather_data)
+        key = by or self._asof_key(monitoring, weather)
+        if not self.ndvi_engine.fitted:
+            self.ndvi_engine.fit(monitoring)
+
+        with tempfile.TemporaryDirectory(prefix='agri_shards_') as tmp:
+            monitoring_shards = _shard_ids(monitoring['parcelle_id'], n_shards)
+            yield_shards = _shard_ids(self.yield_history['parcelle_id'], n_shards)
+            soil_shards = _shard_ids(self.soil_data['parcelle_id'], n_shards)
+            weather_shards = _shard_ids(weather['parcelle_id'], n_shards) if key == 'parcelle_id' else None
+            # Météo par zone : une seule copie, mappée en mémoire par tous les processus
+            shared_weather = _write_arrow(weather, os.path.join(tmp, 'weather.arrow')) if weather_shards is None else None
+
+            tasks = []
+            for shard in range(n_shards):
+                rows = monitoring_shards == shard
+                if not rows.any() and not (yield_shards == shard).any():
+                    continue
+                path = os.path.join(tmp, f'{{}}_{shard}.arrow').format
+                tasks.append({
+                    'shard': shard,
+                    'monitoring': _write_arrow(monitoring[rows], path('monitoring')),
+                    'weather': shared_weather or _write_arrow(weather[weather_shards == shard], path('weather')),
+                    'soil': _write_arrow(self.soil_data[soil_shards == shard], path('soil')),
+                    'yield': _write_arrow(self.yield_history[yield_shards == shard], path('yield')),
+                    'tolerance': tolerance,
+                    'by': key,
+                    'ndvi_engine': self.ndvi_engine,
+                    'features_out': path('features'),
+                    'trends_out': path('trends'),
+                })
+
+            with ProcessPoolExecutor(max_workers=min(n_workers, max(len(tasks), 1))) as pool:
+                outputs = list(pool.map(_run_shard, tasks))
+
+            features = pd.concat([_read_arrow(features_path) for features_path, _ in outputs], ignore_index=True)
+            trends = pd.concat([_read_arrow(trends_path) for _, trends_path in outputs], ignore_index=True)
+
+        features = features.sort_values('_ligne', ignore_index=True).drop(columns='_ligne')
+        trends = trends.set_index('parcelle_id').sort_index()
+        self.features = features
+        return features, features[['parcelle_id', 'risk_score']], trends
+
+    def iter_features(self, monitoring_path, weather_path, chunksize=100_000, tolerance='3D', by=None):
+        """
+        Prépare les caractéristiques par blocs pour des fichiers de suivi plus volumineux que la mémoire.
+        Les deux CSV doivent être triés par date ; ils sont lus bloc par bloc et la dernière mesure météo
+        de chaque localisation est conservée d'un bloc à l'autre pour la jointure temporelle.
+        La mémoire utilisée dépend de la taille des blocs (et du nombre de localisations), pas du volume total.
+        Les sols et l'historique des rendements doivent être chargés (load_data ou load_reference_data).
+        Les seuils NDVI ne sont pas ajustés ici (l'ajustement garde toutes les observations en mémoire, environ
+        70 octets chacune) : ajuster manager.ndvi_engine au préalable sur un historique de référence, sinon
+        lower_threshold et upper_threshold valent NaN. Les observations nécessaires aux fenêtres glissantes
+        sont reportées entre les blocs.
+        :param monitoring_path: Chemin vers le fichier monitoring_cultures.csv
+        :param weather_path: Chemin vers le fichier meteo_detaillee.csv
+        :param chunksize: Nombre de lignes lues par bloc
+        :param tolerance: Écart maximal entre une observation et la mesure météo associée
+        :param by: Clé de localisation pour la jointure météo (détectée automatiquement si None)
+        :return: Générateur de couples (caractéristiques, métriques de risque) par bloc
+        """
+        soil = self.soil_data.drop_duplicates('parcelle_id', keep='last')
+        yield_features = self._yield_features()
+
+        weather_chunks = self._iter_sorted_chunks(weather_path, chunksize)
+        pending = None  # Mesures météo lues mais postérieures au bloc de suivi courant
+        carry = None  # Dernière mesure météo par localisation, reportée entre les blocs
+        weather_exhausted = False
+        key = by
+        if not self.ndvi_engine.fitted and self.monitoring_data is None:
+            print("Seuils NDVI non ajustés : lower_threshold et upper_threshold vaudront NaN "
+                  "(ajuster manager.ndvi_engine.fit(...) sur un historique avant la lecture par blocs).")
+        ndvi_context = None  # Observations NDVI nécessaires aux fenêtres glissantes du bloc suivant
+
+        for monitoring in self._iter_sorted_chunks(monitoring_path, chunksize):
+            last_date = monitoring['date'].iloc[-1]
+
+            # Lire la météo jusqu'à dépasser la dernière date du bloc de suivi
+            while not weather_exhausted and (pending is None or pending['date'].iloc[-1] <= last_date):
+                chunk = next(weather_chunks, None)
+                if chunk is None:
+                    weather_exhausted = True
+                else:
+                    pending = chunk if pending is None else pd.concat([pending, chunk], ignore_index=True)
+            if pending is None:
+                raise ValueError(f"Le fichier {weather_path} est vide.")
+
+            usable = pending['date'] <= last_date
+            weather = pending[usable] if carry is None else pd.concat([carry, pending[usable]], ignore_index=True)
+            pending = pending[~usable].reset_index(drop=True)
+
+            if key is None:
+                key = self._asof_key(monitoring, weather)
+            combined = self._join_weather(monitoring, weather, key, tolerance)
+            carry = (weather.groupby(key, observed=True, sort=False).tail(1) if key is not None
+                     else weather.tail(1)).reset_index(drop=True)
+
+            combined = self._join_soil(combined, soil)
+            combined = self._join_yield_features(combined, yield_features)
+            combined = self._add_default_columns(combined)
+            combined = self._add_ndvi_features(combined, ndvi_context)
+            column = ndvi_column(monitoring)
+            if column is not None:
+                recent = monitoring[['date', 'parcelle_id', column]]
+                recent = recent if ndvi_context is None else pd.concat([ndvi_context, recent], ignore_index=True)
+                ndvi_context = recent[recent['date'] >= self.ndvi_engine.context_start(last_date)].reset_index(drop=True)
+            yield combined, self.calculate_risk_metrics(combined)
+
+    def _iter_sorted_chunks(self, path, chunksize):
+        """
+        Lit un CSV par blocs en vérifiant que les dates sont croissantes d'un bloc à l'autre.
+        """
+        previous = None
+        for chunk in pd.read_csv(path, parse_dates=['date'], chunksize=chunksize):
+            chunk = _compact_dtypes(chunk)
+            dates = chunk['date']
+            if not dates.is_monotonic_increasing or (previous is not None and dates.iloc[0] < previous):
+                raise ValueError(f"Le fichier {path} doit être trié par date pour la lecture par blocs.")
+            previous = dates.iloc[-1]
+            yield chunk
 
     def calculate_risk_metrics(self, data):
         """
         Calcule les métriques de risque basées sur les conditions actuelles et l’historique.
+        Avec les caractéristiques NDVI (seuils historiques et anomalies), le score mesure l'écart du NDVI
+        sous les seuils de la parcelle et sa persistance dans la fenêtre glissante (0 à 100) ;
+        sinon, il reste la moyenne du stress hydrique et de la température.
         """
         try:
-            # Vérifier si les colonnes nécessaires sont présentes
-            if 'stress_hydrique' in data.columns and 'température' in data.columns:
-                data['risk_score'] = (data['stress_hydrique'] + data['température']) / 2
-                print("Métriques de risque calculées avec succès.")
-                return data[['parcelle_id', 'risk_score']]
-            else:
-                # Gestion des colonnes manquantes
-                print("Les colonnes nécessaires 'stress_hydrique' et 'température' ne sont pas présentes dans les données.")
-                # Appliquer des valeurs par défaut ou un calcul alternatif
-                data['risk_score'] = 0  # Valeur par défaut ou un calcul alternatif
-                return data[['parcelle_id', 'risk_score']]
+            with self.instrumentation.stage('risk') as stage:
+                stage.rows = len(data)
+                if 'lower_threshold' in data.columns and data['lower_threshold'].notna().any():
+                    data['risk_score'] = ndvi_risk_scores(data)
+                    print("Métriques de risque calculées avec succès.")
+                    return data[['parcelle_id', 'risk_score']]
+                # Vérifier si les colonnes nécessaires sont présentes
+                if 'stress_hydrique' in data.columns and 'température' in data.columns:
+                    data['risk_score'] = (data['stress_hydrique'] + data['température']) / 2
+                    print("Métriques de risque calculées avec succès.")
+                    return data[['parcelle_id', 'risk_score']]
+                else:
+                    # Gestion des colonnes manquantes
+                    print("Les colonnes nécessaires 'stress_hydrique' et 'température' ne sont pas présentes dans les données.")
+                    # Appliquer des valeurs par défaut ou un calcul alternatif
+                    data['risk_score'] = 0  # Valeur par défaut ou un calcul alternatif
+                    return data[['parcelle_id', 'risk_score']]
         except Exception as e:
             print(f"Erreur lors du calcul des métriques de risque : {e}")
             return None
 
+    def predict_yields(self, model_dir=None, alpha=1.0):
+        """
+        Prédit le rendement de la saison pour chaque observation (colonne 'predicted_yield' des caractéristiques)
+        avec une régression ridge entraînée sur les saisons dont le rendement est connu.
+        Le modèle est identifié par l'empreinte du contenu des données d'entraînement : il est réutilisé
+        (en mémoire ou depuis model_dir) tant que ces données n'ont pas changé, sinon réentraîné et enregistré.
+        :param model_dir: Dossier du stockage des modèles (<empreinte>.npz) ; en mémoire seulement si None
+        :param alpha: Pénalité ridge
+        :return: DataFrame (date, parcelle_id, predicted_yield), ou None en cas d'erreur ;
+                 le débit d'entraînement et d'inférence et l'erreur sur les données d'entraînement
+                 (rmse_entrainement, r2_entrainement) sont décrits dans self.model_report
+        """
+        from yield_model import ModelStore, YieldModel, training_key
+
+        try:
+            features = self.features if self.features is not None else self.prepare_features(**self._feature_params)
+            if features is None:
+                return None
+            report = {'lignes_entrainement': 0, 'entrainement_s': 0.0}
+
+            with self.instrumentation.stage('model.train') as stage:
+                key = training_key(features, self.yield_history, alpha)
+                store = ModelStore(model_dir) if model_dir is not None else None
+                if self.yield_model is not None and self.yield_model.key == key:
+                    model, report['cache'] = self.yield_model, 'memoire'
+                elif store is not None and (model := store.load(key)) is not None:
+                    report['cache'] = 'disque'
+                else:
+                    started = time.perf_counter()
+                    model = YieldModel(alpha=alpha).fit(features, self.yield_history)
+                    model.key = key
+                    report.update(cache='miss', lignes_entrainement=model.metrics['lignes'],
+                                  entrainement_s=time.perf_counter() - started)
+                    if store is not None:
+                        store.save(model)
+                stage.cache = report['cache']
+                stage.rows = report['lignes_entrainement']
+            self.yield_model = model
+
+            with self.instrumentation.stage('model.predict') as stage:
+                started = time.perf_counter()
+                features['predicted_yield'] = model.predict(features, self.yield_history)
+                report['prediction_s'] = time.perf_counter() - started
+                stage.rows = len(features)
+
+            # Erreur mesurée sur les saisons d'entraînement (pas sur des saisons mises de côté)
+            report.update(cle=key, lignes_prediction=len(features), rmse_entrainement=model.metrics['rmse'],
+                          r2_entrainement=model.metrics['r2'])
+            if report['entrainement_s'] > 0:
+                report['entrainement_lignes_par_s'] = report['lignes_entrainement'] / report['entrainement_s']
+            report['prediction_lignes_par_s'] = len(features) / max(report['prediction_s'], 1e-9)
+            self.model_report = report
+            if report['cache'] == 'miss':
+                print(f"Modèle de rendement entraîné sur {report['lignes_entrainement']} lignes "
+                      f"({report['entrainement_lignes_par_s']:.0f} lignes/s, "
+                      f"RMSE d'entraînement {model.metrics['rmse']:.2f} t/ha).")
+            else:
+                print(f"Modèle de rendement réutilisé ({report['cache']}, empreinte {key[:12]}).")
+            print(f"Rendements prédits pour {len(features)} observations ({report['prediction_lignes_par_s']:.0f} lignes/s).")
+            return features[['date', 'parcelle_id', 'predicted_yield']]
+        except Exception as e:
+            print(f"Erreur lors de la prédiction des rendements : {e}")
+            return None
+
+    def get_yield_trends(self):
+        """
+        Calcule la tendance des rendements de toutes les parcelles en une seule passe groupée.
+        Le résultat est conservé jusqu'au prochain chargement des données.
+        :return: DataFrame indexé par parcelle_id (pente, ordonnee, r2, rendement_moyen, n_annees)
+        """
+        with self.instrumentation.stage('trends') as stage:
+            stage.cache = 'hit' if self._yield_trends is not None else 'miss'
+            if self._yield_trends is None:
+                self._yield_trends = compute_grouped_trends(
+                    self.yield_history['parcelle_id'],
+                    _years(self.yield_history['annee']),
+                    self.yield_history['rendement']
+                )
+                self._yield_groups = self.yield_history.groupby('parcelle_id', observed=True, sort=False).indices
+            stage.rows = len(self._yield_trends)
+        return self._yield_trends
+
     def get_temporal_patterns(self, parcelle_id):
         """
         Analyse les patterns temporels (rendement au fil du temps) pour une parcelle spécifique.
@@ -137,59 +1108,103 @@ class AgriculturalDataManager:
         :return: historique des rendements et tendance (pente, variation moyenne)
         """
         try:
+            if self.yield_history is None and self.store is not None:
+                return self._temporal_patterns_from_store(parcelle_id)
+
+            trends = self.get_yield_trends()
+
             # Vérifier si la parcelle existe dans les données
-            if parcelle_id not in self.yield_history['parcelle_id'].values:
+            if parcelle_id not in trends.index:
                 print(f"La parcelle {parcelle_id} n'existe pas dans les données.")
                 return None, None
 
-            # Filtrer les données pour la parcelle spécifique
-            parcelle_data = self.yield_history[self.yield_history['parcelle_id'] == parcelle_id]
-
-            # Analyser la tendance des rendements (utilisation de régression linéaire simple par exemple)
-            parcelle_data['annee'] = pd.to_datetime(parcelle_data['annee'], errors='coerce').dt.year
-
-            # Enlever les valeurs NaN dans 'annee' si nécessaire
+            # Extraire les lignes de la parcelle à partir des index de groupes précalculés
+            parcelle_data = self.yield_history.iloc[self._yield_groups[parcelle_id]][['annee', 'rendement']]
+            parcelle_data['annee'] = _years(parcelle_data['annee'])
             parcelle_data = parcelle_data.dropna(subset=['annee', 'rendement'])
 
-            X = parcelle_data['annee'].values.reshape(-1, 1)  # Année
-            y = parcelle_data['rendement'].values  # Rendement
-
-            model = LinearRegression()
-            model.fit(X, y)
-
-            # Calcul de la pente et de la variation moyenne
+            # Tendance issue du calcul groupé (régression linéaire simple rendement ~ année)
             trend = {
-                'pente': model.coef_[0],
-                'variation_moyenne': model.score(X, y)
+                'pente': trends.at[parcelle_id, 'pente'],
+                'variation_moyenne': trends.at[parcelle_id, 'r2']
             }
 
             # Retourner l'historique des rendements et la tendance
-            return parcelle_data[['annee', 'rendement']], trend
+            return parcelle_data, trend
 
         except Exception as e:
             print(f"Erreur lors de l'analyse des patterns temporels : {e}")
             return None, None
 
-# Initialisation du gestionnaire de données
-data_manager = AgriculturalDataManager()
+    def _temporal_patterns_from_store(self, parcelle_id):
+        """
+        get_temporal_patterns sans historique en mémoire : seules les lignes de la parcelle sont lues sur disque.
+        """
+        parcelle_data = self.query(parcelle_id, columns=['annee', 'rendement'], table='yield')
+        parcelle_data['annee'] = _years(parcelle_data['annee'])
+        parcelle_data = parcelle_data.dropna(subset=['annee', 'rendement'])
+        if parcelle_data.empty:
+            print(f"La parcelle {parcelle_id} n'existe pas dans les données.")
+            return None, None
+
+        # Même régression que le calcul groupé, restreinte à une seule parcelle
+        trend = compute_grouped_trends(np.zeros(len(parcelle_data)), parcelle_data['annee'], parcelle_data['rendement'])
+        return parcelle_data, {'pente': trend['pente'].iloc[0], 'variation_moyenne': trend['r2'].iloc[0]}
+
+def main():
+    """
+    Point d'entrée : python data_manager.py --data-dir data --parcelle P001
+    """
+    warnings.filterwarnings('ignore')
+    parser = argparse.ArgumentParser(description="Analyse des données agricoles")
+    parser.add_argument('--data-dir', default='data', help="Dossier contenant les fichiers CSV")
+    parser.add_argument('--parcelle', default='P001', help="Parcelle dont la tendance de rendement est affichée")
+    parser.add_argument('--no-cache', action='store_true', help="Relit les CSV sans passer par le cache Parquet")
+    parser.add_argument('--partitionner', default=None, help="Écrit aussi les données dans ce stockage partitionné")
+    parser.add_argument('--modeles', default=None, help="Dossier où les modèles de rendement ajustés sont conservés")
+    parser.add_argument('--metriques', default=None, help="Fichier JSON lines recevant une mesure par étape")
+    parser.add_argument('--prometheus', default=None, help="Fichier texte Prometheus des mesures agrégées par étape")
+    parser.add_argument('--profil', action='append', default=[], help="Étape profilée avec cProfile (répétable)")
+    parser.add_argument('--tracemalloc', action='append', default=[], help="Étape suivie avec tracemalloc (répétable)")
+    args = parser.parse_args()
+
+    # Initialisation du gestionnaire de données
+    data_manager = AgriculturalDataManager()
+    sinks = ([JsonLinesSink(args.metriques)] if args.metriques else []) \
+        + ([PrometheusSink(args.prometheus)] if args.prometheus else [])
+    data_manager.instrumentation = Instrumentation(sinks, profile=args.profil, trace_memory=args.tracemalloc)
+
+    # Chargement des données
+    data_manager.load_data(os.path.join(args.data_dir, 'monitoring_cultures.csv'),
+                           os.path.join(args.data_dir, 'meteo_detaillee.csv'),
+                           os.path.join(args.data_dir, 'sols.csv'),
+                           os.path.join(args.data_dir, 'historique_rendements.csv'),
+                           use_cache=not args.no_cache)
+    if data_manager.monitoring_data is None:
+        data_manager.instrumentation.close()
+        return 1
+
+    # Préparation des caractéristiques
+    features = data_manager.prepare_features()
+    data_manager.predict_yields(model_dir=args.modeles)
+    if args.partitionner:
+        data_manager.write_partitioned(args.partitionner)
 
-# Chargement des données (remplacer par les vrais chemins d'accès)
-data_manager.load_data('/content/monitoring_cultures.csv',
-                       '/content/meteo_detaillee .csv',
-                       '/content/sols.csv',
-                       '/content/historique_rendements.csv')
+    # Vérification de l'existence de la parcelle avant
+    history, trend = data_manager.get_temporal_patterns(args.parcelle)
 
-# Préparation des caractéristiques
-features = data_manager.prepare_features()
+    # Calcul des métriques de risque
+    risk_metrics = data_manager.calculate_risk_metrics(features)
+    if risk_metrics is not None:
+        print(f"Score de risque moyen : {risk_metrics['risk_score'].mean():.2f}")
 
-# Vérification de l'existence de la parcelle avant
-parcelle_id = 'P001'
-history, trend = data_manager.get_temporal_patterns(parcelle_id)
+    # Affichage des résultats
+    if trend:
+        print(f"Tendance de rendement : {trend['pente']:.2f} tonnes/ha/an")
+        print(f"Variation moyenne : {trend['variation_moyenne']*100:.1f}%")
+    data_manager.instrumentation.close()
+    return 0
 
-# Calcul des métriques de risque
-risk_metrics = data_manager.calculate_risk_metrics(features)
 
-# Affichage des résultats
-if trend:
-    print(f"Tendance de rendement : {trend['pente']:.2f} tonnes/ha/an")
-    print(f"Variation moyenne : {trend['variation_moyenne']*100:.1f}%")
\ No newline at end of file
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+"""
+Réduction côté serveur des séries temporelles envoyées aux graphiques Bokeh.
+"""
+
+import numpy as np
+import pandas as pd
+
+def _as_float(values):
+    """
+    Convertit un axe (dates ou nombres) en float64 pour le découpage en intervalles.
+    """
+    values = np.asarray(values)
+    if np.issubdtype(values.dtype, np.datetime64):
+        return values.astype('datetime64[ns]').astype(np.int64).astype(np.float64)
+    return values.astype(np.float64)
+
+
+def minmax_indices(x, y, n_buckets):
+    """
+    Découpe l'axe x en n_buckets intervalles de même largeur et garde, dans chaque intervalle,
+    le premier point, le dernier, le minimum et le maximum de y (les pics restent visibles).
+    :param x: Abscisses triées (dates ou nombres)
+    :param y: Ordonnées, ou tableau 2D (une colonne par série partageant les mêmes abscisses)
+    :param n_buckets: Nombre d'intervalles, typiquement la largeur du graphique en pixels
+    :return: Indices triés des points conservés
+    """
+    x = _as_float(x)
+    y = np.asarray(y, dtype=np.float64)
+    if y.ndim == 1:
+        y = y[:, None]
+    n = len(x)
+    if n <= 4 * n_buckets:
+        return np.arange(n)
+
+    span = x[-1] - x[0]
+    buckets = np.minimum(((x - x[0]) / span * n_buckets).astype(np.int64), n_buckets - 1) if span > 0 \
+        else np.arange(n) * n_buckets // n
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    stops = np.r_[starts[1:], n]
+    keep = [starts, stops - 1]
+
+    lengths = stops - starts
+    for column in y.T:
+        # Les valeurs manquantes ne doivent être retenues ni comme minimum ni comme maximum
+        valid = ~np.isnan(column)
+        for values in (np.where(valid, column, np.inf), np.where(valid, -column, np.inf)):
+            # Intervalles contigus (x trié) : extremum par reduceat, puis première position qui l'atteint
+            extremum = np.minimum.reduceat(values, starts)
+            hits = np.flatnonzero(values == np.repeat(extremum, lengths))
+            keep.append(hits[np.r_[True, buckets[hits][1:] != buckets[hits][:-1]]])
+    return np.unique(np.concatenate(keep))
+
+
+def lttb_indices(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets : choisit n_out points qui préservent la forme visuelle de la série.
+    Chaque intervalle est traité en une opération vectorisée ; seule la boucle sur les intervalles reste en Python.
+    :param x: Abscisses triées (dates ou nombres)
+    :param y: Ordonnées
+    :param n_out: Nombre de points conservés (au moins 3)
+    :return: Indices triés des points conservés
+    """
+    x = _as_float(x)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(n_out - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+        next_start, next_stop = stop, edges[bucket + 2] if bucket + 2 < len(edges) else n
+        mean_x = x[next_start:next_stop].mean()
+        mean_y = np.nanmean(y[next_start:next_stop]) if next_stop > next_start else y[-1]
+        areas = np.abs((x[previous] - mean_x) * (y[start:stop] - y[previous])
+                       - (x[previous] - x[start:stop]) * (mean_y - y[previous]))
+        previous = start + int(np.nanargmax(areas)) if not np.all(np.isnan(areas)) else start
+        selected[bucket + 1] = previous
+    return selected
+
+
+def _same_values(old, new):
+    """
+    Vrai si deux colonnes ont les mêmes valeurs (NaN égaux).
+    """
+    old, new = np.asarray(old), np.asarray(new)
+    if old.shape != new.shape:
+        return False
+    if old.dtype.kind == 'f' and new.dtype.kind == 'f':
+        return bool(np.array_equal(old, new, equal_nan=True))
+    return bool(np.array_equal(old, new))
+
+
+class DownsampledSource:
+    def __init__(self, data, x, columns, width=800, method='minmax'):
+        """
+        Source Bokeh alimentée par une version réduite d'un DataFrame, recalculée pour la plage visible.
+        :param data: Données à pleine résolution
+        :param x: Colonne des abscisses (dates)
+        :param columns: Colonnes tracées (les autres colonnes utiles aux info-bulles peuvent y figurer aussi) ;
+                        les colonnes absentes des données sont remplies de NaN
+        :param width: Largeur du graphique en pixels (nombre d'intervalles de réduction)
+        :param method: 'minmax' (toutes les colonnes) ou 'lttb' (forme de la première colonne)
+        """
+        from bokeh.models import ColumnDataSource
+
+        self.x = x
+        self.columns = [column for column in columns if column != x]
+        self.width = width
+        self.method = method
+        self._range = (None, None)  # Plage affichée (mise à jour au zoom par attach)
+        self._streamed = 0  # Points ajoutés par stream depuis la dernière réduction
+        self._set_data(data)
+        self.source = ColumnDataSource(self._columns(self._reduce(self.data)))
+
+    def _set_data(self, data):
+        # Les lignes ajoutées par stream sont gardées en blocs et concaténées à la première lecture de data
+        self._blocks = [self._select(data).sort_values(self.x, kind='mergesort', ignore_index=True)]
+
+    def _select(self, frame):
+        # Colonnes de la source, manquantes remplies de NaN (ex. prédictions pas encore calculées)
+        return frame.reindex(columns=[self.x] + self.columns)
+
+    @property
+    def data(self):
+        """
+        Données à pleine résolution, triées sur l'axe x.
+        """
+        if len(self._blocks) > 1:
+            self._blocks = [pd.concat(self._blocks, ignore_index=True)]
+        return self._blocks[0]
+
+    @property
+    def _x_values(self):
+        return self.data[self.x].values
+
+    @property
+    def last_x(self):
+        """
+        Dernière abscisse des données (None si la série est vide).
+        """
+        last = self._blocks[-1]
+        return last[self.x].values[-1] if len(last) else None
+
+    @staticmethod
+    def _columns(frame):
+        # Copies modifiables : patch et stream modifient les colonnes de la source en place
+        return {column: frame[column].to_numpy(copy=True) for column in frame.columns}
+
+    def _reduce(self, frame):
+        if len(frame) == 0:
+            return frame
+        numeric = [column for column in self.columns
+                   if pd.api.types.is_numeric_dtype(frame[column]) and frame[column].notna().any()]
+        if self.method == 'lttb' and numeric:
+            indices = lttb_indices(frame[self.x].values, frame[numeric[0]].values, 2 * self.width)
+        else:
+            # Sans valeur à tracer (colonnes absentes ou vides), seuls le premier et le dernier point
+            # de chaque intervalle de l'axe x sont gardés
+            values = frame[numeric].values if numeric else np.empty((len(frame), 0))
+            indices = minmax_indices(frame[self.x].values, values, self.width)
+        return frame.iloc[indices]
+
+    def visible(self, start=None, end=None):
+        """
+        Données à pleine résolution de la plage [start, end], lue par recherche dichotomique sur l'axe trié.
+        """
+        lo = 0 if start is None else np.searchsorted(self._x_values, self._to_x(start), side='left')
+        hi = len(self._x_values) if end is None else np.searchsorted(self._x_values, self._to_x(end), side='right')
+        # Un point de part et d'autre pour que la ligne traverse les bords du graphique
+        return self.data.iloc[max(lo - 1, 0):min(hi + 1, len(self.data))]
+
+    def _to_x(self, value):
+        # Les bornes d'une plage Bokeh en datetime sont des millisecondes depuis l'époque
+        if np.issubdtype(self._x_values.dtype, np.datetime64) and isinstance(value, (int, float)):
+            return np.datetime64(int(value), 'ms').astype(self._x_values.dtype)
+        if np.issubdtype(self._x_values.dtype, np.datetime64):
+            return np.datetime64(pd.Timestamp(value)).astype(self._x_values.dtype)
+        return value
+
+    def refresh(self, start=None, end=None):
+        """
+        Remplace les données de la source par la plage visible réduite à la largeur du graphique.
+        """
+        self._streamed = 0
+        self.source.data = self._columns(self._reduce(self.visible(start, end)))
+
+    def stream(self, rows):
+        """
+        Ajoute des lignes à la série. Lorsqu'elles suivent les données déjà affichées, seules ces lignes (réduites
+        si elles sont nombreuses) sont envoyées au navigateur (ColumnDataSource.stream) ; sinon la série est réduite
+        à nouveau et remplacée.
+        :param rows: Nouvelles lignes (mêmes colonnes que les données)
+        :return: Nombre de points envoyés
+        """
+        rows = self._select(rows).sort_values(self.x, kind='mergesort', ignore_index=True)
+        if len(rows) == 0:
+            return 0
+        last = self.last_x
+        self._blocks.append(rows)
+        if last is not None and rows[self.x].values[0] < last:
+            # Insertion au milieu de la série : tri de l'ensemble, puis réduction complète
+            self._set_data(self.data)
+            self.refresh(*self._range)
+            return len(self.source.data[self.x])
+        reduced = self._columns(self._reduce(rows))
+        self._streamed += len(reduced[self.x])
+        if self._streamed > self.width:
+            # Autant de points ajoutés que de pixels : nouvelle réduction de la plage affichée
+            self.refresh(*self._range)
+            return len(self.source.data[self.x])
+        self.source.stream(reduced)
+        return len(reduced[self.x])
+
+    def replace(self, data):
+        """
+        Remplace les données de la série (ex. nouvelle parcelle sélectionnée), réduites sur la plage affichée.
+        Si la série réduite garde les mêmes abscisses, seules les colonnes dont les valeurs changent sont envoyées
+        (ColumnDataSource.patch).
+        :return: Nombre de points envoyés
+        """
+        self._set_data(data)
+        self._streamed = 0
+        reduced = self._columns(self._reduce(self.visible(*self._range)))
+        current = self.source.data
+        same_x = len(current.get(self.x, ())) == len(reduced[self.x]) \
+            and np.array_equal(np.asarray(current[self.x]), reduced[self.x])
+        if not same_x:
+            self.source.data = reduced
+            return len(reduced[self.x])
+        n = len(reduced[self.x])
+        patches = {column: [(slice(0, n), values)] for column, values in reduced.items()
+                   if column != self.x and not _same_values(current[column], values)}
+        if patches and n:
+            self.source.patch(patches)
+        return n if patches else 0
+
+    def attach(self, plot):
+        """
+        Relance la réduction à chaque zoom ou déplacement du graphique (serveur Bokeh requis).
+        """
+        def on_range_change(attr, old, new):
+            self._range = (plot.x_range.start, plot.x_range.end)
+            self.refresh(*self._range)
+
+        plot.x_range.on_change('start', on_range_change)
+        plot.x_range.on_change('end', on_range_change)
+        return self
+
@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+"""
+Instrumentation des étapes du pipeline (chargement, index, jointures, risque, tendances, couches de la carte) :
+durée, lignes, variation de mémoire et succès de cache, exportés vers des sorties interchangeables
+(lignes JSON, format texte Prometheus, mémoire). Désactivée, elle ne coûte qu'un appel de méthode par étape.
+"""
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+
+
+def current_rss_mb():
+    """
+    Mémoire résidente actuelle du processus en Mo (pic depuis le démarrage hors Linux).
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError, AttributeError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+
+def _matches(name, selection):
+    """
+    Indique si une étape est sélectionnée (True pour toutes, ou nom exact ou préfixe 'nom.').
+    """
+    if selection is True:
+        return True
+    return any(name == prefix or name.startswith(prefix + '.') for prefix in selection)
+
+
+class _NullStage:
+    """
+    Étape utilisée quand l'instrumentation est désactivée : une seule instance, qui ignore tout.
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    __slots__ = ('_instrumentation', 'name', 'labels', 'rows', 'cache',
+                 '_started', '_timestamp', '_rss', '_profiler', '_tracing', '_allocated')
+
+    def __init__(self, instrumentation, name, labels):
+        """
+        Mesure d'une étape ; rows et cache peuvent être renseignés pendant l'étape.
+        """
+        self._instrumentation = instrumentation
+        self.name = name
+        self.labels = labels
+        self.rows = None
+        self.cache = None
+        self._profiler = None
+        self._tracing = None
+
+    def __enter__(self):
+        instrumentation = self._instrumentation
+        self._rss = current_rss_mb()
+        if instrumentation.profile and _matches(self.name, instrumentation.profile):
+            # Un seul profileur actif à la fois : les étapes imbriquées sont incluses dans celui de l'étape parente
+            if instrumentation._claim_profiler():
+                self._profiler = cProfile.Profile()
+                self._profiler.enable()
+        if instrumentation.trace_memory and _matches(self.name, instrumentation.trace_memory):
+            self._tracing = 'propre' if not tracemalloc.is_tracing() else 'partage'
+            if self._tracing == 'propre':
+                tracemalloc.start()
+            self._allocated = tracemalloc.get_traced_memory()[0]
+        self._timestamp = time.time()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self._started
+        record = {
+            'etape': self.name,
+            'horodatage': self._timestamp,
+            'duree_s': duration,
+            'lignes': self.rows,
+            'memoire_delta_mo': current_rss_mb() - self._rss,
+            'cache': self.cache,
+            'statut': 'ok' if exc_type is None else f'erreur : {exc_type.__name__}',
+        }
+        if self._tracing is not None:
+            current, peak = tracemalloc.get_traced_memory()
+            record['memoire_allouee_mo'] = (current - self._allocated) / 2**20
+            if self._tracing == 'propre':
+                # Pic mesuré uniquement si l'étape a démarré le suivi (sinon il inclurait l'étape parente)
+                record['pic_memoire_mo'] = peak / 2**20
+                tracemalloc.stop()
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._instrumentation._release_profiler()
+            record['profil'] = self._instrumentation._profile_report(self.name, self._profiler)
+        record.update(self.labels)
+        self._instrumentation.emit(record)
+        return False
+
+
+class Instrumentation:
+    def __init__(self, sinks=(), enabled=None, profile=(), trace_memory=(), profile_top=20, profile_dir=None):
+        """
+        Point d'entrée de l'instrumentation, partagé par le gestionnaire de données et la carte.
+        :param sinks: Sorties recevant une mesure par étape (JsonLinesSink, PrometheusSink, MemorySink...)
+        :param enabled: Active les mesures (par défaut, dès qu'une sortie est fournie)
+        :param profile: Étapes profilées avec cProfile (noms ou préfixes, ou True pour toutes)
+        :param trace_memory: Étapes suivies avec tracemalloc (noms ou préfixes, ou True pour toutes)
+        :param profile_top: Nombre de fonctions retenues dans le résumé de profil
+        :param profile_dir: Dossier où écrire les profils complets (.prof) au lieu d'un résumé texte
+        """
+        self.sinks = list(sinks)
+        self.enabled = bool(self.sinks) if enabled is None else enabled
+        self.profile = profile
+        self.trace_memory = trace_memory
+        self.profile_top = profile_top
+        self.profile_dir = profile_dir
+        self._profiling = False
+        self._profiles = 0
+        self._lock = threading.Lock()
+
+    def stage(self, name, **labels):
+        """
+        Contexte mesurant une étape :
+            with instrumentation.stage('merge.meteo') as stage:
+                ...
+                stage.rows = len(combined)
+        :param name: Nom de l'étape, hiérarchique avec des points (ex. 'load.monitoring')
+        :param labels: Informations ajoutées telles quelles à la mesure (ex. fichier=...)
+        """
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name, labels)
+
+    def add_sink(self, sink):
+        self.sinks.append(sink)
+        self.enabled = True
+        return sink
+
+    def emit(self, record):
+        """
+        Transmet une mesure à toutes les sorties.
+        """
+        with self._lock:
+            for sink in self.sinks:
+                sink.write(record)
+
+    def close(self):
+        """
+        Vide et ferme les sorties.
+        """
+        for sink in self.sinks:
+            sink.close()
+
+    def _claim_profiler(self):
+        with self._lock:
+            if self._profiling:
+                return False
+            self._profiling = True
+            return True
+
+    def _release_profiler(self):
+        with self._lock:
+            self._profiling = False
+
+    def _profile_report(self, name, profiler):
+        """
+        Résumé texte des fonctions les plus coûteuses, ou chemin du profil complet si profile_dir est défini.
+        """
+        if self.profile_dir is not None:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            self._profiles += 1
+            path = os.path.join(self.profile_dir, f"{name}-{self._profiles}.prof")
+            profiler.dump_stats(path)
+            return path
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(self.profile_top)
+        return output.getvalue()
+
+
+class MemorySink:
+    def __init__(self):
+        """
+        Conserve les mesures en mémoire (tests, notebooks, tableau de bord).
+        """
+        self.records = []
+
+    def write(self, record):
+        self.records.append(record)
+
+    def close(self):
+        pass
+
+    def frame(self):
+        """
+        Mesures sous forme de DataFrame (une ligne par étape exécutée).
+        """
+        import pandas as pd
+
+        return pd.DataFrame(self.records)
+
+
+class JsonLinesSink:
+    def __init__(self, target):
+        """
+        Écrit une ligne JSON par étape.
+        :param target: Chemin du fichier (ouvert en ajout) ou flux texte déjà ouvert
+        """
+        self._own = isinstance(target, (str, os.PathLike))
+        self._stream = open(target, 'a', encoding='utf-8') if self._own else target
+
+    def write(self, record):
+        self._stream.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+        self._stream.flush()
+
+    def close(self):
+        if self._own:
+            self._stream.close()
+
+
+class PrometheusSink:
+    def __init__(self, path=None, prefix='agri'):
+        """
+        Agrège les mesures par étape au format texte d'exposition Prometheus.
+        :param path: Fichier réécrit (de façon atomique) après chaque étape, par exemple pour le collecteur
+                     textfile de node_exporter ; sinon, le texte est obtenu avec render()
+        :param prefix: Préfixe des noms de métriques
+        """
+        self.path = path
+        self.prefix = prefix
+        self._stages = {}
+
+    def write(self, record):
+        stage = self._stages.setdefault(record['etape'], {
+            'count': 0, 'duration': 0.0, 'rows': 0, 'errors': 0, 'memory': 0.0, 'cache': {}})
+        stage['count'] += 1
+        stage['duration'] += record['duree_s']
+        stage['rows'] += record['lignes'] or 0
+        stage['errors'] += record['statut'] != 'ok'
+        stage['memory'] = record['memoire_delta_mo'] * 2**20
+        if record['cache'] is not None:
+            stage['cache'][record['cache']] = stage['cache'].get(record['cache'], 0) + 1
+        if self.path is not None:
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(self.render())
+            os.replace(tmp_path, self.path)
+
+    def render(self):
+        """
+        Texte d'exposition Prometheus de toutes les étapes mesurées.
+        """
+        p = self.prefix
+        metrics = [
+            ('stage_duration_seconds', 'summary', "Durée des étapes du pipeline"),
+            ('stage_rows_total', 'counter', "Lignes produites par les étapes"),
+            ('stage_errors_total', 'counter', "Étapes terminées par une exception"),
+            ('stage_memory_delta_bytes', 'gauge', "Variation de mémoire résidente lors de la dernière exécution"),
+            ('stage_cache_total', 'counter', "Accès aux caches par résultat"),
+        ]
+        lines = []
+        for metric, kind, help_text in metrics:
+            lines += [f"# HELP {p}_{metric} {help_text}", f"# TYPE {p}_{metric} {kind}"]
+            for name, stage in sorted(self._stages.items()):
+                label = f'stage="{_escape(name)}"'
+                if metric == 'stage_duration_seconds':
+                    lines.append(f"{p}_{metric}_sum{{{label}}} {stage['duration']!r}")
+                    lines.append(f"{p}_{metric}_count{{{label}}} {stage['count']}")
+                elif metric == 'stage_rows_total':
+                    lines.append(f"{p}_{metric}{{{label}}} {stage['rows']}")
+                elif metric == 'stage_errors_total':
+                    lines.append(f"{p}_{metric}{{{label}}} {stage['errors']}")
+                elif metric == 'stage_memory_delta_bytes':
+                    lines.append(f"{p}_{metric}{{{label}}} {stage['memory']:.0f}")
+                else:
+                    for result, count in sorted(stage['cache'].items()):
+                        lines.append(f'{p}_{metric}{{{label},result="{_escape(result)}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def close(self):
+        pass
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
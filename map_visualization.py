@@ -1,19 +1,58 @@
-import folium
-from folium import plugins
-from branca.colormap import LinearColormap
+# Folium, branca, Bokeh et Streamlit sont importés à la première utilisation :
+# importer ce module (par exemple depuis un processus de calcul) reste rapide et sans effet de bord
+import html
+import json
 import pandas as pd
-from sklearn.linear_model import LinearRegression
 import numpy as np
-import streamlit as st
-from streamlit.components.v1 import html
-from bokeh.plotting import figure
-from bokeh.io import output_notebook, show
+from data_manager import compute_grouped_trends, _dated, _years
+from dashboard_cache import VersionedLRUCache
+
+# Codes hexadécimaux des 256 niveaux d'un canal de couleur
+_HEX_LEVELS = np.array([f'{level:02x}' for level in range(256)])
+
+# Couches de la carte pouvant être affichées ou masquées
+MAP_LAYERS = ('rendements', 'ndvi', 'risque')
+
+# Création d'un marqueur côté navigateur à partir d'une ligne [lat, lon, couleur, popup]
+_CIRCLE_MARKER_CALLBACK = """
+function (row) {
+    var marker = L.circleMarker(new L.LatLng(row[0], row[1]), {
+        radius: 6, color: row[2], fill: true, fillColor: row[2], fillOpacity: 0.7
+    });
+    marker.bindPopup(row[3]);
+    return marker;
+};
+"""
+
+
+def _html_text(values):
+    """
+    Convertit des valeurs en texte échappé pour le HTML des popups (identifiants, cultures, zones).
+    """
+    return pd.Series(values).astype(str).map(html.escape)
+
+
+def colormap_hex(colormap, values):
+    """
+    Applique une LinearColormap à un tableau de valeurs en une seule opération vectorisée.
+    :return: tableau de couleurs '#rrggbbaa' (mêmes valeurs que colormap(valeur))
+    """
+    values = np.clip(np.asarray(values, dtype=np.float64), colormap.vmin, colormap.vmax)
+    channels = np.asarray(colormap.colors, dtype=np.float64)
+    hex_color = np.full(len(values), '#', dtype='<U9')
+    for channel in range(4):
+        levels = (np.interp(values, colormap.index, channels[:, channel]) * 255.9999).astype(np.int64)
+        hex_color = np.char.add(hex_color, _HEX_LEVELS[levels])
+    return hex_color
+
 
 class AgriculturalMap:
     def __init__(self, data_manager):
         """
         Initialise la carte avec le gestionnaire de données
         """
+        from branca.colormap import LinearColormap
+
         self.data_manager = data_manager
         self.map = None
         self.yield_colormap = LinearColormap(
@@ -21,144 +60,335 @@ class AgriculturalMap:
             vmin=0,
             vmax=12  # Rendement maximum en tonnes/ha
         )
+        self.ndvi_colormap = LinearColormap(
+            colors=['saddlebrown', 'yellow', 'darkgreen'],
+            vmin=0,
+            vmax=1
+        )
+
+    def _viewport_parcels(self, frame, bounds):
+        """
+        Restreint une table indexée par parcelle_id aux parcelles visibles dans la fenêtre de la carte.
+        :param bounds: ((sud, ouest), (nord, est)), ou None pour toutes les parcelles
+        """
+        if bounds is None:
+            return frame
+        (south, west), (north, east) = bounds
+        visible = self.data_manager.get_spatial_index().within_bounds(south, west, north, east)
+        return frame[frame.index.isin(visible)]
+
+    def _add_marker_layer(self, positions, colors, popups, name):
+        """
+        Ajoute une couche de marqueurs regroupés, transmise au navigateur en un seul tableau de données.
+        """
+        from folium import plugins
+
+        data = list(zip(positions['latitude'].tolist(), positions['longitude'].tolist(),
+                        colors.tolist(), popups.tolist()))
+        plugins.FastMarkerCluster(data, callback=_CIRCLE_MARKER_CALLBACK, name=name).add_to(self.map)
 
     def create_base_map(self):
         """
         Crée la carte de base avec les couches appropriées
         """
-        first_row = self.data_manager.monitoring_cultures.iloc[0]  # Récupérer la première ligne pour centrer la carte
-        lat, lon = first_row['latitude'], first_row['longitude']
-        
+        positions = self.data_manager.get_parcel_positions()  # Centrer la carte sur l'ensemble des parcelles
+        lat, lon = positions['latitude'].mean(), positions['longitude'].mean()
+
         # Initialiser la carte avec Folium
+        import folium
         self.map = folium.Map(location=[lat, lon], zoom_start=10)
-    
-    def add_yield_history_layer(self):
+
+    def add_yield_history_layer(self, bounds=None):
         """
-        Ajoute une couche visualisant l’historique des rendements
+        Ajoute une couche visualisant l’historique des rendements (un marqueur par parcelle)
+        :param bounds: Fenêtre d'affichage ((sud, ouest), (nord, est)) ; seules les parcelles visibles sont ajoutées
         """
-        for _, row in self.data_manager.historique_rendements.iterrows():
-            lat, lon = row['latitude'], row['longitude']
-            yield_value = row['rendement']  # Colonne contenant le rendement
-            
-            # Ajouter le marqueur sur la carte avec une couleur en fonction du rendement
-            color = self.yield_colormap(yield_value)
-            folium.CircleMarker([lat, lon], radius=6, color=color, fill=True, fill_color=color, fill_opacity=0.7).add_to(self.map)
+        with self.data_manager.instrumentation.stage('carte.rendements') as stage:
+            trends = self._viewport_parcels(self.data_manager.get_yield_trends(), bounds)
+            positions = self.data_manager.get_parcel_positions()
+            parcels = trends.join(positions, how='inner').dropna(subset=['latitude', 'longitude'])
+
+            # Couleur et popup calculés pour toutes les parcelles à la fois
+            colors = colormap_hex(self.yield_colormap, parcels['rendement_moyen'].values)
+            names = _html_text(parcels.index).values
+            popups = ('<b>' + names + '</b><br><b>Rendement moyen:</b> '
+                      + parcels['rendement_moyen'].round(2).astype(str) + ' t/ha<br><b>Tendance:</b> '
+                      + np.where(parcels['pente'] > 0, 'Croissant', 'Décroissant'))
+            crops = self._recent_crops()
+            if crops is not None:
+                popups = popups + '<br><b>Cultures récentes:</b> ' \
+                    + crops.reindex(parcels.index.astype(str)).fillna('').values
+            self._add_marker_layer(parcels, colors, np.asarray(popups), 'Historique des rendements')
+            stage.rows = len(parcels)
 
-    def add_current_ndvi_layer(self):
+    def add_current_ndvi_layer(self, bounds=None):
         """
-        Ajoute une couche de la situation NDVI actuelle
+        Ajoute une couche de la situation NDVI actuelle (dernière mesure de chaque parcelle)
+        :param bounds: Fenêtre d'affichage ((sud, ouest), (nord, est)) ; seules les parcelles visibles sont ajoutées
         """
-        for _, row in self.data_manager.meteo_detaillee.iterrows():
-            lat, lon = row['latitude'], row['longitude']
-            ndvi_value = row['NDVI']  # Colonne contenant le NDVI actuel
-            
-            # Ajouter le marqueur sur la carte avec une couleur en fonction du NDVI
-            color = self.ndvi_colormap(ndvi_value)
-            folium.CircleMarker([lat, lon], radius=6, color=color, fill=True, fill_color=color, fill_opacity=0.7).add_to(self.map)
+        with self.data_manager.instrumentation.stage('carte.ndvi') as stage:
+            monitoring = _dated(self.data_manager.monitoring_data)
+            ndvi_column = 'ndvi' if 'ndvi' in monitoring.columns else 'NDVI'
+            columns = [ndvi_column] + (['zone'] if 'zone' in monitoring.columns else [])
+            latest = monitoring.dropna(subset=[ndvi_column]).groupby('parcelle_id', observed=True)[columns].last()
+            positions = self._viewport_parcels(self.data_manager.get_parcel_positions(), bounds)
+            parcels = positions.join(latest.rename(columns={ndvi_column: 'ndvi'}), how='inner') \
+                .dropna(subset=['latitude', 'longitude', 'ndvi'])
 
-    def add_risk_heatmap(self):
+            colors = colormap_hex(self.ndvi_colormap, parcels['ndvi'].values)
+            names = _html_text(parcels.index).values
+            popups = ('<b>' + names + '</b><br><b>NDVI:</b> '
+                      + parcels['ndvi'].round(3).astype(str))
+            if 'zone' in parcels.columns:
+                popups = popups + '<br><b>Zone:</b> ' + _html_text(parcels['zone']).values
+            self._add_marker_layer(parcels, colors, np.asarray(popups), 'NDVI actuel')
+            stage.rows = len(parcels)
+
+    def add_risk_heatmap(self, bounds=None):
         """
         Ajoute une carte de chaleur des zones à risque
+        :param bounds: Fenêtre d'affichage ((sud, ouest), (nord, est)) ; seules les parcelles visibles sont ajoutées
         """
-        risk_data = self.data_manager.sols[['latitude', 'longitude', 'risque']].dropna()  # Assure-toi d'avoir une colonne 'risque'
-        heat_data = [[row['latitude'], row['longitude'], row['risque']] for _, row in risk_data.iterrows()]
-        
-        folium.plugins.HeatMap(heat_data).add_to(self.map)
+        with self.data_manager.instrumentation.stage('carte.risque') as stage:
+            soil = self.data_manager.soil_data
+            if 'risque' in soil.columns and {'latitude', 'longitude'} <= set(soil.columns):
+                risk_data = soil[['parcelle_id', 'latitude', 'longitude', 'risque']].dropna().set_index('parcelle_id')
+            else:
+                # Sans colonne 'risque', utiliser le score de risque moyen calculé par parcelle
+                features = self.data_manager.features
+                risk = features.groupby('parcelle_id', observed=True)['risk_score'].mean().rename('risque')
+                risk_data = self.data_manager.get_parcel_positions().join(risk, how='inner').dropna()
+            risk_data = self._viewport_parcels(risk_data, bounds)
+            heat_data = risk_data[['latitude', 'longitude', 'risque']].to_numpy(dtype=np.float64).tolist()
+
+            from folium import plugins
+
+            plugins.HeatMap(heat_data).add_to(self.map)
+            stage.rows = len(heat_data)
 
     def _calculate_yield_trend(self, history):
         """
         Calcule la tendance des rendements pour une parcelle
         """
-        X = np.array(range(len(history))).reshape(-1, 1)  # Indices de l'historique
-        y = np.array(history['rendement'])  # Rendement
-        model = LinearRegression()
-        model.fit(X, y)
-        return model.coef_[0]  # Retourner la pente de la régression
-
-    def _create_yield_popup(self, history, mean_yield, trend):
-        """
-        Crée le contenu HTML du popup pour l’historique des rendements
-        """
-        crops = self._format_recent_crops(history)
-        popup_content = f"""
-        <b>Rendement moyen:</b> {mean_yield} t/ha<br>
-        <b>Tendance:</b> {'Croissant' if trend > 0 else 'Décroissant'}<br>
-        <b>Cultures récentes:</b> {crops}
-        """
-        return popup_content
+        # Réutiliser la table des tendances calculée pour toutes les parcelles
+        if 'parcelle_id' in history.columns and history['parcelle_id'].nunique() == 1:
+            trends = self.data_manager.get_yield_trends()
+            parcelle_id = history['parcelle_id'].iloc[0]
+            if parcelle_id in trends.index:
+                return trends.at[parcelle_id, 'pente']
 
-    def _format_recent_crops(self, history):
-        """
-        Formate la liste des cultures récentes pour le popup
-        """
-        crops = history['crop_name'].unique()
-        return ', '.join(crops)
+        # Historique isolé : régression sur les indices de l'historique
+        trend = compute_grouped_trends(np.zeros(len(history)), np.arange(len(history)), history['rendement'])
+        return trend['pente'].iloc[0] if len(trend) else 0.0  # Retourner la pente de la régression
 
-    def _create_ndvi_popup(self, row):
-        """
-        Crée le contenu HTML du popup pour les données NDVI actuelles
+    def _recent_crops(self):
         """
-        popup_content = f"""
-        <b>NDVI:</b> {row['NDVI']}<br>
-        <b>Zone:</b> {row['zone']}
+        Cultures de l'historique des rendements de chaque parcelle, dans l'ordre chronologique et sans doublons
+        (texte échappé pour les popups), ou None si l'historique n'indique pas les cultures.
+        :return: Series indexée par parcelle_id (chaînes)
         """
-        return popup_content
+        history = self.data_manager.yield_history
+        column = next((name for name in ('crop_name', 'culture') if name in history.columns), None)
+        if column is None:
+            return None
+        history = history.iloc[np.argsort(_years(history['annee']).values, kind='stable')]
+        crops = history.dropna(subset=[column]).drop_duplicates(['parcelle_id', column])
+        text = _html_text(crops[column]).values
+        return pd.Series(text, index=crops['parcelle_id'].astype(str).values).groupby(level=0).agg(', '.join)
 
 
 class IntegratedDashboard:
-    def __init__(self, data_manager):
+    def __init__(self, data_manager, cache_size=32):
         """
         Crée un tableau de bord intégré combinant
         graphiques Bokeh et carte Folium
+        :param cache_size: Nombre maximal d'éléments conservés dans le cache du tableau de bord
         """
+        from dashbord import AgriculturalDashboard
+
         self.data_manager = data_manager
         self.bokeh_dashboard = AgriculturalDashboard(data_manager)
         self.map_view = AgriculturalMap(data_manager)
+        self.selected_parcelle = None
+        self.cache = VersionedLRUCache(maxsize=cache_size)
 
-    def initialize_visualizations(self):
+    def initialize_visualizations(self, layers=MAP_LAYERS, bounds=None):
         """
         Initialise toutes les composantes visuelles
+        :param layers: Couches de la carte à afficher (parmi MAP_LAYERS)
+        :param bounds: Fenêtre d'affichage ((sud, ouest), (nord, est)) de la carte
         """
         self.map_view.create_base_map()
-        self.map_view.add_yield_history_layer()
-        self.map_view.add_current_ndvi_layer()
-        self.map_view.add_risk_heatmap()
+        if 'rendements' in layers:
+            self.map_view.add_yield_history_layer(bounds)
+        if 'ndvi' in layers:
+            self.map_view.add_current_ndvi_layer(bounds)
+        if 'risque' in layers:
+            self.map_view.add_risk_heatmap(bounds)
+
+    def _cached(self, name, params, builder):
+        """
+        Retourne un élément du cache, construit au besoin, pour la version courante des données.
+        """
+        return self.cache.get_or_compute(name, self.data_manager.version, params, builder)
+
+    def get_features(self):
+        """
+        Caractéristiques préparées, scores de risque et rendements prédits, recalculés seulement si les données
+        ont changé (le modèle de rendement n'est réentraîné que si ses données d'entraînement ont changé).
+        """
+        from dashbord import prepare_dashboard_data
+
+        return self._cached('caracteristiques', {}, lambda: prepare_dashboard_data(self.data_manager))
+
+    def get_trends(self):
+        """
+        Table des tendances de rendement de toutes les parcelles.
+        """
+        return self._cached('tendances', {}, self.data_manager.get_yield_trends)
+
+    def get_map_html(self, layers=MAP_LAYERS, bounds=None):
+        """
+        HTML de la carte Folium pour les couches et la fenêtre demandées.
+        """
+        def build():
+            self.get_features()  # La carte de chaleur s'appuie sur les scores de risque
+            self.initialize_visualizations(layers, bounds)
+            return self.map_view.map._repr_html_()  # Convertir la carte en HTML
+        return self._cached('carte_html', {'couches': tuple(layers), 'fenetre': bounds}, build)
+
+    def get_bokeh_json(self, parcelle_id=None, date_range=None):
+        """
+        Graphiques Bokeh sérialisés (json_item) pour la parcelle et la période sélectionnées.
+        Ils sont construits par un tableau de bord distinct, sans rappels Python : la mise en page interactive
+        (self.bokeh_dashboard, servie par setup_interactions) n'est pas modifiée.
+        """
+        from bokeh.embed import json_item
+        from dashbord import AgriculturalDashboard
+
+        def build():
+            self.get_features()  # Seuils NDVI et prédictions affichés par les graphiques
+            dashboard = AgriculturalDashboard(self.data_manager, width=self.bokeh_dashboard.width,
+                                              stress_range=self.bokeh_dashboard.stress_range)
+            layout = dashboard.create_layout(parcelle_id=parcelle_id, date_range=date_range, interactive=False)
+            return json.dumps(json_item(layout))
+        return self._cached('bokeh_json', {'parcelle': parcelle_id, 'periode': date_range}, build)
+
+    def get_period(self):
+        """
+        Première et dernière date des données de suivi (bornes du choix de la période), ou None sans données.
+        Lues une fois par version des données, en mémoire ou, à défaut, dans le stockage partitionné.
+        """
+        def build():
+            monitoring = self.data_manager.monitoring_data
+            if monitoring is not None:
+                dates = monitoring.index if 'date' not in monitoring.columns else monitoring['date']
+            elif self.data_manager.store is not None and 'monitoring' in self.data_manager.store.tables:
+                dates = self.data_manager.query(columns=['date'])['date']
+            else:
+                return None
+            start, end = pd.Timestamp(dates.min()), pd.Timestamp(dates.max())
+            return None if pd.isna(start) else (start.date(), end.date())
+        return self._cached('periode', {}, build)
 
     def create_streamlit_dashboard(self):
         """
-        Crée une interface Streamlit intégrant toutes les visualisations
+        Crée une interface Streamlit intégrant toutes les visualisations.
+        Chaque exécution de Streamlit relit la carte et les graphiques depuis le cache tant que
+        la version des données et les paramètres choisis (parcelle, période, couches) sont inchangés :
+        l'instance doit donc être conservée entre les exécutions (st.cache_resource).
         """
+        import streamlit as st
+        from streamlit.components.v1 import html
+        from bokeh.resources import CDN
+
         st.title("Tableau de Bord Agricole Intégré")
-        
-        # Ajouter les visualisations ici
+
+        # Paramètres choisis dans la barre latérale
+        trends = self.get_trends()
+        parcelle_id = st.sidebar.selectbox("Parcelle", [None] + list(trends.index))
+        period = self.get_period()
+        date_range = st.sidebar.date_input("Période", period) if period is not None else ()
+        date_range = tuple(str(day) for day in date_range) if len(date_range) == 2 else None
+        layers = tuple(layer for layer in MAP_LAYERS if st.sidebar.checkbox(f"Couche {layer}", value=True))
+
         st.subheader("Carte Agricole")
-        folium_map = self.map_view.map
-        
-        # Afficher la carte Folium dans Streamlit via HTML
-        folium_map_html = folium_map._repr_html_()  # Convertir la carte en HTML
-        html(folium_map_html, height=600)  # Intégrer la carte dans Streamlit
-        
+        html(self.get_map_html(layers), height=600)  # Intégrer la carte dans Streamlit
+
         st.subheader("Graphiques Bokeh")
-        self.bokeh_dashboard.show()  # Afficher les graphiques Bokeh ici
+        bokeh_html = CDN.render() + (
+            '<div id="graphiques"></div><script>'
+            f'Bokeh.embed.embed_item({self.get_bokeh_json(parcelle_id, date_range)}, "graphiques");</script>'
+        )
+        html(bokeh_html, height=1700, scrolling=True)
+
+        with st.sidebar.expander("Cache du tableau de bord"):
+            st.dataframe(self.cache.stats())
 
     def update_visualizations(self, parcelle_id):
         """
-        Met à jour toutes les visualisations pour une parcelle donnée
+        Met à jour toutes les visualisations pour une parcelle donnée : les graphiques Bokeh déjà affichés
+        ne reçoivent que les séries de la nouvelle parcelle (voir AgriculturalDashboard.select_parcelle)
+        :return: historique des rendements et tendance de la parcelle
+        """
+        self.selected_parcelle = parcelle_id
+        if self.bokeh_dashboard.layout is not None:
+            self.bokeh_dashboard.select_parcelle(parcelle_id, self.bokeh_dashboard.date_range)
+        if parcelle_id is None:
+            return None, None
+        return self.data_manager.get_temporal_patterns(parcelle_id)
+
+    def push_observations(self, monitoring=None, weather=None):
+        """
+        Ajoute de nouvelles observations (append_observations) et n'envoie aux graphiques Bokeh affichés que les
+        lignes recalculées de la parcelle sélectionnée. Avec le serveur Bokeh, à appeler depuis un rappel du document
+        (ex. doc.add_periodic_callback, ou doc.add_next_tick_callback depuis un autre fil d'exécution).
+        :return: Description du changement (voir append_observations)
         """
-        # Logique pour mettre à jour la carte et les graphiques en fonction de la parcelle sélectionnée
-        pass
+        self.get_features()  # Caractéristiques, risque et prédictions à jour avant l'ajout incrémental
+        change = self.data_manager.append_observations(monitoring, weather)
+        parcelle_id = self.bokeh_dashboard.parcelle_id
+        if self.bokeh_dashboard.layout is not None and (parcelle_id is None or parcelle_id in change['parcelles']):
+            rows = self.data_manager.query(parcelle_id, start=change['debut'], table='features')
+            self.bokeh_dashboard.stream_observations(rows)
+        return change
 
-    def setup_interactions(self):
-        """Configure les interactions entre les composantes"""
-        self.map_view.map.on_click(self.handle_map_hover)  # Lorsque la carte est survolée
+    def setup_interactions(self, doc=None):
+        """
+        Configure les interactions entre les composantes (serveur Bokeh) : la sélection d'une parcelle dans le champ
+        de saisie, ou par handle_map_hover depuis la carte, met à jour les graphiques sans les reconstruire.
+        :param doc: Document Bokeh auquel ajouter le tableau de bord (ex. curdoc()), ou None
+        :return: Mise en page Bokeh
+        """
+        layout = self.bokeh_dashboard.layout
+        if layout is None:
+            self.get_features()
+            self.bokeh_dashboard.create_layout(parcelle_id=self.selected_parcelle)
+        elif layout.document is not None and layout.document is not doc:
+            # Un modèle Bokeh n'appartient qu'à un seul document : nouvelle mise en page (et nouveau champ de sélection)
+            self.bokeh_dashboard.create_layout(self.bokeh_dashboard.parcelle_id, self.bokeh_dashboard.date_range)
         self.bokeh_dashboard.on_selection(self.handle_parcelle_selection)  # Lorsqu'une parcelle est sélectionnée
+        if doc is not None and self.bokeh_dashboard.layout.document is not doc:
+            doc.add_root(self.bokeh_dashboard.layout)
+        return self.bokeh_dashboard.layout
 
     def handle_parcelle_selection(self, attr, old, new):
         """Gère la sélection d’une nouvelle parcelle"""
-        # Mettre à jour les visualisations en fonction de la parcelle sélectionnée
-        pass
+        # Mettre à jour les visualisations en fonction de la parcelle sélectionnée (champ vide : toutes les parcelles)
+        parcelle_id = new or None
+        if parcelle_id != self.selected_parcelle:
+            self.update_visualizations(parcelle_id)
 
-    def handle_map_hover(self, feature):
+    def handle_map_hover(self, feature, max_distance_km=1.0):
         """Gère le survol d’une parcelle sur la carte"""
-        # Mettre en évidence la parcelle sur les graphiques
-        pass
+        # Position du curseur : événement Leaflet ({'latlng': {'lat', 'lng'}}) ou entité GeoJSON (lon, lat)
+        if 'latlng' in feature:
+            lat, lon = feature['latlng']['lat'], feature['latlng']['lng']
+        else:
+            lon, lat = feature['geometry']['coordinates'][:2]
+
+        # Mettre en évidence la parcelle la plus proche sur les graphiques
+        parcelle_id, _ = self.data_manager.get_spatial_index().nearest(lat, lon, max_distance_km=max_distance_km)
+        if parcelle_id is not None:
+            self.update_visualizations(parcelle_id)
+        return parcelle_id
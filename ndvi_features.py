@@ -0,0 +1,353 @@
+# -*- coding: utf-8 -*-
+"""
+Caractéristiques NDVI calculées pour toutes les parcelles en passes groupées vectorisées :
+statistiques glissantes, seuils historiques (centiles par parcelle et période de la saison) et anomalies.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Colonnes ajoutées aux caractéristiques par NDVIFeatureEngine.transform
+NDVI_FEATURE_COLUMNS = ('ndvi_moyenne_glissante', 'ndvi_ecart_type_glissant', 'ndvi_n_glissant', 'ndvi_zscore',
+                        'lower_threshold', 'upper_threshold', 'ndvi_anomalie', 'ndvi_sous_seuil_glissant')
+
+# Décalage appliqué aux codes de parcelle pour former une clé (parcelle, seconde) triable en int64
+_KEY_SHIFT = 2**34
+
+
+def ndvi_column(frame):
+    """
+    Nom de la colonne NDVI ('ndvi' ou 'NDVI'), ou None si les données n'en ont pas.
+    """
+    for name in ('ndvi', 'NDVI'):
+        if name in frame.columns:
+            return name
+    return None
+
+
+def _parcel_codes(parcelle_ids):
+    """
+    Codes entiers et identifiants (chaînes) des parcelles ; les catégories sont converties une seule fois.
+    """
+    values = pd.Series(parcelle_ids)
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy(np.int64), values.cat.categories.astype(str)
+    codes, uniques = pd.factorize(values)
+    return codes.astype(np.int64), pd.Index(uniques).astype(str)
+
+
+def _day_of_year(dates):
+    """
+    Jour de l'année (1 à 366) de dates numpy ou pandas.
+    """
+    days = np.asarray(dates, dtype='datetime64[D]')
+    return (days - days.astype('datetime64[Y]')).astype(np.int64) + 1
+
+
+def _sortable_bits(values):
+    """
+    Entiers non signés de même ordre que des float32 (permet de trier groupe et valeur en une seule clé).
+    """
+    bits = values.astype(np.float32).view(np.uint32)
+    return np.where(bits >> np.uint32(31), ~bits, bits | np.uint32(0x80000000))
+
+
+def _float_from_bits(bits):
+    bits = bits.astype(np.uint32)
+    return np.where(bits >> np.uint32(31), bits & np.uint32(0x7FFFFFFF), ~bits).view(np.float32).astype(np.float64)
+
+
+def grouped_quantiles(groups, values, quantiles):
+    """
+    Centiles (interpolation linéaire, comme np.quantile) de chaque groupe en un seul tri :
+    groupe et valeur (float32) sont réunis dans une clé entière de 64 bits.
+    :param groups: Identifiant entier positif de groupe de chaque valeur (< 2**31)
+    :param values: Valeurs (les NaN sont ignorés)
+    :param quantiles: Centiles demandés, entre 0 et 1
+    :return: identifiants des groupes (triés), effectifs et tableau (groupes, centiles)
+    """
+    valid = ~np.isnan(values)
+    keys = (groups[valid].astype(np.uint64) << np.uint64(32)) | _sortable_bits(values[valid]).astype(np.uint64)
+    keys.sort()
+    return _sorted_key_quantiles(keys, quantiles)
+
+
+def _sorted_key_quantiles(keys, quantiles):
+    """
+    Centiles de chaque groupe à partir de clés triées (groupe << 32 | bits de la valeur) : seules les valeurs
+    encadrant chaque centile sont décodées.
+    """
+    groups = keys >> np.uint64(32)
+    starts = np.flatnonzero(np.concatenate(([True], groups[1:] != groups[:-1]))) if len(groups) else \
+        np.zeros(0, dtype=np.int64)
+    ids = groups[starts].astype(np.int64)
+    del groups
+    counts = np.diff(np.append(starts, len(keys)))
+    result = np.empty((len(ids), len(quantiles)))
+    for column, q in enumerate(quantiles):
+        position = (counts - 1) * q
+        below = np.floor(position).astype(np.int64)
+        above = np.minimum(below + 1, counts - 1)
+        low = _float_from_bits(keys[starts + below] & np.uint64(0xFFFFFFFF))
+        high = _float_from_bits(keys[starts + above] & np.uint64(0xFFFFFFFF))
+        result[:, column] = low + (position - below) * (high - low)
+    return ids, counts, result
+
+
+def rolling_window_sums(keys, blocks, columns, window_s):
+    """
+    Sommes glissantes par parcelle sur une fenêtre temporelle ]t - window, t] (comme rolling('28D') de pandas),
+    calculées par différences de sommes cumulées : aucune boucle sur les parcelles ni sur les lignes.
+    Les sommes cumulées repartent de zéro à chaque segment (parcelle, bloc de temps de la largeur de la fenêtre) ;
+    une fenêtre couvre au plus le bloc courant et le précédent, si bien que chaque somme ne dépend que des
+    observations de la parcelle dans ces deux blocs, quelles que soient les autres lignes traitées.
+    :param keys: Clés triées code de parcelle * _KEY_SHIFT + secondes depuis une origine commune
+    :param blocks: Bloc de temps de chaque clé (secondes depuis l'epoch // window_s)
+    :param columns: Tableaux à sommer (même longueur, dans l'ordre des clés)
+    :param window_s: Largeur de la fenêtre en secondes
+    :return: liste des sommes glissantes, dans l'ordre de columns
+    """
+    starts = np.searchsorted(keys, keys - window_s, side='right')
+    parcels = keys // _KEY_SHIFT
+    boundaries = np.ones(len(keys), dtype=bool)
+    boundaries[1:] = (parcels[1:] != parcels[:-1]) | (blocks[1:] != blocks[:-1])
+    segments = np.cumsum(boundaries) - 1
+    segment_starts = np.flatnonzero(boundaries)
+    first = segment_starts[segments]
+    # Fenêtre commençant dans le segment précédent (même parcelle, bloc précédent)
+    spills = starts < first
+    window_first = np.where(spills, segment_starts[np.maximum(segments - 1, 0)], first)
+    previous_last = np.maximum(first - 1, 0)
+    before_window = np.maximum(starts - 1, 0)
+
+    cumulative = pd.DataFrame({i: values for i, values in enumerate(columns)}, dtype=np.float64) \
+        .groupby(segments, sort=False).cumsum().to_numpy()
+    sums = []
+    for i in range(len(columns)):
+        values = cumulative[:, i]
+        # Somme du début de la fenêtre à la ligne : fin du segment précédent éventuel + segment courant
+        sums.append(values + np.where(spills, values[previous_last], 0.0)
+                    - np.where(starts > window_first, values[before_window], 0.0))
+    return sums
+
+
+class NDVIFeatureEngine:
+    def __init__(self, window='28D', season_bin_days=14, quantiles=(0.1, 0.9), neighbour_bins=1,
+                 min_observations=5):
+        """
+        Moteur de caractéristiques NDVI.
+        :param window: Fenêtre des statistiques glissantes (durée pandas, ex. '28D')
+        :param season_bin_days: Largeur (jours) des périodes de la saison sur lesquelles portent les seuils
+        :param quantiles: Centiles du seuil bas et du seuil haut
+        :param neighbour_bins: Périodes voisines incluses de part et d'autre pour estimer les seuils
+        :param min_observations: Effectif minimal d'une parcelle sur une période ; en dessous, les seuils
+                                 de la période calculés sur toutes les parcelles sont utilisés
+        """
+        self.window = window
+        self.season_bin_days = season_bin_days
+        self.quantiles = quantiles
+        self.neighbour_bins = neighbour_bins
+        self.min_observations = min_observations
+        self.n_bins = int(np.ceil(366 / season_bin_days))
+        self.reset()
+
+    def reset(self):
+        """
+        Oublie les seuils ajustés (à rappeler quand les données de référence changent).
+        """
+        self._parcels = None
+        self._group_ids = None
+        self._thresholds = None
+        self._pooled = None
+        self.n_observations = 0
+
+    @property
+    def fitted(self):
+        return self._thresholds is not None
+
+    def _window_seconds(self):
+        return int(pd.Timedelta(self.window).total_seconds())
+
+    def context_start(self, date):
+        """
+        Date à partir de laquelle les observations antérieures complètent les fenêtres glissantes des
+        observations postérieures à date (début du bloc de temps qui précède celui de date) :
+        transform(nouvelles lignes, contexte) donne alors exactement les valeurs d'un calcul complet.
+        """
+        window_s = self._window_seconds()
+        seconds = pd.Timestamp(date).value // 10**9
+        return pd.Timestamp((seconds // window_s - 1) * window_s, unit='s')
+
+    def _season_bins(self, dates):
+        return (_day_of_year(dates) - 1) // self.season_bin_days
+
+    def fit(self, monitoring):
+        """
+        Calcule les seuils historiques de NDVI par parcelle et période de la saison (centiles de toutes
+        les observations de la période et de ses voisines), et les seuils communs à toutes les parcelles.
+        Toutes les observations sont gardées en mémoire le temps du calcul (environ 70 octets chacune).
+        :param monitoring: Données de suivi (date, parcelle_id, ndvi), ou itérable de blocs de ces données
+        :return: self
+        """
+        frames = [monitoring] if isinstance(monitoring, pd.DataFrame) else monitoring
+        parcels, bins, values = [], [], []
+        for frame in frames:
+            if 'date' not in frame.columns and frame.index.name == 'date':
+                frame = frame.reset_index()
+            column = ndvi_column(frame)
+            if column is None:
+                continue
+            # Représentation compacte : identifiant catégoriel, période (int16) et valeur (float32)
+            codes, categories = _parcel_codes(frame['parcelle_id'])
+            parcels.append(pd.Categorical.from_codes(codes, categories))
+            bins.append(self._season_bins(frame['date']).astype(np.int16))
+            values.append(frame[column].to_numpy(dtype=np.float32, na_value=np.nan))
+        self.reset()
+        if not parcels:
+            return self
+
+        parcels = pd.api.types.union_categoricals(parcels, sort_categories=True)
+        self._parcels = pd.Index(parcels.categories)
+        values = np.concatenate(values)
+        valid = ~np.isnan(values)
+        self.n_observations = int(valid.sum())
+        codes = parcels.codes[valid].astype(np.uint64)
+        bins = np.concatenate(bins)[valid]
+        bits = _sortable_bits(values[valid]).astype(np.uint64)
+        del parcels, values, valid
+
+        # Chaque observation compte pour sa période et ses voisines (saison circulaire) : une clé
+        # (parcelle, période, valeur) de 64 bits par observation et par période, triées en une seule fois
+        n, n_bins = len(bits), np.uint64(self.n_bins)
+        offsets = range(-self.neighbour_bins, self.neighbour_bins + 1)
+        keys = np.empty(n * len(offsets), dtype=np.uint64)
+        for i, offset in enumerate(offsets):
+            expanded_bins = ((bins.astype(np.int64) + offset) % self.n_bins).astype(np.uint64)
+            keys[i * n:(i + 1) * n] = ((codes * n_bins + expanded_bins) << np.uint64(32)) | bits
+        del codes, bins, bits, expanded_bins
+        keys.sort()
+        group_ids, counts, thresholds = _sorted_key_quantiles(keys, self.quantiles)
+        keep = counts >= self.min_observations
+        self._group_ids, self._thresholds = group_ids[keep], thresholds[keep]
+
+        # Seuils communs : mêmes clés, réduites à la période
+        groups = keys >> np.uint64(32)
+        groups %= n_bins
+        groups <<= np.uint64(32)
+        keys &= np.uint64(0xFFFFFFFF)
+        keys |= groups
+        del groups
+        keys.sort()
+        pooled_bins, _, pooled = _sorted_key_quantiles(keys, self.quantiles)
+        self._pooled = np.full((self.n_bins, len(self.quantiles)), np.nan)
+        self._pooled[pooled_bins] = pooled
+        return self
+
+    def thresholds_for(self, parcelle_ids, dates):
+        """
+        Seuils bas et haut applicables à chaque couple (parcelle, date).
+        Parcelles ou périodes sans historique suffisant : seuils communs de la période.
+        :return: tableaux (seuil bas, seuil haut)
+        """
+        codes, uniques = _parcel_codes(parcelle_ids)
+        return self._thresholds_for_codes(codes, uniques, dates)
+
+    def _thresholds_for_codes(self, codes, uniques, dates):
+        bins = self._season_bins(dates)
+        lower, upper = self._pooled[:, 0][bins], self._pooled[:, -1][bins]
+        if len(self._group_ids):
+            codes = self._parcels.get_indexer(uniques)[codes]
+            groups = codes * self.n_bins + bins
+            position = np.minimum(np.searchsorted(self._group_ids, groups), len(self._group_ids) - 1)
+            found = (codes >= 0) & (self._group_ids[position] == groups)
+            lower = np.where(found, self._thresholds[:, 0][position], lower)
+            upper = np.where(found, self._thresholds[:, -1][position], upper)
+        return lower, upper
+
+    def transform(self, frame, context=None):
+        """
+        Ajoute les caractéristiques NDVI à des observations, en une passe groupée sur toutes les parcelles :
+        moyenne, écart-type et effectif glissants, z-score, seuils historiques, anomalie (-1 sous le seuil bas,
+        1 au-dessus du seuil haut) et nombre d'observations sous le seuil bas dans la fenêtre.
+        Sans ajustement préalable (fit), les seuils valent NaN et aucune anomalie n'est signalée.
+        :param frame: Observations (date, parcelle_id, ndvi), dans n'importe quel ordre
+        :param context: Observations antérieures des mêmes parcelles, utilisées seulement pour compléter
+                        les fenêtres glissantes (mise à jour incrémentale de nouveaux jours) ; elles doivent
+                        couvrir les dates à partir de context_start(première date de frame)
+        :return: frame avec les colonnes NDVI_FEATURE_COLUMNS (mêmes lignes, même ordre)
+        """
+        column = ndvi_column(frame)
+        if column is None:
+            return frame
+        rows = frame.reset_index(drop=True) if 'date' in frame.columns else frame.reset_index()
+        n_context = 0
+        if context is not None and len(context):
+            context = context.reset_index() if 'date' not in context.columns else context
+            context = context[['date', 'parcelle_id', ndvi_column(context)]].set_axis(['date', 'parcelle_id', column], axis=1)
+            n_context = len(context)
+            rows = pd.concat([context, rows[['date', 'parcelle_id', column]]], ignore_index=True)
+
+        # Tri (parcelle, date) : chaque parcelle occupe une plage contiguë
+        codes, uniques = _parcel_codes(rows['parcelle_id'])
+        dates = pd.to_datetime(rows['date']).values
+        seconds = dates.astype('datetime64[s]').astype(np.int64)
+        keys = codes * _KEY_SHIFT + seconds - (seconds.min() if len(seconds) else 0)
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        values = rows[column].to_numpy(dtype=np.float64, na_value=np.nan)[order]
+        valid = ~np.isnan(values)
+
+        if self.fitted:
+            lower, upper = self._thresholds_for_codes(codes[order], uniques, dates[order])
+        else:
+            lower = upper = np.full(len(values), np.nan)
+        below = valid & (values < lower)
+        above = valid & (values > upper)
+
+        centered = np.where(valid, values - 0.5, 0.0)  # NDVI centré : sommes cumulées plus petites
+        window_s = self._window_seconds()
+        count, total, squares, below_count = rolling_window_sums(
+            keys, seconds[order] // window_s, [valid, centered, centered ** 2, below], window_s)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = total / count
+            variance = np.maximum(squares - total * mean, 0.0) / (count - 1)
+            std = np.where(count > 1, np.sqrt(variance), np.nan)
+            zscore = np.where(std > 0, (values - 0.5 - mean) / std, np.nan)
+
+        computed = {
+            'ndvi_moyenne_glissante': np.where(count > 0, mean + 0.5, np.nan),
+            'ndvi_ecart_type_glissant': std,
+            'ndvi_n_glissant': count.astype(np.int64),
+            'ndvi_zscore': zscore,
+            'lower_threshold': lower,
+            'upper_threshold': upper,
+            'ndvi_anomalie': above.astype(np.int8) - below.astype(np.int8),
+            'ndvi_sous_seuil_glissant': below_count.astype(np.int64),
+        }
+        # Retour à l'ordre d'origine, sans les lignes de contexte
+        inverse = np.empty_like(order)
+        inverse[order] = np.arange(len(order))
+        inverse = inverse[n_context:]
+        result = frame.copy()
+        for name, values in computed.items():
+            result[name] = values[inverse]
+        return result
+
+
+def ndvi_risk_scores(frame, deficit_weight=0.6):
+    """
+    Score de risque (0 à 100) tiré des caractéristiques NDVI : position du NDVI sous le seuil haut
+    (0 au-dessus du seuil haut, 50 au seuil bas, 100 à une largeur de bande sous le seuil bas)
+    et part des observations de la fenêtre glissante sous le seuil bas.
+    Les lignes sans NDVI ou sans seuils obtiennent NaN.
+    :param frame: Caractéristiques calculées par NDVIFeatureEngine.transform
+    :param deficit_weight: Poids de la position du NDVI (le reste va à la persistance sous le seuil bas)
+    """
+    ndvi = frame[ndvi_column(frame)].to_numpy(dtype=np.float64, na_value=np.nan)
+    lower = frame['lower_threshold'].to_numpy(dtype=np.float64)
+    upper = frame['upper_threshold'].to_numpy(dtype=np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        band = np.where(upper > lower, upper - lower, np.nan)
+        deficit = np.clip((upper - ndvi) / band, 0, 2) / 2
+        persistence = frame['ndvi_sous_seuil_glissant'].to_numpy(np.float64) / frame['ndvi_n_glissant'].to_numpy(np.float64)
+    return 100 * (deficit_weight * deficit + (1 - deficit_weight) * persistence)
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+Stockage Parquet partitionné par parcelle (hachage) et par année, interrogé avec pyarrow.dataset :
+les filtres sur les parcelles et les dates sont appliqués au stockage (élagage des partitions et des groupes
+de lignes par leurs statistiques) et seules les colonnes demandées sont lues.
+
+Disposition sur disque :
+    <racine>/partitionnement.json
+    <racine>/<table>/partition_parcelle=<b>/partition_annee=<a>/part-0.parquet
+"""
+
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from data_manager import _compact_dtypes, _shard_ids, _years
+
+# Nom du fichier décrivant le partitionnement à la racine du stockage
+LAYOUT_FILE = 'partitionnement.json'
+
+# Colonnes de partition (répertoires Hive), retirées des résultats des requêtes
+PARCEL_PARTITION = 'partition_parcelle'
+YEAR_PARTITION = 'partition_annee'
+
+# Colonne temporelle de chaque table connue (None : table sans dimension temporelle)
+DATE_COLUMNS = {'monitoring': 'date', 'weather': 'date', 'soil': None, 'yield': 'annee', 'features': 'date'}
+
+
+def _is_timestamp(data_type):
+    import pyarrow as pa
+
+    return pa.types.is_timestamp(data_type)
+
+
+def _row_group_bytes(row_group, columns=None):
+    """
+    Taille compressée d'un groupe de lignes Parquet, limitée aux colonnes données si columns n'est pas None.
+    """
+    return sum(row_group.column(i).total_compressed_size for i in range(row_group.num_columns)
+               if columns is None or row_group.column(i).path_in_schema in columns)
+
+
+class PartitionedStore:
+    def __init__(self, root):
+        """
+        Ouvre un stockage partitionné existant (écrit par PartitionedStore.write).
+        :param root: Dossier racine du stockage
+        """
+        with open(os.path.join(root, LAYOUT_FILE), encoding='utf-8') as f:
+            layout = json.load(f)
+        self.root = root
+        self.n_buckets = layout['n_buckets']
+        self.tables = layout['tables']
+        self._datasets = {}
+
+    @classmethod
+    def write(cls, root, frames, n_buckets=64, row_group_size=2048):
+        """
+        Écrit des tables dans un stockage partitionné par hachage de parcelle_id et par année.
+        Chaque fichier est trié par parcelle puis par date, si bien que les statistiques min/max
+        des groupes de lignes permettent de ne lire que les groupes contenant la parcelle demandée.
+        :param root: Dossier racine du stockage (les tables déjà présentes sous les mêmes noms sont remplacées)
+        :param frames: Dictionnaire {nom de table: DataFrame} (ex. 'monitoring', 'weather', 'soil', 'yield')
+        :param n_buckets: Nombre de partitions de parcelles
+        :param row_group_size: Nombre maximal de lignes par groupe de lignes Parquet
+        :return: Stockage ouvert
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        os.makedirs(root, exist_ok=True)
+        layout_path = os.path.join(root, LAYOUT_FILE)
+        tables = {}
+        if os.path.exists(layout_path):
+            with open(layout_path, encoding='utf-8') as f:
+                previous = json.load(f)
+            if previous['n_buckets'] == n_buckets:
+                tables = previous['tables']
+
+        for name, frame in frames.items():
+            if frame is None:
+                continue
+            if 'date' not in frame.columns and frame.index.name == 'date':
+                frame = frame.reset_index()
+            frame = frame.copy()
+            # Identifiants en chaînes : les filtres et statistiques Parquet portent sur les valeurs
+            for column in frame.columns:
+                if isinstance(frame[column].dtype, pd.CategoricalDtype):
+                    frame[column] = frame[column].astype(str)
+
+            date_column = DATE_COLUMNS.get(name, 'date' if 'date' in frame.columns else None)
+            by_parcel = 'parcelle_id' in frame.columns
+            frame[PARCEL_PARTITION] = _shard_ids(frame['parcelle_id'], n_buckets) if by_parcel else 0
+            frame[YEAR_PARTITION] = _years(frame[date_column]).fillna(0).astype(np.int64) if date_column else 0
+            order = [PARCEL_PARTITION, YEAR_PARTITION] + (['parcelle_id'] if by_parcel else []) \
+                + ([date_column] if date_column else [])
+            frame = frame.sort_values(order, kind='mergesort', ignore_index=True)
+
+            # Écriture dans un dossier temporaire, puis remplacement de la table entière
+            table_dir = os.path.join(root, name)
+            tmp_dir = table_dir + '.tmp'
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            for (bucket, year), part in frame.groupby([PARCEL_PARTITION, YEAR_PARTITION], sort=False):
+                part_dir = os.path.join(tmp_dir, f"{PARCEL_PARTITION}={bucket}", f"{YEAR_PARTITION}={year}")
+                os.makedirs(part_dir, exist_ok=True)
+                table = pa.Table.from_pandas(part.drop(columns=[PARCEL_PARTITION, YEAR_PARTITION]),
+                                             preserve_index=False)
+                pq.write_table(table, os.path.join(part_dir, 'part-0.parquet'), row_group_size=row_group_size)
+            shutil.rmtree(table_dir, ignore_errors=True)
+            if os.path.exists(tmp_dir):
+                os.replace(tmp_dir, table_dir)
+            tables[name] = {'date': date_column, 'parcelle': by_parcel, 'lignes': len(frame)}
+
+        with open(layout_path, 'w', encoding='utf-8') as f:
+            json.dump({'n_buckets': n_buckets, 'tables': tables}, f, indent=2)
+        return cls(root)
+
+    def dataset(self, table):
+        """
+        Jeu de données pyarrow d'une table (ouvert une seule fois).
+        """
+        import pyarrow.dataset as ds
+
+        if table not in self.tables:
+            raise KeyError(f"Table inconnue dans le stockage {self.root} : {table}")
+        if table not in self._datasets:
+            self._datasets[table] = ds.dataset(os.path.join(self.root, table), format='parquet',
+                                               partitioning='hive')
+        return self._datasets[table]
+
+    def _filter(self, table, parcelle_ids, start, end):
+        """
+        Expression de filtre : partitions (hachage, année) puis valeurs (parcelle_id, dates).
+        """
+        import pyarrow.dataset as ds
+
+        layout = self.tables[table]
+        conditions = []
+        if parcelle_ids is not None and layout['parcelle']:
+            ids = [str(parcelle_id) for parcelle_id in pd.unique(pd.Series(parcelle_ids, dtype=object))]
+            conditions.append(ds.field(PARCEL_PARTITION).isin(np.unique(_shard_ids(ids, self.n_buckets)).tolist()))
+            conditions.append(ds.field('parcelle_id').isin(ids))
+
+        date_column = layout['date']
+        if date_column is not None:
+            # Colonne de dates : filtre exact ; colonne d'années (entiers) : filtre sur la partition seulement
+            exact = _is_timestamp(self.dataset(table).schema.field(date_column).type)
+            if start is not None:
+                start = pd.Timestamp(start)
+                conditions.append(ds.field(YEAR_PARTITION) >= start.year)
+                if exact:
+                    conditions.append(ds.field(date_column) >= start.to_pydatetime())
+            if end is not None:
+                end = pd.Timestamp(end)
+                conditions.append(ds.field(YEAR_PARTITION) <= end.year)
+                if exact:
+                    conditions.append(ds.field(date_column) <= end.to_pydatetime())
+
+        expression = None
+        for condition in conditions:
+            expression = condition if expression is None else expression & condition
+        return expression
+
+    def query(self, table='monitoring', parcelle_ids=None, start=None, end=None, columns=None):
+        """
+        Lit les lignes d'une table pour des parcelles et une période, en ne lisant que les partitions,
+        groupes de lignes et colonnes nécessaires.
+        :param table: Nom de la table ('monitoring', 'weather', 'soil', 'yield'...)
+        :param parcelle_ids: Parcelles demandées (toutes si None)
+        :param start: Début de la période (incluse), sans limite si None
+        :param end: Fin de la période (incluse), sans limite si None
+        :param columns: Colonnes retournées (toutes si None)
+        :return: DataFrame trié par date puis par parcelle
+        """
+        dataset = self.dataset(table)
+        date_column = self.tables[table]['date']
+        data_columns = [name for name in dataset.schema.names if name not in (PARCEL_PARTITION, YEAR_PARTITION)]
+        # Colonnes de tri lues même si elles ne sont pas demandées, retirées ensuite
+        order = [column for column in (date_column, 'parcelle_id') if column in data_columns]
+        read_columns = data_columns if columns is None else list(columns)
+        read_columns = read_columns + [column for column in order if column not in read_columns]
+
+        frame = dataset.to_table(columns=read_columns, filter=self._filter(table, parcelle_ids, start, end)).to_pandas()
+        frame = _compact_dtypes(frame)
+        if order:
+            frame = frame.sort_values(order, kind='mergesort', ignore_index=True)
+        return frame[list(columns) if columns is not None else data_columns]
+
+    def explain(self, table='monitoring', parcelle_ids=None, start=None, end=None, columns=None):
+        """
+        Volume lu par une requête, d'après les métadonnées Parquet (sans lire les données) :
+        fichiers et groupes de lignes retenus après élagage, et octets des colonnes lues.
+        """
+        dataset = self.dataset(table)
+        expression = self._filter(table, parcelle_ids, start, end)
+        wanted = None if columns is None else set(columns) | {self.tables[table]['date']} - {None}
+        files = row_groups = size = 0
+        total_files = total_size = 0
+        for fragment in dataset.get_fragments():
+            total_files += 1
+            metadata = fragment.metadata
+            total_size += sum(_row_group_bytes(metadata.row_group(i)) for i in range(metadata.num_row_groups))
+        for fragment in dataset.get_fragments(filter=expression):
+            kept = fragment.split_by_row_group(expression, schema=dataset.schema)
+            if not kept:
+                continue
+            files += 1
+            metadata = fragment.metadata
+            for piece in kept:
+                for group in piece.row_groups:
+                    row_groups += 1
+                    size += _row_group_bytes(metadata.row_group(group.id), wanted)
+        return {'fichiers': files, 'groupes_lignes': row_groups, 'octets': size,
+                'fichiers_total': total_files, 'octets_total': total_size}
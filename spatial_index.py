@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+Index spatial des parcelles pour les requêtes de survol et de fenêtre d'affichage de la carte.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Longueur d'un degré de latitude, en kilomètres
+KM_PAR_DEGRE = 111.32
+
+
+class ParcelSpatialIndex:
+    def __init__(self, parcelle_ids, latitudes, longitudes, points_per_cell=4):
+        """
+        Construit une grille régulière sur les coordonnées des parcelles.
+        Les points sont projetés sur un plan (projection équirectangulaire, en km) puis triés par cellule,
+        si bien que chaque ligne de la grille occupe une plage contiguë des tableaux triés.
+        :param parcelle_ids: Identifiants des parcelles
+        :param latitudes: Latitudes des parcelles (degrés)
+        :param longitudes: Longitudes des parcelles (degrés)
+        :param points_per_cell: Nombre moyen de parcelles visé par cellule
+        """
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+        valid = ~(np.isnan(latitudes) | np.isnan(longitudes))
+        parcelle_ids = np.asarray(parcelle_ids)[valid]
+        latitudes, longitudes = latitudes[valid], longitudes[valid]
+
+        self._lon_scale = np.cos(np.radians(latitudes.mean())) * KM_PAR_DEGRE if len(latitudes) else KM_PAR_DEGRE
+        x, y = self._project(latitudes, longitudes)
+        self._x0 = x.min() if len(x) else 0.0
+        self._y0 = y.min() if len(y) else 0.0
+        width = max(x.max() - self._x0, 1e-9) if len(x) else 1.0
+        height = max(y.max() - self._y0, 1e-9) if len(y) else 1.0
+
+        # Taille de cellule choisie pour avoir environ points_per_cell parcelles par cellule
+        n_cells = max(len(x) / points_per_cell, 1.0)
+        self.cell_size = max(np.sqrt(width * height / n_cells), 1e-6)
+        self._ncols = int(width // self.cell_size) + 1
+        self._nrows = int(height // self.cell_size) + 1
+
+        cells = self._cell_of(x, y)
+        order = np.argsort(cells, kind='stable')
+        self._ids = parcelle_ids[order]
+        self._lat = latitudes[order]
+        self._lon = longitudes[order]
+        self._x = x[order]
+        self._y = y[order]
+        # Début de chaque cellule dans les tableaux triés (dernière valeur = nombre de points)
+        self._offsets = np.searchsorted(cells[order], np.arange(self._nrows * self._ncols + 1))
+
+    @classmethod
+    def from_frame(cls, positions, **kwargs):
+        """
+        Construit l'index à partir d'un DataFrame indexé par parcelle_id avec les colonnes latitude et longitude.
+        """
+        return cls(positions.index.values, positions['latitude'].values, positions['longitude'].values, **kwargs)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def _project(self, latitudes, longitudes):
+        return np.asarray(longitudes) * self._lon_scale, np.asarray(latitudes) * KM_PAR_DEGRE
+
+    def _cell_of(self, x, y):
+        col = np.clip(((x - self._x0) // self.cell_size).astype(np.int64), 0, self._ncols - 1)
+        row = np.clip(((y - self._y0) // self.cell_size).astype(np.int64), 0, self._nrows - 1)
+        return row * self._ncols + col
+
+    def _candidates(self, xmin, ymin, xmax, ymax):
+        """
+        Positions (dans les tableaux triés) des points des cellules recouvrant le rectangle donné.
+        """
+        col0 = int(np.clip((xmin - self._x0) // self.cell_size, 0, self._ncols - 1))
+        col1 = int(np.clip((xmax - self._x0) // self.cell_size, 0, self._ncols - 1))
+        row0 = int(np.clip((ymin - self._y0) // self.cell_size, 0, self._nrows - 1))
+        row1 = int(np.clip((ymax - self._y0) // self.cell_size, 0, self._nrows - 1))
+        if xmax < self._x0 or ymax < self._y0 or len(self._ids) == 0:
+            return np.empty(0, dtype=np.int64)
+        rows = np.arange(row0, row1 + 1) * self._ncols
+        starts = self._offsets[rows + col0]
+        stops = self._offsets[rows + col1 + 1]
+        if len(rows) == 1:
+            return np.arange(starts[0], stops[0])
+        return np.concatenate([np.arange(start, stop) for start, stop in zip(starts, stops)])
+
+    def within_bounds(self, south, west, north, east):
+        """
+        Parcelles situées dans un rectangle de coordonnées (fenêtre d'affichage de la carte).
+        :return: tableau des parcelle_id
+        """
+        xmin, ymin = self._project(south, west)
+        xmax, ymax = self._project(north, east)
+        candidates = self._candidates(xmin, ymin, xmax, ymax)
+        lat, lon = self._lat[candidates], self._lon[candidates]
+        inside = (lat >= south) & (lat <= north) & (lon >= west) & (lon <= east)
+        return self._ids[candidates[inside]]
+
+    def within_radius(self, latitude, longitude, radius_km):
+        """
+        Parcelles situées à moins de radius_km du point donné, triées par distance croissante.
+        :return: Series des distances (km) indexée par parcelle_id
+        """
+        x, y = self._project(latitude, longitude)
+        candidates = self._candidates(x - radius_km, y - radius_km, x + radius_km, y + radius_km)
+        distances = np.hypot(self._x[candidates] - x, self._y[candidates] - y)
+        inside = distances <= radius_km
+        candidates, distances = candidates[inside], distances[inside]
+        order = np.argsort(distances, kind='stable')
+        return pd.Series(distances[order], index=pd.Index(self._ids[candidates[order]], name='parcelle_id'),
+                         name='distance_km')
+
+    def nearest(self, latitude, longitude, max_distance_km=None):
+        """
+        Parcelle la plus proche du point donné (par exemple sous le curseur).
+        La recherche s'étend anneau par anneau autour de la cellule du point.
+        :param max_distance_km: Distance au-delà de laquelle aucune parcelle n'est retournée
+        :return: (parcelle_id, distance en km), ou (None, None) si aucune parcelle n'est assez proche
+        """
+        if len(self._ids) == 0:
+            return None, None
+        x, y = self._project(latitude, longitude)
+        # Distance de (x, y) à la grille : le premier anneau utile peut être loin si le point est à l'extérieur
+        outside = np.hypot(max(self._x0 - x, 0.0, x - (self._x0 + self._ncols * self.cell_size)),
+                           max(self._y0 - y, 0.0, y - (self._y0 + self._nrows * self.cell_size)))
+        ring = int(outside // self.cell_size)
+        max_ring = max(self._ncols, self._nrows) + ring
+        while ring <= max_ring:
+            half = (ring + 1) * self.cell_size
+            candidates = self._candidates(x - half, y - half, x + half, y + half)
+            if len(candidates):
+                distances = np.hypot(self._x[candidates] - x, self._y[candidates] - y)
+                best = np.argmin(distances)
+                # Un point plus proche peut se trouver hors du carré exploré : vérifier le disque complet
+                if distances[best] > half:
+                    candidates = self._candidates(x - distances[best], y - distances[best],
+                                                  x + distances[best], y + distances[best])
+                    distances = np.hypot(self._x[candidates] - x, self._y[candidates] - y)
+                    best = np.argmin(distances)
+                distance = float(distances[best])
+                if max_distance_km is not None and distance > max_distance_km:
+                    return None, None
+                return self._ids[candidates[best]], distance
+            if max_distance_km is not None and ring * self.cell_size > max_distance_km:
+                return None, None
+            ring += 1
+        return None, None
@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+"""
+Générateur déterministe de jeux de données synthétiques aux formats des quatre fichiers CSV du projet
+(monitoring_cultures.csv, meteo_detaillee.csv, sols.csv, historique_rendements.csv).
+
+Utilisation :
+    python synthetic_data.py --parcelles 10000 --annees 10 --frequence 7D --output data
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+# Noms des fichiers écrits, tels qu'attendus par AgriculturalDataManager.load_data
+FILE_NAMES = {
+    'monitoring': 'monitoring_cultures.csv',
+    'weather': 'meteo_detaillee.csv',
+    'soil': 'sols.csv',
+    'yield': 'historique_rendements.csv',
+}
+
+CULTURES = ('blé', 'maïs', 'orge', 'colza', 'tournesol')
+TYPES_SOL = ('argileux', 'limoneux', 'sableux', 'calcaire')
+CONDITIONS_METEO = ('ensoleillé', 'nuageux', 'pluvieux', 'orageux')
+
+# Emprise géographique des parcelles (France métropolitaine)
+LATITUDES = (43.0, 49.0)
+LONGITUDES = (-1.0, 6.0)
+
+# Flux aléatoires indépendants : chaque date (ou chaque table) a son propre générateur,
+# si bien que le résultat ne dépend pas du découpage en blocs lors de l'écriture
+_FLUX_PARCELLES, _FLUX_RENDEMENTS, _FLUX_SUIVI, _FLUX_METEO = range(4)
+
+# Nombre de lignes de suivi accumulées avant chaque écriture dans le CSV
+ROWS_PER_WRITE = 1_000_000
+
+# Version du générateur, à incrémenter quand les mêmes paramètres produisent d'autres données
+# (2 : historique des rendements jusqu'à la dernière année suivie)
+DATA_VERSION = 2
+
+
+def _rng(seed, stream, *keys):
+    return np.random.default_rng([seed, stream, *keys])
+
+
+def _season(date, phase=0.0):
+    """
+    Cycle saisonnier (sinus annuel, maximum vers la fin du printemps) à une date, décalé de phase jours.
+    """
+    return np.sin(2 * np.pi * (date.dayofyear - 80 - phase) / 365.25)
+
+
+def zone_names(n_zones):
+    return np.array([f"Z{i:02d}" for i in range(n_zones)])
+
+
+def parcel_attributes(n_parcelles, n_zones=20, seed=0):
+    """
+    Tire les caractéristiques fixes des parcelles (position, zone, sol, potentiel de rendement, phénologie).
+    Les zones forment une grille régulière sur l'emprise géographique.
+    :return: DataFrame d'une ligne par parcelle
+    """
+    rng = _rng(seed, _FLUX_PARCELLES)
+    latitude = rng.uniform(*LATITUDES, n_parcelles)
+    longitude = rng.uniform(*LONGITUDES, n_parcelles)
+    n_cols = int(np.ceil(np.sqrt(n_zones)))
+    n_rows = int(np.ceil(n_zones / n_cols))
+    row = np.minimum(((latitude - LATITUDES[0]) / (LATITUDES[1] - LATITUDES[0]) * n_rows).astype(np.int64), n_rows - 1)
+    col = np.minimum(((longitude - LONGITUDES[0]) / (LONGITUDES[1] - LONGITUDES[0]) * n_cols).astype(np.int64), n_cols - 1)
+    return pd.DataFrame({
+        'parcelle_id': np.array([f"P{i:06d}" for i in range(n_parcelles)]),
+        'zone': zone_names(n_zones)[(row * n_cols + col) % n_zones],
+        'latitude': latitude.round(6),
+        'longitude': longitude.round(6),
+        'type_sol': np.array(TYPES_SOL)[rng.integers(0, len(TYPES_SOL), n_parcelles)],
+        'ph': rng.uniform(5.5, 8.0, n_parcelles).round(2),
+        'matiere_organique': rng.gamma(4.0, 0.6, n_parcelles).round(2),
+        'capacite_retention': rng.uniform(80, 220, n_parcelles).round(1),
+        'surface_ha': rng.lognormal(2.5, 0.6, n_parcelles).round(2),
+        'culture': np.array(CULTURES)[rng.integers(0, len(CULTURES), n_parcelles)],
+        # Paramètres cachés utilisés pour générer les séries (non écrits dans sols.csv)
+        '_potentiel': rng.normal(7.0, 1.2, n_parcelles),
+        '_tendance': rng.normal(0.05, 0.08, n_parcelles),
+        '_ndvi_max': rng.uniform(0.6, 0.9, n_parcelles),
+        '_phase': rng.normal(0.0, 12.0, n_parcelles),
+    })
+
+
+def soil_table(parcels):
+    """
+    Table sols.csv : une ligne par parcelle.
+    """
+    return parcels[['parcelle_id', 'zone', 'latitude', 'longitude', 'type_sol', 'ph',
+                    'matiere_organique', 'capacite_retention', 'surface_ha']]
+
+
+def yield_history_table(parcels, n_annees, derniere_annee, seed=0):
+    """
+    Table historique_rendements.csv : une ligne par parcelle et par année (tendance propre à chaque parcelle).
+    """
+    rng = _rng(seed, _FLUX_RENDEMENTS)
+    n_parcelles = len(parcels)
+    annees = np.arange(derniere_annee - n_annees + 1, derniere_annee + 1)
+    offset = np.tile(annees - annees[0], n_parcelles)
+    rendement = (np.repeat(parcels['_potentiel'].values, n_annees)
+                 + np.repeat(parcels['_tendance'].values, n_annees) * offset
+                 + rng.normal(0.0, 0.6, n_parcelles * n_annees))
+    # Rotation des cultures : décalage d'une culture par année à partir de la culture actuelle
+    current = pd.Categorical(parcels['culture'], categories=CULTURES).codes
+    culture = (np.repeat(current, n_annees) - (n_annees - 1 - offset)) % len(CULTURES)
+    return pd.DataFrame({
+        'parcelle_id': np.repeat(parcels['parcelle_id'].values, n_annees),
+        'annee': np.tile(annees, n_parcelles),
+        'culture': np.array(CULTURES)[culture],
+        'rendement': np.clip(rendement, 0.5, None).round(2),
+    })
+
+
+def iter_weather(zones, dates, seed=0):
+    """
+    Génère meteo_detaillee.csv date par date : une ligne par zone et par date.
+    """
+    zones = np.asarray(zones)
+    zone_offset = np.linspace(-2.0, 2.0, len(zones))
+    for k, date in enumerate(pd.DatetimeIndex(dates)):
+        rng = _rng(seed, _FLUX_METEO, k)
+        season = _season(date)
+        precipitation = rng.gamma(0.6, 4.0, len(zones)) * (rng.random(len(zones)) < 0.45)
+        # Sec : ensoleillé ou nuageux ; sinon pluvieux ou orageux selon le cumul
+        condition = np.digitize(precipitation, [0.01, 15.0]) + 1
+        condition[(condition == 1) & (rng.random(len(zones)) < 0.6)] = 0
+        yield pd.DataFrame({
+            'date': date,
+            'zone': zones,
+            'température': (13 + 9 * season + zone_offset + rng.normal(0, 2.5, len(zones))).round(1),
+            'humidite': np.clip(70 - 15 * season + rng.normal(0, 8, len(zones)), 20, 100).round(1),
+            'precipitation': precipitation.round(1),
+            'rayonnement': np.clip(15 + 10 * season + rng.normal(0, 3, len(zones)), 0, None).round(1),
+            'vent': rng.gamma(2.0, 6.0, len(zones)).round(1),
+            'meteo_condition': np.array(CONDITIONS_METEO)[condition],
+        })
+
+
+def iter_monitoring(parcels, dates, seed=0):
+    """
+    Génère monitoring_cultures.csv date par date : une ligne par parcelle et par date (fichier trié par date).
+    Le NDVI suit un cycle saisonnier propre à chaque parcelle ; le stress hydrique suit la saison
+    et diminue avec la capacité de rétention du sol.
+    """
+    ndvi_max = parcels['_ndvi_max'].values
+    phase = parcels['_phase'].values
+    retention = parcels['capacite_retention'].values
+    for k, date in enumerate(pd.DatetimeIndex(dates)):
+        rng = _rng(seed, _FLUX_SUIVI, k)
+        n = len(parcels)
+        season = _season(date, phase)
+        ndvi = np.clip(0.2 + (ndvi_max - 0.2) * (season + 1) / 2 + rng.normal(0, 0.04, n), 0.0, 1.0)
+        stress = np.clip(25 + 15 * season - 0.05 * retention + rng.normal(0, 4, n), 0, None)
+        yield pd.DataFrame({
+            'date': date,
+            'parcelle_id': parcels['parcelle_id'].values,
+            'zone': parcels['zone'].values,
+            'culture': parcels['culture'].values,
+            'ndvi': ndvi.round(4),
+            'lai': np.clip(6 * ndvi - 0.5 + rng.normal(0, 0.2, n), 0, None).round(3),
+            'stress_hydrique': stress.round(2),
+        })
+
+
+def sampling_dates(debut, jours, frequence):
+    """
+    Dates d'échantillonnage sur la période [debut, debut + jours[.
+    """
+    debut = pd.Timestamp(debut)
+    return pd.date_range(debut, debut + pd.Timedelta(days=jours - 1), freq=frequence)
+
+
+def last_monitored_year(debut, jours):
+    """
+    Dernière année de la période de suivi : l'historique des rendements s'arrête à cette saison.
+    """
+    return (pd.Timestamp(debut) + pd.Timedelta(days=jours - 1)).year
+
+
+def generate_dataset(n_parcelles, n_annees=10, frequence='7D', jours=365, debut='2023-01-01',
+                     n_zones=20, frequence_meteo='D', seed=0):
+    """
+    Génère les quatre tables en mémoire. Les mêmes paramètres produisent toujours les mêmes données.
+    :param n_parcelles: Nombre de parcelles
+    :param n_annees: Nombre d'années de l'historique des rendements (jusqu'à la dernière année suivie,
+                     pour que les saisons suivies aient un rendement connu)
+    :param frequence: Fréquence des observations de suivi (ex. 'D', '7D')
+    :param jours: Durée de la période de suivi, en jours
+    :param debut: Première date de suivi
+    :param n_zones: Nombre de zones météo
+    :param frequence_meteo: Fréquence des mesures météo
+    :param seed: Graine du générateur
+    :return: dictionnaire {'monitoring', 'weather', 'soil', 'yield'} de DataFrames
+    """
+    parcels = parcel_attributes(n_parcelles, n_zones, seed)
+    monitoring_dates = sampling_dates(debut, jours, frequence)
+    weather_dates = sampling_dates(debut, jours, frequence_meteo)
+    return {
+        'monitoring': pd.concat(iter_monitoring(parcels, monitoring_dates, seed), ignore_index=True),
+        'weather': pd.concat(iter_weather(zone_names(n_zones), weather_dates, seed), ignore_index=True),
+        'soil': soil_table(parcels).reset_index(drop=True),
+        'yield': yield_history_table(parcels, n_annees, last_monitored_year(debut, jours), seed),
+    }
+
+
+def _write_stream(frames, path, rows_per_write=ROWS_PER_WRITE):
+    """
+    Écrit une suite de DataFrames dans un même CSV, par paquets d'environ rows_per_write lignes.
+    :return: nombre de lignes écrites
+    """
+    rows, pending, pending_rows = 0, [], 0
+    header = True
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        for frame in frames:
+            pending.append(frame)
+            pending_rows += len(frame)
+            if pending_rows >= rows_per_write:
+                pd.concat(pending).to_csv(f, index=False, header=header, date_format='%Y-%m-%d')
+                rows, pending, pending_rows, header = rows + pending_rows, [], 0, False
+        if pending or header:
+            frame = pd.concat(pending) if pending else pd.DataFrame()
+            frame.to_csv(f, index=False, header=header, date_format='%Y-%m-%d')
+            rows += pending_rows
+    return rows
+
+
+def write_dataset(output_dir, n_parcelles, n_annees=10, frequence='7D', jours=365, debut='2023-01-01',
+                  n_zones=20, frequence_meteo='D', seed=0):
+    """
+    Écrit les quatre fichiers CSV dans output_dir sans jamais garder tout le suivi en mémoire
+    (génération et écriture date par date), ainsi qu'un fichier parametres.json décrivant le jeu de données.
+    Mêmes paramètres que generate_dataset.
+    :return: dictionnaire des paramètres et du nombre de lignes de chaque fichier
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    parameters = {'version': DATA_VERSION, 'parcelles': n_parcelles, 'annees': n_annees, 'frequence': frequence, 'jours': jours,
+                  'debut': str(pd.Timestamp(debut).date()), 'zones': n_zones,
+                  'frequence_meteo': frequence_meteo, 'seed': seed}
+    parcels = parcel_attributes(n_parcelles, n_zones, seed)
+    paths = {name: os.path.join(output_dir, file_name) for name, file_name in FILE_NAMES.items()}
+
+    rows = {
+        'soil': _write_stream([soil_table(parcels)], paths['soil']),
+        'yield': _write_stream([yield_history_table(parcels, n_annees, last_monitored_year(debut, jours), seed)],
+                               paths['yield']),
+        'weather': _write_stream(iter_weather(zone_names(n_zones), sampling_dates(debut, jours, frequence_meteo), seed),
+                                 paths['weather']),
+        'monitoring': _write_stream(iter_monitoring(parcels, sampling_dates(debut, jours, frequence), seed),
+                                    paths['monitoring']),
+    }
+    description = {'parametres': parameters, 'lignes': rows}
+    # Écrit en dernier : sa présence indique un jeu de données complet
+    with open(os.path.join(output_dir, 'parametres.json'), 'w', encoding='utf-8') as f:
+        json.dump(description, f, indent=2, ensure_ascii=False)
+    return description
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Génère un jeu de données agricoles synthétique (4 fichiers CSV)")
+    parser.add_argument('--parcelles', type=int, default=1000, help="Nombre de parcelles")
+    parser.add_argument('--annees', type=int, default=10, help="Années d'historique des rendements")
+    parser.add_argument('--frequence', default='7D', help="Fréquence des observations de suivi (ex. D, 7D)")
+    parser.add_argument('--jours', type=int, default=365, help="Durée de la période de suivi, en jours")
+    parser.add_argument('--debut', default='2023-01-01', help="Première date de suivi")
+    parser.add_argument('--zones', type=int, default=20, help="Nombre de zones météo")
+    parser.add_argument('--frequence-meteo', default='D', help="Fréquence des mesures météo")
+    parser.add_argument('--seed', type=int, default=0, help="Graine du générateur")
+    parser.add_argument('--output', default='data', help="Dossier de sortie")
+    args = parser.parse_args()
+
+    description = write_dataset(args.output, args.parcelles, args.annees, args.frequence, args.jours,
+                                args.debut, args.zones, args.frequence_meteo, args.seed)
+    for name, rows in description['lignes'].items():
+        print(f"{FILE_NAMES[name]:<28}: {rows} lignes")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+"""
+Prédiction des rendements : régression ridge (numpy) entraînée sur les caractéristiques de prepare_features,
+inférence groupée de toutes les observations par produits matriciels, et stockage des modèles ajustés sur disque
+sous l'empreinte de leurs données d'entraînement (des données inchangées ne déclenchent jamais de réentraînement).
+"""
+
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+from data_manager import _years
+
+# Caractéristiques numériques utilisées lorsqu'elles sont présentes (les agrégats de l'historique des rendements
+# calculés par prepare_features incluent la saison à prédire : ils sont remplacés par HISTORY_FEATURES).
+# Les seuils NDVI et ce qui en dérive (ndvi_anomalie, ndvi_sous_seuil_glissant) sont exclus : ajustés sur tout
+# le suivi, saisons à prédire comprises, et non réajustés par append_observations
+NUMERIC_FEATURES = ('ndvi', 'lai', 'stress_hydrique', 'température', 'humidite', 'precipitation', 'rayonnement',
+                    'vent', 'ph', 'matiere_organique', 'capacite_retention', 'surface_ha',
+                    'ndvi_moyenne_glissante', 'ndvi_ecart_type_glissant', 'ndvi_zscore')
+
+# Caractéristiques catégorielles encodées en indicatrices (modalités vues à l'entraînement)
+CATEGORICAL_FEATURES = ('culture', 'type_sol')
+
+# Historique des rendements strictement antérieur à la saison de chaque observation
+HISTORY_FEATURES = ('rendement_precedent', 'rendement_moyen_precedent', 'annees_precedentes')
+
+# Position dans la saison (jour de l'année, encodage circulaire)
+SEASON_FEATURES = ('saison_sin', 'saison_cos')
+
+# Version de la construction des caractéristiques, incluse dans l'empreinte des modèles stockés
+MODEL_VERSION = 2
+
+# Nombre de lignes traitées par bloc (entraînement et inférence) : la mémoire ne dépend pas du volume total
+CHUNK_ROWS = 500_000
+
+
+def _season_years(frame):
+    dates = frame['date'] if 'date' in frame.columns else frame.index.to_series()
+    return pd.DatetimeIndex(dates).year.values.astype(np.int64)
+
+
+def yield_states(yield_history):
+    """
+    État de l'historique des rendements après chaque saison connue d'une parcelle : dernier rendement,
+    moyenne et nombre de saisons jusqu'à celle-ci incluse (une passe groupée).
+    :return: DataFrame (parcelle_id, annee, rendement, rendement_precedent, rendement_moyen_precedent,
+             annees_precedentes), trié par année
+    """
+    history = pd.DataFrame({
+        'parcelle_id': yield_history['parcelle_id'].astype(str).values,
+        'annee': _years(yield_history['annee']).values,
+        'rendement': yield_history['rendement'].astype(np.float64).values,
+    }).dropna()
+    history['annee'] = history['annee'].astype(np.int64)
+    history = history.groupby(['parcelle_id', 'annee'], sort=True)['rendement'].mean().reset_index()
+    grouped = history.groupby('parcelle_id', sort=False)['rendement']
+    count = grouped.cumcount() + 1
+    history['rendement_precedent'] = history['rendement']
+    history['rendement_moyen_precedent'] = grouped.cumsum() / count
+    history['annees_precedentes'] = count.astype(np.float64)
+    return history.sort_values('annee', kind='mergesort', ignore_index=True)
+
+
+def _season_keys(frame):
+    """
+    Couples (parcelle, année) distincts des observations et indice du couple de chaque ligne.
+    """
+    codes, uniques = pd.factorize(frame['parcelle_id'])
+    years = _season_years(frame)
+    first_year = years.min() if len(years) else 0
+    pairs, inverse = np.unique(codes.astype(np.int64) * 10_000 + (years - first_year), return_inverse=True)
+    keys = pd.DataFrame({
+        'parcelle_id': pd.Index(uniques).astype(str)[pairs // 10_000],
+        'annee': pairs % 10_000 + first_year,
+    })
+    return keys, inverse.ravel()
+
+
+def season_history(frame, states):
+    """
+    Caractéristiques HISTORY_FEATURES et rendement de la saison pour chaque observation : seules les saisons
+    antérieures à celle de l'observation sont utilisées (jointure temporelle par parcelle sur les années).
+    :param frame: Observations (date, parcelle_id)
+    :param states: Table calculée par yield_states
+    :return: (DataFrame des HISTORY_FEATURES, rendement de la saison ou NaN), alignés sur les lignes de frame
+    """
+    keys, inverse = _season_keys(frame)
+    keys['_couple'] = np.arange(len(keys))
+    ordered = keys.sort_values('annee', kind='mergesort')
+    previous = pd.merge_asof(ordered, states.drop(columns='rendement'), on='annee', by='parcelle_id',
+                             allow_exact_matches=False).set_index('_couple').reindex(keys['_couple'])
+    target = keys.merge(states[['parcelle_id', 'annee', 'rendement']], on=['parcelle_id', 'annee'], how='left')
+    history = pd.DataFrame({name: previous[name].to_numpy(np.float64)[inverse] for name in HISTORY_FEATURES})
+    return history, target['rendement'].to_numpy(np.float64)[inverse]
+
+
+def _category_codes(values, categories):
+    """
+    Position de chaque valeur dans categories (-1 si absente) ; les colonnes catégorielles ne convertissent
+    que leurs modalités.
+    """
+    categories = pd.Index(categories)
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        mapping = np.append(categories.get_indexer(values.cat.categories.astype(str)), -1)
+        return mapping[values.cat.codes.to_numpy()]
+    return categories.get_indexer(values.astype(str))
+
+
+class YieldModel:
+    def __init__(self, alpha=1.0):
+        """
+        Régression ridge du rendement de la saison à partir de chaque observation, sur des caractéristiques
+        standardisées (valeurs manquantes remplacées par la moyenne d'entraînement).
+        :param alpha: Pénalité ridge
+        """
+        self.alpha = alpha
+        self.columns = None
+        self.categories = {}
+        self.means = None
+        self.scales = None
+        self.coef = None
+        self.intercept = 0.0
+        self.metrics = {}
+        self.key = None
+
+    @property
+    def feature_names(self):
+        return list(self.columns) + [f"{column}={value}" for column, values in self.categories.items()
+                                     for value in values] + list(SEASON_FEATURES) + list(HISTORY_FEATURES)
+
+    def _select_features(self, features):
+        self.columns = [column for column in NUMERIC_FEATURES
+                        if column in features.columns and features[column].notna().any()]
+        self.categories = {column: sorted(features[column].dropna().astype(str).unique())
+                           for column in CATEGORICAL_FEATURES if column in features.columns}
+
+    def _design(self, frame, history):
+        """
+        Matrice brute (float64, NaN pour les valeurs manquantes) d'un bloc d'observations,
+        remplie colonne par colonne (ordre Fortran).
+        """
+        X = np.empty((len(frame), len(self.feature_names)), order='F')
+        position = 0
+        for column in self.columns:
+            X[:, position] = frame[column].to_numpy(np.float64, na_value=np.nan) if column in frame.columns else np.nan
+            position += 1
+        for column, values in self.categories.items():
+            codes = _category_codes(frame[column], values) if column in frame.columns else np.full(len(frame), -1)
+            for k in range(len(values)):
+                X[:, position] = codes == k
+                position += 1
+        dates = frame['date'] if 'date' in frame.columns else frame.index.to_series()
+        angle = 2 * np.pi * (pd.DatetimeIndex(dates).dayofyear.values - 1) / 365.25
+        X[:, position], X[:, position + 1] = np.sin(angle), np.cos(angle)
+        for k, name in enumerate(HISTORY_FEATURES):
+            X[:, position + 2 + k] = history[name].to_numpy(np.float64)
+        return X
+
+    def _standardized(self, X):
+        X -= self.means
+        X /= self.scales
+        X[np.isnan(X)] = 0.0  # Valeur manquante : moyenne d'entraînement
+        return X
+
+    def fit(self, features, yield_history):
+        """
+        Entraîne le modèle sur les observations dont la saison a un rendement connu, en deux passes par blocs
+        (moyennes et écarts-types, puis équations normales accumulées) : la matrice complète n'est jamais formée.
+        :param features: Caractéristiques de prepare_features
+        :param yield_history: Historique des rendements (parcelle_id, annee, rendement)
+        :return: self
+        """
+        history, target = season_history(features, yield_states(yield_history))
+        rows = np.flatnonzero(~np.isnan(target))
+        if not len(rows):
+            raise ValueError("Aucune saison suivie n'a de rendement connu : impossible d'entraîner le modèle.")
+        self._select_features(features.iloc[rows])
+        chunks = [rows[start:start + CHUNK_ROWS] for start in range(0, len(rows), CHUNK_ROWS)]
+
+        n_features = len(self.feature_names)
+        sums, squares, counts = np.zeros(n_features), np.zeros(n_features), np.zeros(n_features)
+        for chunk in chunks:
+            X = self._design(features.iloc[chunk], history.iloc[chunk])
+            valid = ~np.isnan(X)
+            sums += np.where(valid, X, 0.0).sum(axis=0)
+            squares += np.where(valid, X ** 2, 0.0).sum(axis=0)
+            counts += valid.sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.means = np.where(counts > 0, sums / counts, 0.0)
+            variance = np.where(counts > 0, squares / counts - self.means ** 2, 0.0)
+        self.scales = np.where(variance > 1e-12, np.sqrt(np.maximum(variance, 0.0)), 1.0)
+
+        y = target[rows]
+        self.intercept = float(y.mean())
+        gram, moments = np.zeros((n_features, n_features)), np.zeros(n_features)
+        offset = 0
+        for chunk in chunks:
+            X = self._standardized(self._design(features.iloc[chunk], history.iloc[chunk]))
+            gram += X.T @ X
+            moments += X.T @ (y[offset:offset + len(chunk)] - self.intercept)
+            offset += len(chunk)
+        self.coef = np.linalg.solve(gram + self.alpha * np.eye(n_features), moments)
+
+        # Erreur sur les données d'entraînement, déduite des équations normales (sans nouvelle passe sur les données)
+        centered = y - self.intercept
+        sse = centered @ centered - 2 * self.coef @ moments + self.coef @ gram @ self.coef
+        self.metrics = {
+            'lignes': int(len(rows)),
+            'saisons': int(len(_season_keys(features.iloc[rows])[0])),
+            'rmse': float(np.sqrt(max(sse, 0.0) / len(rows))),
+            'r2': float(1 - sse / (centered @ centered)) if centered @ centered > 0 else 0.0,
+        }
+        return self
+
+    def predict(self, features, yield_history):
+        """
+        Rendement prédit pour chaque observation, par blocs de CHUNK_ROWS lignes (un produit matriciel par bloc).
+        :param features: Caractéristiques (mêmes colonnes qu'à l'entraînement ; les colonnes absentes
+                         sont remplacées par la moyenne d'entraînement)
+        :param yield_history: Historique des rendements, pour les caractéristiques des saisons antérieures
+        :return: tableau numpy aligné sur les lignes de features
+        """
+        history, _ = season_history(features, yield_states(yield_history))
+        predictions = np.empty(len(features))
+        for start in range(0, len(features), CHUNK_ROWS):
+            chunk = slice(start, start + CHUNK_ROWS)
+            X = self._standardized(self._design(features.iloc[chunk], history.iloc[chunk]))
+            predictions[chunk] = X @ self.coef + self.intercept
+        return predictions
+
+    def to_arrays(self):
+        """
+        Paramètres du modèle sous forme de tableaux numpy (sans pickle).
+        """
+        arrays = {
+            'alpha': np.array(self.alpha), 'intercept': np.array(self.intercept), 'key': np.array(self.key or ''),
+            'columns': np.array(self.columns, dtype=str), 'means': self.means, 'scales': self.scales,
+            'coef': self.coef, 'categorical': np.array(list(self.categories), dtype=str),
+            'metric_names': np.array(list(self.metrics), dtype=str),
+            'metric_values': np.array(list(self.metrics.values()), dtype=np.float64),
+        }
+        for column, values in self.categories.items():
+            arrays[f'categories_{column}'] = np.array(values, dtype=str)
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        model = cls(alpha=float(arrays['alpha']))
+        model.intercept = float(arrays['intercept'])
+        model.key = str(arrays['key']) or None
+        model.columns = [str(column) for column in arrays['columns']]
+        model.categories = {str(column): [str(value) for value in arrays[f'categories_{column}']]
+                            for column in arrays['categorical']}
+        model.means, model.scales, model.coef = arrays['means'], arrays['scales'], arrays['coef']
+        model.metrics = {str(name): float(value) for name, value in zip(arrays['metric_names'], arrays['metric_values'])}
+        return model
+
+
+def training_key(features, yield_history, alpha):
+    """
+    Empreinte SHA-256 du contenu des données d'entraînement (colonnes utilisées par le modèle) et des paramètres.
+    """
+    digest = hashlib.sha256(f"{MODEL_VERSION}|{alpha!r}".encode())
+    columns = ['date', 'parcelle_id'] + [column for column in NUMERIC_FEATURES + CATEGORICAL_FEATURES
+                                         if column in features.columns]
+    frame = features.reset_index() if 'date' not in features.columns else features
+    for name, data in ((f'caracteristiques.{column}', frame[column]) for column in columns):
+        digest.update(name.encode())
+        digest.update(pd.util.hash_pandas_object(data, index=False).values.tobytes())
+    history = yield_history[['parcelle_id', 'annee', 'rendement']]
+    digest.update(pd.util.hash_pandas_object(history, index=False).values.tobytes())
+    return digest.hexdigest()
+
+
+class ModelStore:
+    def __init__(self, root):
+        """
+        Modèles ajustés enregistrés sur disque sous l'empreinte de leurs données d'entraînement (<empreinte>.npz).
+        :param root: Dossier du stockage
+        """
+        self.root = root
+
+    def path(self, key):
+        return os.path.join(self.root, f"{key}.npz")
+
+    def load(self, key):
+        """
+        Modèle enregistré sous cette empreinte, ou None.
+        """
+        path = self.path(key)
+        if not os.path.exists(path):
+            return None
+        with np.load(path, allow_pickle=False) as arrays:
+            return YieldModel.from_arrays(arrays)
+
+    def save(self, model):
+        """
+        Enregistre un modèle sous son empreinte (écriture dans un fichier temporaire puis remplacement).
+        """
+        os.makedirs(self.root, exist_ok=True)
+        path = self.path(model.key)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **model.to_arrays())
+        os.replace(tmp_path, path)
+        return path